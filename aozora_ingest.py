@@ -0,0 +1,261 @@
+# ============================================================
+# aozora_ingest.py - 青空文庫のローカルミラーから本文の文字数を数える
+# ============================================================
+#
+# 使い方:
+#   python aozora_ingest.py ~/aozorabunko              # ミラーの cards/ 以下を走査
+#   python aozora_ingest.py ~/aozorabunko --jobs 4
+#   python aozora_ingest.py ~/aozorabunko --force      # 手入力の長さ区分も上書き
+#   python aozora_ingest.py ~/aozorabunko --no-dedup   # 新しい作品の重複チェックを省く
+#
+# ミラーは aozorabunko リポジトリと同じ構成（cards/<人物ID>/files/<作品ID>_*.zip|.txt）
+# を想定する。summaries.source_url（…/cards/<人物ID>/card<作品ID>.html）と
+# (人物ID, 作品ID) で突き合わせ、該当する作品のファイルだけをプロセスプールで読む。
+# 各ファイルは zip の中身を含めて Shift_JIS（cp932）のまま行単位でストリーム復号し、
+# ルビ・注記・前書きの凡例・末尾の底本情報を除いた本文の文字数（空白・改行を除く）を数える。
+# 結果は char_count 列に保存し、長さ区分（掌編/短編/中編/長編）は length 列が空の行と、
+# 前回の文字数から自動で付けた区分のままの行にだけ入れる（手入力の区分は --force のときだけ上書き）。
+# 前回の重複チェック以降に追加された作品（change_log の insert）は、最後に dedup.py で既存作品と照合して
+# 重複候補を表示する。どこまで照合したかは change_log のハイウォーターマーク（DEDUP_TARGET）に覚えておく。
+
+import argparse
+import io
+import os
+import re
+import sqlite3
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import change_log
+import migrate_database
+import summary_codec
+
+try:
+    import dedup
+except ImportError:
+    # 重複チェックには NumPy が要る
+    dedup = None
+
+DB_PATH = "summaries.db"
+# 重複チェックが処理済みの change_log.id を覚えておく build_targets の名前
+DEDUP_TARGET = "dedup"
+
+# (上限文字数, 区分)。400字詰め原稿用紙で 10枚 / 100枚 / 300枚 が目安
+LENGTH_CLASSES = [(4000, "掌編"), (40000, "短編"), (120000, "中編")]
+LONGEST_CLASS = "長編"
+# UPDATE をまとめてコミットする件数
+BATCH_SIZE = 500
+
+_SOURCE_URL_RE = re.compile(r'cards/(\d+)/card(\d+)\.html')
+_FILE_RE = re.compile(r'cards/(\d+)/files/(\d+)_[^/]*\.(zip|txt)$')
+
+# ルビ《…》・ルビの親文字の区切り｜・入力者注［＃…］は数えない
+_MARKUP_RE = re.compile(r'《[^》]*》|［＃[^］]*］|｜')
+_RULE_RE = re.compile(r'^-{10,}\s*$')
+_FOOTER_PREFIX = "底本："
+
+
+def length_class(char_count):
+    for limit, label in LENGTH_CLASSES:
+        if char_count < limit:
+            return label
+    return LONGEST_CLASS
+
+
+def count_body_chars(lines):
+    """青空文庫形式のテキスト（行のイテレータ）から本文の文字数を数える
+
+    冒頭は 題名・著者名 → 空行 → [記号の凡例を ----- で挟んだブロック] → 本文、
+    末尾は「底本：」から始まる書誌情報、という構成を前提にする。
+    行を読み進めながら数えるので、ファイル全体をメモリに載せない。
+    """
+    state = "title"
+    count = 0
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if state == "title":
+            if not line.strip():
+                state = "after_title"
+            continue
+        if state == "after_title":
+            if not line.strip():
+                continue
+            if _RULE_RE.match(line):
+                state = "legend"
+                continue
+            state = "body"
+        elif state == "legend":
+            if _RULE_RE.match(line):
+                state = "body"
+            continue
+        if line.startswith(_FOOTER_PREFIX):
+            break
+        count += len("".join(_MARKUP_RE.sub("", line).split()))
+    return count
+
+
+def _text_lines(binary):
+    return io.TextIOWrapper(binary, encoding="cp932", errors="replace", newline=None)
+
+
+def scan_file(path):
+    """1ファイル（zip なら中の .txt）を読んで (パス, 文字数) を返す"""
+    try:
+        if path.endswith(".zip"):
+            with zipfile.ZipFile(path) as zf:
+                members = [n for n in zf.namelist() if n.lower().endswith(".txt")]
+                if not members:
+                    return path, None
+                with zf.open(members[0]) as f:
+                    return path, count_body_chars(_text_lines(f))
+        with open(path, "rb") as f:
+            return path, count_body_chars(_text_lines(f))
+    except (OSError, zipfile.BadZipFile) as e:
+        return path, f"{type(e).__name__}: {e}"
+
+
+def list_card_files(root):
+    """ミラー内のテキストを {(人物ID, 作品ID): ファイルパス} で返す（同じ作品は zip を優先）"""
+    files = {}
+    cards_dir = os.path.join(root, "cards")
+    for dirpath, _, filenames in os.walk(cards_dir):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            m = _FILE_RE.search(path.replace(os.sep, "/"))
+            if not m:
+                continue
+            key = (int(m.group(1)), int(m.group(2)))
+            # zip > txt、同じ種類ならファイル名順で先のもの
+            rank = (m.group(3) != "zip", path)
+            if key not in files or rank < files[key][0]:
+                files[key] = (rank, path)
+    return {key: path for key, (_, path) in files.items()}
+
+
+def parse_source_url(source_url):
+    """図書カードの URL から (人物ID, 作品ID) を返す。読めなければ None"""
+    m = _SOURCE_URL_RE.search(source_url or "")
+    return (int(m.group(1)), int(m.group(2))) if m else None
+
+
+def load_targets(conn):
+    """source_url を解析して {(人物ID, 作品ID): [summary_id, ...]} と、解析できない行数を返す"""
+    targets = {}
+    unparsed = 0
+    for summary_id, source_url in conn.execute("SELECT id, source_url FROM summaries"):
+        key = parse_source_url(source_url)
+        if key:
+            targets.setdefault(key, []).append(summary_id)
+        else:
+            unparsed += 1
+    return targets, unparsed
+
+
+def report_duplicates(conn, db_path, until):
+    """前回の重複チェック以降（until まで）に追加された作品を既存作品と照合して重複候補を表示し、候補のあった作品数を返す"""
+    if dedup is None:
+        print("ℹ️ NumPy がないため重複チェックを省略しました（python dedup.py update で確認できます）")
+        return 0
+    hwm = change_log.get_high_water_mark(conn, DEDUP_TARGET)
+    if hwm is None:
+        # 初回は起点を記録するだけにする（既存作品どうしの重複はクラスタ一覧で見る）
+        change_log.set_high_water_mark(db_path, DEDUP_TARGET, until)
+        print("ℹ️ 重複チェックの起点を記録しました（既存の重複は python dedup.py report で確認できます）")
+        return 0
+    ids = change_log.inserted_ids(conn, hwm, until)
+    found = dedup.check_works(conn, ids) if ids else {}
+    change_log.set_high_water_mark(db_path, DEDUP_TARGET, until)
+    if not ids:
+        return 0
+    for summary_id, matches in sorted(found.items()):
+        dedup.print_matches(conn, summary_id, matches)
+    if found:
+        print(f"⚠️ 重複の可能性がある新しい作品: {len(found)}件（python dedup.py report で一覧できます）")
+    else:
+        print(f"✅ 新しい作品 {len(ids)}件に重複候補なし")
+    return len(found)
+
+
+def ingest(root, db_path=DB_PATH, jobs=None, force=False, check_duplicates=True):
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    migrate_database.apply_migrations(conn)
+
+    targets, unparsed = load_targets(conn)
+    # この時点までに追加された作品を重複チェックにかける（以降の追加は次回に回る）
+    latest = change_log.latest_change_id(conn)
+    files = list_card_files(root)
+    jobs_list = [(files[key], ids) for key, ids in targets.items() if key in files]
+    missing = sum(len(ids) for key, ids in targets.items() if key not in files)
+    print(f"📂 ミラー内 {len(files)}作品 / DB {sum(len(v) for v in targets.values())}作品が照合対象"
+          f" → {len(jobs_list)}ファイルを読み込み")
+
+    if force:
+        update_sql = ("UPDATE summaries SET char_count = ?, length = ?, updated_at = CURRENT_TIMESTAMP "
+                      "WHERE id = ? AND (char_count IS NOT ? OR length IS NOT ?)")
+    else:
+        # 区分が前回の文字数から導いたものと同じなら自動で付けたものとみなし、文字数に合わせて付け直す
+        conn.create_function("length_class", 1, lambda n: None if n is None else length_class(n),
+                             deterministic=True)
+        update_sql = ("UPDATE summaries SET char_count = ?, length = CASE "
+                      "WHEN NULLIF(length, '') IS NULL OR length = length_class(char_count) THEN ? "
+                      "ELSE length END, updated_at = CURRENT_TIMESTAMP "
+                      "WHERE id = ? AND (char_count IS NOT ? OR NULLIF(length, '') IS NULL)")
+
+    ids_by_path = dict(jobs_list)
+    pending = []
+    updated = 0
+    errors = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        chunksize = max(1, len(jobs_list) // ((jobs or os.cpu_count() or 1) * 8))
+        for path, result in pool.map(scan_file, list(ids_by_path), chunksize=chunksize):
+            if not isinstance(result, int):
+                errors.append((path, result or "テキストなし"))
+                continue
+            label = length_class(result)
+            for summary_id in ids_by_path[path]:
+                if force:
+                    pending.append((result, label, summary_id, result, label))
+                else:
+                    pending.append((result, label, summary_id, result))
+            if len(pending) >= BATCH_SIZE:
+                with conn:
+                    updated += conn.executemany(update_sql, pending).rowcount
+                pending = []
+    if pending:
+        with conn:
+            updated += conn.executemany(update_sql, pending).rowcount
+
+    print(f"✅ {updated}件を更新 ({time.perf_counter() - started:.1f}秒)")
+    compressed = summary_codec.compress_new_rows(conn)
+    if compressed:
+        print(f"🗜️ 平文の要約を圧縮: {compressed}件")
+    if missing:
+        print(f"⚠️ ミラーにテキストがない作品: {missing}件")
+    if unparsed:
+        print(f"⚠️ source_url から作品IDを読めない行: {unparsed}件")
+    for path, reason in errors[:20]:
+        print(f"❌ {path}: {reason}")
+    if check_duplicates and latest is not None:
+        report_duplicates(conn, db_path, latest)
+    conn.close()
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="青空文庫のテキストから文字数・長さ区分を計算")
+    parser.add_argument("root", help="青空文庫ミラー（cards/ を含むディレクトリ）")
+    parser.add_argument("--jobs", type=int, default=None, help="並列プロセス数（既定: CPU数）")
+    parser.add_argument("--force", action="store_true", help="手入力済みの長さ区分も上書きする")
+    parser.add_argument("--no-dedup", action="store_true", help="新しく取り込んだ作品の重複チェックを省く")
+    args = parser.parse_args()
+
+    if not os.path.isdir(os.path.join(args.root, "cards")):
+        print(f"❌ {args.root}/cards が見つかりません")
+        return
+    ingest(args.root, jobs=args.jobs, force=args.force, check_duplicates=not args.no_dedup)
+
+
+if __name__ == "__main__":
+    main()
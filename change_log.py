@@ -0,0 +1,151 @@
+# ============================================================
+# change_log.py - 変更履歴（change_log テーブル）の読み出しと圧縮
+# ============================================================
+#
+# 使い方:
+#   python change_log.py status        # 未処理の変更件数を表示
+#   python change_log.py compact       # 処理済みの古い履歴を削除
+#
+# summaries / summary_tags / related_works_state へのトリガーが change_log に追記する
+# （migrate_database.py の v11）。生成側は処理済みの最大 ID（ハイウォーターマーク）を
+# 出力先（ディレクトリ・--pack のアーカイブ）ごとに build_targets に覚えておき、
+# 次回はそれより新しい行だけを読むので、何を作り直すかの判断は変更件数に比例する手間で済む。
+# 出力先ごとに持つので、ディレクトリへのビルドと --pack のビルドを交互に行っても互いの変更を取りこぼさない。
+
+import argparse
+import sqlite3
+
+DB_PATH = "summaries.db"
+# 処理済みでもこの日数より新しい履歴は調査用に残す
+RETENTION_DAYS = 7
+
+
+def get_high_water_mark(conn, target):
+    """target（出力先）で処理済みの change_log.id を返す。一度も全体ビルドしていなければ None"""
+    try:
+        row = conn.execute("SELECT change_id FROM build_targets WHERE target = ?", (target,)).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+def latest_change_id(conn):
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+    except sqlite3.Error:
+        return None
+
+
+def set_high_water_mark(db_path, target, change_id):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("""
+            INSERT INTO build_targets (target, change_id) VALUES (?, ?)
+            ON CONFLICT(target) DO UPDATE SET change_id = excluded.change_id
+        """, (target, change_id))
+    conn.close()
+
+
+def pending_ids(db_path, target):
+    """target のハイウォーターマークより後に変更された作品 ID を返す。未ビルド・マイグレーション前なら None"""
+    conn = sqlite3.connect(db_path)
+    try:
+        hwm = get_high_water_mark(conn, target)
+        if hwm is None:
+            return None
+        return {row[0] for row in conn.execute("SELECT DISTINCT summary_id FROM change_log WHERE id > ?", (hwm,))}
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def read_changes(conn, after, until):
+    """after < id <= until の変更をまとめて返す
+
+    ids:        ページを作り直す作品 ID（削除された作品を除く）
+    deleted:    削除された作品 ID
+    authors:    著者ページを作り直す著者（変更前の著者名も含む）
+    old_titles: 変更前・削除前のタイトル（古いページを消すかどうかの判断に使う）
+    """
+    changes = {'ids': set(), 'deleted': set(), 'authors': set(), 'old_titles': set(), 'count': 0}
+    for summary_id, op, title, author, old_title, old_author in conn.execute("""
+        SELECT summary_id, op, title, author, old_title, old_author FROM change_log
+        WHERE id > ? AND id <= ? ORDER BY id
+    """, (after, until)):
+        changes['count'] += 1
+        if op == 'delete':
+            changes['ids'].discard(summary_id)
+            changes['deleted'].add(summary_id)
+        else:
+            changes['ids'].add(summary_id)
+            changes['deleted'].discard(summary_id)
+        for name in (author, old_author):
+            if name:
+                changes['authors'].add(name)
+        if old_title and old_title != title:
+            changes['old_titles'].add(old_title)
+    return changes
+
+
+def inserted_ids(conn, after, until):
+    """after < id <= until に追加され、いまも残っている作品 ID を返す"""
+    return {row[0] for row in conn.execute("""
+        SELECT DISTINCT c.summary_id FROM change_log c
+        JOIN summaries s ON s.id = c.summary_id
+        WHERE c.id > ? AND c.id <= ? AND c.op = 'insert'
+    """, (after, until))}
+
+
+def compact(db_path=DB_PATH, retention_days=RETENTION_DAYS):
+    """すべての出力先で処理済みで、保存期間を過ぎた履歴を削除し、削除件数を返す"""
+    conn = sqlite3.connect(db_path)
+    try:
+        hwm = conn.execute("SELECT MIN(change_id) FROM build_targets").fetchone()[0]
+    except sqlite3.Error:
+        hwm = None
+    if hwm is None:
+        conn.close()
+        return 0
+    with conn:
+        deleted = conn.execute(
+            "DELETE FROM change_log WHERE id <= ? AND changed_at < datetime('now', ?)",
+            (hwm, f"-{retention_days} days")
+        ).rowcount
+    conn.close()
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="変更履歴の確認・圧縮")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="未処理の変更件数を表示")
+    p_compact = sub.add_parser("compact", help="処理済みの古い履歴を削除")
+    p_compact.add_argument("--days", type=int, default=RETENTION_DAYS, help="残しておく日数")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        print(f"🧹 {compact(retention_days=args.days)}件の履歴を削除しました")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    latest = latest_change_id(conn)
+    if latest is None:
+        print("❌ change_log がありません（migrate_database.py を実行してください）")
+        conn.close()
+        return
+    targets = conn.execute(
+        "SELECT target, change_id FROM build_targets WHERE change_id IS NOT NULL ORDER BY target").fetchall()
+    total = conn.execute("SELECT COUNT(*) FROM change_log").fetchone()[0]
+    if not targets:
+        print(f"📋 未ビルド: 次回は全体ビルドになります (履歴 {latest}件)")
+    else:
+        print(f"📋 最新 #{latest} (保存中 {total}件)")
+    for target, hwm in targets:
+        pending = conn.execute("SELECT COUNT(*) FROM change_log WHERE id > ?", (hwm,)).fetchone()[0]
+        print(f"   {target}: 処理済み #{hwm} (未処理 {pending}件)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
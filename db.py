@@ -0,0 +1,57 @@
+# ============================================================
+# db.py - DB 接続と読み取りスナップショット
+# ============================================================
+#
+# summaries.db は WAL モードで使う（migrate_database.py の v10 で切り替え）。
+# WAL では読み取りと書き込みが互いを待たないので、ビルド中も取り込みや編集を続けられる。
+# ビルドは snapshot() の中で行い、最初の読み取り時点の内容だけを見る。
+# 途中でコミットされた変更は次のビルドまで現れないので、作品ページ・索引・集計が食い違わない。
+#
+#   with db.snapshot() as conn:
+#       works = conn.execute("SELECT ...").fetchall()
+
+import sqlite3
+from contextlib import contextmanager
+
+DB_PATH = "summaries.db"
+# 書き込み同士が重なったときに待つ時間
+BUSY_TIMEOUT = 10.0
+
+
+def connect(db_path=DB_PATH, readonly=False):
+    if readonly:
+        return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+    return sqlite3.connect(db_path, timeout=BUSY_TIMEOUT)
+
+
+def enable_wal(conn):
+    """WAL モードに切り替えて、切り替え後のジャーナルモードを返す（DB ファイルに保存される）"""
+    return conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+
+
+@contextmanager
+def snapshot(db_path=DB_PATH):
+    """1つの読み取りトランザクションを張った接続を返す
+
+    BEGIN のあと最初の SELECT でスナップショットが決まり、終了まで同じ内容が見える。
+    """
+    conn = connect(db_path)
+    # トランザクションを sqlite3 モジュールに任せず、BEGIN / ROLLBACK を自分で発行する
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN")
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.close()
+
+
+def freeze(db_path, dest_path):
+    """現在の内容を dest_path に書き出す（別プロセスに同じスナップショットを配るため）"""
+    conn = connect(db_path)
+    try:
+        conn.execute("VACUUM INTO ?", (dest_path,))
+    finally:
+        conn.close()
@@ -0,0 +1,384 @@
+# ============================================================
+# dedup.py - MinHash / LSH による重複・ほぼ重複した要約の検出
+# ============================================================
+#
+# 使い方:
+#   python dedup.py update                    # 変更のあった作品の署名を更新し、新たな重複候補を表示
+#   python dedup.py report                    # 重複クラスタを一覧表示
+#   python dedup.py report --threshold 0.6
+#   python dedup.py check --file new.txt      # 取り込む前の要約が既存作品と重複していないか確認
+#
+# 要約を文字 5-gram の集合（シングル）にし、NUM_PERM 個のハッシュ関数による
+# MinHash 署名を NumPy でまとめて計算する。署名を BANDS 個の帯に分けて
+# 帯ごとのハッシュ値をバケットとし、同じバケットに入った作品だけを候補として
+# 署名の一致率（Jaccard 係数の推定値）で確かめるので、全ペアを比べずに済む。
+# 署名とバケットは DB（minhash_signatures / lsh_buckets）に保存し、
+# 取り込み後の update では変更のあった作品だけを計算し直して既存作品と照合する。
+
+import argparse
+import sqlite3
+import sys
+import time
+import unicodedata
+
+import numpy as np
+
+import migrate_database
+import summary_codec
+
+DB_PATH = "summaries.db"
+
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+# BANDS × ROWS = NUM_PERM。類似度 (1/BANDS)^(1/ROWS) ≒ 0.71 あたりから候補に上がり始める
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# 署名の一致率がこれ以上なら重複とみなす
+THRESHOLD = 0.8
+# 一度にハッシュするシングル数（メモリは NUM_PERM × これ × 8 バイト）
+BLOCK_SHINGLES = 1 << 16
+# 表示するクラスタの最大件数と、1件あたりに表示する作品数
+REPORT_LIMIT = 50
+MATCH_LIMIT = 10
+
+# メルセンヌ素数 2^61-1 を法とする普遍ハッシュ (a*x + b) mod P。a < 2^31 なので uint64 であふれない
+_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(20250101)
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)[:, None]
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)[:, None]
+_EMPTY = np.iinfo(np.uint32).max
+_SHINGLE_MULT = np.uint64(0x9E3779B97F4A7C15)
+_BAND_MULT = _rng.randint(1, 1 << 62, size=ROWS, dtype=np.uint64) | np.uint64(1)
+
+
+# ============================================================
+# 署名
+# ============================================================
+
+def shingles(text, k=SHINGLE_SIZE):
+    """NFKC 正規化・空白除去した文字列の k-gram を 32bit ハッシュの集合（ソート済み配列）で返す"""
+    text = ''.join(unicodedata.normalize('NFKC', text or '').split())
+    chars = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    # k 文字に満たない要約は全体を1つのシングルとする
+    k = min(k, len(chars))
+    if k == 0:
+        return np.empty(0, dtype=np.uint64)
+    h = np.zeros(len(chars) - k + 1, dtype=np.uint64)
+    for i in range(k):
+        h = h * _SHINGLE_MULT + chars[i:len(chars) - k + 1 + i]
+    return np.unique(h >> np.uint64(32))
+
+
+def signatures(texts):
+    """各テキストの MinHash 署名 (作品数 × NUM_PERM, uint32) を返す
+
+    全作品のシングルを1本の配列につなぎ、ブロックごとにハッシュして
+    np.minimum.reduceat で作品ごとの最小値を取る。シングルのない作品は全要素が最大値になる。
+    """
+    sets = [shingles(t) for t in texts]
+    sigs = np.full((len(sets), NUM_PERM), _EMPTY, dtype=np.uint32)
+    start = 0
+    while start < len(sets):
+        # BLOCK_SHINGLES を超えるまで作品を詰める（1作品で超える場合はその作品だけ）
+        end, total = start, 0
+        while end < len(sets) and (end == start or total + len(sets[end]) <= BLOCK_SHINGLES):
+            total += len(sets[end])
+            end += 1
+        block = sets[start:end]
+        lengths = np.array([len(s) for s in block])
+        nonempty = np.nonzero(lengths)[0]
+        if len(nonempty):
+            values = np.concatenate([block[i] for i in nonempty])
+            hashed = (_PERM_A * values[None, :] + _PERM_B) % _PRIME
+            offsets = np.concatenate(([0], np.cumsum(lengths[nonempty])[:-1]))
+            mins = np.minimum.reduceat(hashed, offsets, axis=1).T
+            sigs[start + nonempty] = (mins & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+        start = end
+    return sigs
+
+
+def band_buckets(sigs):
+    """署名 (N × NUM_PERM) から帯ごとのバケット値 (N × BANDS, int64) を返す"""
+    bands = sigs.astype(np.uint64).reshape(len(sigs), BANDS, ROWS)
+    # uint64 の乗算・加算は桁あふれで折り返すので、そのまま多項式ハッシュになる
+    return (bands * _BAND_MULT).sum(axis=2, dtype=np.uint64).view(np.int64)
+
+
+def similarity(sig, others):
+    """署名の一致率（Jaccard 係数の推定値）"""
+    return (others == sig).mean(axis=-1)
+
+
+# ============================================================
+# DB
+# ============================================================
+
+def find_changed(conn):
+    """署名の計算以降に追加・更新・削除された作品 ID を返す"""
+    changed = [row[0] for row in conn.execute("""
+        SELECT s.id FROM summaries s
+        LEFT JOIN minhash_signatures m ON m.summary_id = s.id
+        WHERE m.summary_id IS NULL OR m.source_updated_at IS NOT s.updated_at
+        ORDER BY s.id
+    """)]
+    deleted = [row[0] for row in conn.execute("""
+        SELECT summary_id FROM minhash_signatures
+        WHERE summary_id NOT IN (SELECT id FROM summaries)
+    """)]
+    return changed, deleted
+
+
+def update_signatures(conn, batch_size=2000):
+    """変更のあった作品の署名とバケットを計算し直し、変更された作品 ID を返す"""
+    summary_codec.load_dictionaries(conn)
+    changed, deleted = find_changed(conn)
+    with conn:
+        conn.executemany("DELETE FROM lsh_buckets WHERE summary_id = ?", [(i,) for i in deleted])
+        conn.executemany("DELETE FROM minhash_signatures WHERE summary_id = ?", [(i,) for i in deleted])
+    for start in range(0, len(changed), batch_size):
+        ids = changed[start:start + batch_size]
+        placeholders = ",".join("?" * len(ids))
+        rows = conn.execute(
+            f"SELECT id, summary, updated_at FROM summaries WHERE id IN ({placeholders}) ORDER BY id", ids
+        ).fetchall()
+        sigs = signatures([summary_codec.decode_summary(summary) for _, summary, _ in rows])
+        buckets = band_buckets(sigs)
+        with conn:
+            conn.executemany("DELETE FROM lsh_buckets WHERE summary_id = ?", [(r[0],) for r in rows])
+            conn.executemany(
+                "INSERT OR REPLACE INTO minhash_signatures (summary_id, signature, source_updated_at) VALUES (?, ?, ?)",
+                [(summary_id, sigs[i].tobytes(), updated_at) for i, (summary_id, _, updated_at) in enumerate(rows)]
+            )
+            # シングルのない（空の）要約はどの作品とも重複扱いしない
+            conn.executemany(
+                "INSERT INTO lsh_buckets (band, bucket, summary_id) VALUES (?, ?, ?)",
+                [(band, int(buckets[i, band]), summary_id)
+                 for i, (summary_id, _, _) in enumerate(rows) if sigs[i, 0] != _EMPTY
+                 for band in range(BANDS)]
+            )
+    return changed, deleted
+
+
+def load_signatures(conn, ids):
+    sigs = {}
+    for start in range(0, len(ids), 900):
+        chunk = ids[start:start + 900]
+        placeholders = ",".join("?" * len(chunk))
+        for summary_id, blob in conn.execute(
+                f"SELECT summary_id, signature FROM minhash_signatures WHERE summary_id IN ({placeholders})", chunk):
+            sigs[summary_id] = np.frombuffer(blob, dtype=np.uint32)
+    return sigs
+
+
+def find_duplicates(conn, text, threshold=THRESHOLD, exclude=None):
+    """要約 text と重複しそうな既存作品を [(作品ID, 類似度), ...] で返す（取り込み前の確認用）"""
+    sig = signatures([text])[0]
+    if sig[0] == _EMPTY:
+        return []
+    buckets = band_buckets(sig[None, :])[0]
+    candidates = set()
+    for band in range(BANDS):
+        candidates.update(row[0] for row in conn.execute(
+            "SELECT summary_id FROM lsh_buckets WHERE band = ? AND bucket = ?", (band, int(buckets[band]))))
+    candidates.discard(exclude)
+    sigs = load_signatures(conn, sorted(candidates))
+    matches = [(summary_id, float(similarity(sig, other))) for summary_id, other in sigs.items()]
+    return sorted([m for m in matches if m[1] >= threshold], key=lambda m: -m[1])
+
+
+def match_stored(conn, ids, threshold=THRESHOLD):
+    """署名を保存済みの作品 ids をほかの作品と照合し、重複候補のあるものを {作品ID: [(作品ID, 類似度), ...]} で返す
+
+    保存済みの署名とバケットを引くだけなので、要約を読み直したり署名を計算し直したりしない。
+    """
+    found = {}
+    sigs = load_signatures(conn, sorted(ids))
+    for summary_id in sorted(sigs):
+        sig = sigs[summary_id]
+        if sig[0] == _EMPTY:
+            continue
+        candidates = {row[0] for row in conn.execute("""
+            SELECT DISTINCT b2.summary_id FROM lsh_buckets b1
+            JOIN lsh_buckets b2 ON b2.band = b1.band AND b2.bucket = b1.bucket
+            WHERE b1.summary_id = ? AND b2.summary_id != ?
+        """, (summary_id, summary_id))}
+        others = load_signatures(conn, sorted(candidates))
+        matches = [(other_id, float(similarity(sig, other))) for other_id, other in others.items()]
+        matches = [m for m in matches if m[1] >= threshold]
+        if matches:
+            found[summary_id] = sorted(matches, key=lambda m: -m[1])
+    return found
+
+
+def check_works(conn, ids, threshold=THRESHOLD):
+    """DB にある作品 ids をほかの作品と照合し、重複候補のあるものを {作品ID: [(作品ID, 類似度), ...]} で返す
+
+    取り込み処理の最後に呼び、新しく入った作品だけを照合する。署名は変更のあった作品の分だけ更新する。
+    """
+    update_signatures(conn)
+    return match_stored(conn, ids, threshold)
+
+
+def print_matches(conn, summary_id, matches):
+    names = describe(conn, [summary_id] + [m[0] for m in matches])
+    title, author = names[summary_id]
+    print(f"⚠️ 重複の可能性: [{summary_id}] {title} / {author}")
+    for other_id, score in matches[:MATCH_LIMIT]:
+        print(f"   {score:.0%} [{other_id}] {names[other_id][0]} / {names[other_id][1]}")
+    if len(matches) > MATCH_LIMIT:
+        print(f"   ほか{len(matches) - MATCH_LIMIT}作品")
+
+
+def candidate_buckets(conn):
+    """2作品以上が入ったバケットの作品 ID リストを返す（主キー順の走査1回）
+
+    ほぼ同じ作品はすべての帯で同じバケットに入るので、同じ顔ぶれのバケットは1つにまとめる。
+    """
+    buckets = set()
+    for (ids,) in conn.execute("""
+        SELECT group_concat(summary_id) FROM lsh_buckets
+        GROUP BY band, bucket HAVING COUNT(*) > 1
+    """):
+        buckets.add(tuple(sorted(int(i) for i in ids.split(","))))
+    return sorted(buckets)
+
+
+def duplicate_clusters(conn, threshold=THRESHOLD):
+    """類似度が threshold 以上の作品を Union-Find でまとめ、[(作品IDのリスト, 最小類似度), ...] を返す"""
+    buckets = candidate_buckets(conn)
+    if not buckets:
+        return []
+    sigs = load_signatures(conn, sorted({i for members in buckets for i in members}))
+
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    links = []
+    for members in buckets:
+        # バケットの先頭と残りを一括で比べ、重複と確かめた作品は先頭につないで以後の比較から外す。
+        # 手間はバケットの大きさ × バケット内のクラスタ数で、ほぼ同じ作品ばかりのバケットなら大きさに比例するが、
+        # 互いに似ていない作品が偶然同じバケットに入った場合は最悪で大きさの2乗になる
+        # （LSH の帯の幅から、似ていない作品が同じバケットに入ることはまれ）
+        remaining = list(members)
+        while len(remaining) > 1:
+            head, rest = remaining[0], remaining[1:]
+            scores = similarity(sigs[head], np.array([sigs[i] for i in rest]))
+            for other, score in zip(rest, scores):
+                if score >= threshold:
+                    parent[find(other)] = find(head)
+                    links.append((head, float(score)))
+            remaining = [other for other, score in zip(rest, scores) if score < threshold]
+
+    clusters = {}
+    for summary_id in list(parent):
+        clusters.setdefault(find(summary_id), []).append(summary_id)
+    min_score = {}
+    for summary_id, score in links:
+        root = find(summary_id)
+        min_score[root] = min(min_score.get(root, 1.0), score)
+    result = [(sorted(members), min_score[root]) for root, members in clusters.items() if len(members) > 1]
+    result.sort(key=lambda c: (-len(c[0]), c[0]))
+    return result
+
+
+def describe(conn, ids):
+    placeholders = ",".join("?" * len(ids))
+    return {row[0]: row[1:] for row in conn.execute(
+        f"SELECT id, title, author FROM summaries WHERE id IN ({placeholders})", ids)}
+
+
+# ============================================================
+# コマンド
+# ============================================================
+
+def run_update(threshold):
+    started = time.perf_counter()
+    conn = sqlite3.connect(DB_PATH)
+    migrate_database.apply_migrations(conn)
+    initial = conn.execute("SELECT COUNT(*) FROM minhash_signatures").fetchone()[0] == 0
+    changed, deleted = update_signatures(conn)
+    print(f"🔢 署名を更新: {len(changed)}作品 (削除 {len(deleted)}件, {time.perf_counter() - started:.1f}秒)")
+    if initial:
+        # 初回は全作品が「変更あり」なので、作品ごとの照合ではなくクラスタ一覧を見る
+        conn.close()
+        print("ℹ️ 初回計算のため、既存の重複は python dedup.py report で確認してください")
+        return 0
+
+    # 新しく入った・書き換えられた作品だけを既存作品と照合する
+    found = match_stored(conn, changed, threshold)
+    for summary_id, matches in found.items():
+        print_matches(conn, summary_id, matches)
+    conn.close()
+    if not found:
+        print("✅ 新たな重複候補なし")
+    return len(found)
+
+
+def run_report(threshold):
+    started = time.perf_counter()
+    conn = sqlite3.connect(DB_PATH)
+    migrate_database.apply_migrations(conn)
+    update_signatures(conn)
+    clusters = duplicate_clusters(conn, threshold)
+    print(f"🔍 重複クラスタ: {len(clusters)}件 (類似度 {threshold:.0%} 以上, {time.perf_counter() - started:.1f}秒)")
+    for members, score in clusters[:REPORT_LIMIT]:
+        names = describe(conn, members)
+        print(f"\n📚 {len(members)}作品 (最小 {score:.0%})")
+        for summary_id in members[:MATCH_LIMIT]:
+            print(f"   [{summary_id}] {names[summary_id][0]} / {names[summary_id][1]}")
+        if len(members) > MATCH_LIMIT:
+            print(f"   ほか{len(members) - MATCH_LIMIT}作品")
+    conn.close()
+    return clusters
+
+
+def run_check(text, threshold):
+    conn = sqlite3.connect(DB_PATH)
+    migrate_database.apply_migrations(conn)
+    update_signatures(conn)
+    matches = find_duplicates(conn, text, threshold)
+    if matches:
+        names = describe(conn, [m[0] for m in matches])
+        print(f"⚠️ 既存作品と重複の可能性: {len(matches)}件")
+        for summary_id, score in matches[:MATCH_LIMIT]:
+            print(f"   {score:.0%} [{summary_id}] {names[summary_id][0]} / {names[summary_id][1]}")
+    else:
+        print("✅ 重複候補なし")
+    conn.close()
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinHash / LSH による重複検出")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (("update", "署名を更新し、変更作品の重複候補を表示"),
+                            ("report", "重複クラスタを一覧表示"),
+                            ("check", "取り込み前の要約を既存作品と照合")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--threshold", type=float, default=THRESHOLD, help="重複とみなす類似度")
+        if name == "check":
+            p.add_argument("--file", help="要約のテキストファイル（省略時は標準入力）")
+    args = parser.parse_args()
+
+    if args.command == "update":
+        run_update(args.threshold)
+    elif args.command == "report":
+        run_report(args.threshold)
+    else:
+        if args.file:
+            with open(args.file, encoding="utf-8") as f:
+                text = f.read()
+        else:
+            text = sys.stdin.read()
+        # 重複が見つかったら終了コード 1（取り込みスクリプトから呼べるように）
+        sys.exit(1 if run_check(text, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# ============================================================
+# enrich_metadata.py - 青空文庫の作品リスト CSV で年・ジャンル・著者の読みを補う
+# ============================================================
+#
+# 使い方:
+#   python enrich_metadata.py list_person_all_extended_utf8.csv
+#   python enrich_metadata.py list_person_all_extended.csv        # Shift_JIS 版もそのまま読める
+#   python enrich_metadata.py list_person_all_extended_utf8.csv --force   # 入力済みの値も上書き
+#
+# DB 側（数千〜数万行）を (人物ID, 作品ID) をキーにしたハッシュ表に載せ、
+# CSV（十数万行）は1行ずつ読みながら表を引くだけのハッシュ結合にする。
+# CSV 全体はメモリに載せない。
+#   year           ← 「初出」に最初に現れる西暦年
+#   genre          ← 「分類番号」の NDC（913 → 小説、K913 → 児童文学 など）
+#   author_reading ← 「姓読み」「名読み」
+# 既定では空の値だけを埋め、値が変わる行だけをバッチで UPDATE する。
+# 最後に CSV に見つからなかった作品を一覧表示する。
+
+import argparse
+import csv
+import os
+import re
+import sqlite3
+import time
+
+import migrate_database
+from aozora_ingest import parse_source_url
+
+DB_PATH = "summaries.db"
+# UPDATE をまとめてコミットする件数
+BATCH_SIZE = 1000
+# 表示する未一致作品の最大件数
+REPORT_LIMIT = 20
+
+# NDC の3桁目（文学の形式）→ ジャンル。9x1 詩歌, 9x3 小説 … は言語によらず共通
+NDC_LITERARY_FORMS = {
+    "1": "詩歌",
+    "2": "戯曲",
+    "3": "小説",
+    "4": "評論・随筆",
+    "5": "日記・書簡・紀行",
+    "6": "記録・ルポルタージュ",
+    "7": "箴言・アフォリズム",
+    "8": "作品集",
+}
+CHILDREN_GENRE = "児童文学"
+
+_NDC_RE = re.compile(r'(K?)(\d{3})')
+_YEAR_RE = re.compile(r'(1[5-9]\d\d|20\d\d)')
+
+
+def genre_from_ndc(classification):
+    """「NDC K913 913」のような分類番号から最初の分類のジャンルを返す"""
+    m = _NDC_RE.search(classification or "")
+    if not m:
+        return None
+    if m.group(1):
+        return CHILDREN_GENRE
+    code = m.group(2)
+    if code[0] != "9":
+        return None
+    return NDC_LITERARY_FORMS.get(code[2])
+
+
+def year_from_first_appearance(first_appearance):
+    m = _YEAR_RE.search(first_appearance or "")
+    return int(m.group(1)) if m else None
+
+
+def guess_encoding(path):
+    # 公式配布の *_utf8.csv 以外は Shift_JIS
+    return "utf-8-sig" if "utf8" in os.path.basename(path).lower() else "cp932"
+
+
+def load_targets(conn):
+    """DB 側のハッシュ表 {(人物ID, 作品ID): [(id, title, year, genre, author_reading), ...]} を作る"""
+    targets = {}
+    unparsed = []
+    for row in conn.execute("SELECT id, title, source_url, year, genre, author_reading FROM summaries"):
+        summary_id, title, source_url, year, genre, reading = row
+        key = parse_source_url(source_url)
+        if key:
+            targets.setdefault(key, []).append((summary_id, title, year, genre, reading))
+        else:
+            unparsed.append(title)
+    return targets, unparsed
+
+
+def enrich(csv_path, db_path=DB_PATH, encoding=None, force=False):
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    migrate_database.apply_migrations(conn)
+    targets, unparsed = load_targets(conn)
+
+    update_sql = ("UPDATE summaries SET year = ?, genre = ?, author_reading = ?, "
+                  "updated_at = CURRENT_TIMESTAMP WHERE id = ?")
+    matched = set()
+    pending = []
+    updated = 0
+    scanned = 0
+    with open(csv_path, newline="", encoding=encoding or guess_encoding(csv_path), errors="replace") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        col = {name: i for i, name in enumerate(header)}
+        try:
+            i_card, i_person, i_role = col["作品ID"], col["人物ID"], col["役割フラグ"]
+            i_first, i_ndc = col["初出"], col["分類番号"]
+            i_sei, i_mei = col["姓読み"], col["名読み"]
+        except KeyError as e:
+            conn.close()
+            raise ValueError(f"CSV に {e} 列がありません（list_person_all_extended 形式か確認してください）")
+
+        for row in reader:
+            scanned += 1
+            try:
+                key = (int(row[i_person]), int(row[i_card]))
+            except (ValueError, IndexError):
+                continue
+            works = targets.get(key)
+            # 翻訳者・校訂者などの行は読みが著者のものではないので使わない
+            if works is None or key in matched or row[i_role] != "著者":
+                continue
+            matched.add(key)
+
+            csv_year = year_from_first_appearance(row[i_first])
+            csv_genre = genre_from_ndc(row[i_ndc])
+            csv_reading = " ".join(p for p in (row[i_sei], row[i_mei]) if p) or None
+            for summary_id, _, year, genre, reading in works:
+                if force:
+                    new = (csv_year or year, csv_genre or genre, csv_reading or reading)
+                else:
+                    new = (year or csv_year, genre or csv_genre, reading or csv_reading)
+                if new != (year, genre, reading):
+                    pending.append(new + (summary_id,))
+            if len(pending) >= BATCH_SIZE:
+                with conn:
+                    conn.executemany(update_sql, pending)
+                updated += len(pending)
+                pending = []
+    if pending:
+        with conn:
+            conn.executemany(update_sql, pending)
+        updated += len(pending)
+    conn.close()
+
+    unmatched = [title for key, works in targets.items() if key not in matched for _, title, *_ in works]
+    print(f"✅ CSV {scanned:,}行を照合し {updated}件を更新 ({time.perf_counter() - started:.1f}秒)")
+    if unmatched or unparsed:
+        print(f"⚠️ CSV に見つからなかった作品: {len(unmatched)}件 / source_url を読めない作品: {len(unparsed)}件")
+        for title in (unmatched + unparsed)[:REPORT_LIMIT]:
+            print(f"   {title}")
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="青空文庫の作品リスト CSV でメタデータを補完")
+    parser.add_argument("csv", help="list_person_all_extended(_utf8).csv")
+    parser.add_argument("--encoding", default=None, help="CSV の文字コード（既定: ファイル名から推定）")
+    parser.add_argument("--force", action="store_true", help="入力済みの年・ジャンル・読みも上書きする")
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_PATH):
+        print(f"❌ {DB_PATH} が見つかりません")
+        return
+    if not os.path.exists(args.csv):
+        print(f"❌ {args.csv} が見つかりません")
+        return
+    enrich(args.csv, encoding=args.encoding, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
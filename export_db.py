@@ -0,0 +1,310 @@
+# ============================================================
+# export_db.py - 静的ホスティング向けの読み取り専用 DB を書き出す
+# ============================================================
+#
+# 使い方:
+#   python export_db.py                       # aozora_summaries/db/ に出力
+#   python export_db.py --page-size 1024 --chunk-size 1048576
+#   python export_db.py --check               # 出力したチャンクを組み立て直して検索を試す
+#
+# summaries.db から一覧・検索に必要な列だけを抜き出した小さな SQLite を作り、
+# VACUUM してから固定サイズのチャンク（works-<ハッシュ>.sqlite3.000 ...）に分けて置く。
+# ブラウザ側は sql.js-httpvfs などの HTTP Range リクエストで読む VFS から config.json を開き、
+# クエリに必要なページだけを取得する。作品数が増えても1回の検索で読むのは
+# B-tree の深さ分のページ数程度なので、全件を DOM に載せなくても絞り込み・全文検索ができる。
+#   works        一覧カードに必要な列（要約本文は持たず、先頭の抜粋だけ）
+#   works_fts    作品名・著者名・要約の全文検索（trigram、本文は持たない contentless）
+#   *_counts     ジャンル・年・著者・タグの件数（絞り込みメニューは1ページの読み取りで済む）
+# チャンク名には中身のハッシュを入れるので、古い config.json を持ったクライアントが
+# 新旧の混ざったページを読むことはない。直前の世代のチャンクは1つだけ残しておく。
+# 書き出し先は常に OUTPUT_DIR/db/ で、generator_v2.py --pack のアーカイブには入らない
+# （アーカイブで配信する場合も db/ はディレクトリのまま別に置く）。
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import db
+import generator_v2 as gen
+import suggest_index
+import summary_codec
+
+DB_PATH = "summaries.db"
+# 出力先（generator_v2.OUTPUT_DIR からの相対パス）
+EXPORT_DIR = "db"
+CONFIG_NAME = "config.json"
+CHUNK_PREFIX = "works-"
+CHUNK_SUFFIX_LENGTH = 3
+# Range リクエスト1回で読む単位。小さいほど1クエリの転送量は減るがリクエスト数が増える
+PAGE_SIZE = 4096
+# チャンクのサイズ（PAGE_SIZE の倍数）。CDN のファイルサイズ上限より十分小さくする
+CHUNK_SIZE = 4 * 1024 * 1024
+
+EXPORT_SCHEMA = """
+    CREATE TABLE works (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        author TEXT NOT NULL,
+        author_reading TEXT,
+        year INTEGER,
+        genre TEXT,
+        char_count INTEGER,
+        excerpt TEXT,
+        href TEXT NOT NULL,
+        title_key TEXT,
+        author_key TEXT
+    );
+    CREATE INDEX idx_works_author ON works(author, year);
+    CREATE INDEX idx_works_year ON works(year);
+    CREATE INDEX idx_works_genre ON works(genre, year);
+    CREATE INDEX idx_works_title_key ON works(title_key);
+    CREATE INDEX idx_works_author_key ON works(author_key);
+
+    CREATE TABLE tags (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+    CREATE TABLE work_tags (
+        tag_id INTEGER NOT NULL,
+        work_id INTEGER NOT NULL,
+        PRIMARY KEY (tag_id, work_id)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE author_counts (author TEXT PRIMARY KEY, href TEXT NOT NULL, works INTEGER NOT NULL) WITHOUT ROWID;
+    CREATE TABLE genre_counts (genre TEXT PRIMARY KEY, works INTEGER NOT NULL) WITHOUT ROWID;
+    CREATE TABLE year_counts (year INTEGER PRIMARY KEY, works INTEGER NOT NULL);
+    CREATE TABLE tag_counts (tag_id INTEGER PRIMARY KEY, works INTEGER NOT NULL);
+"""
+
+FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE works_fts USING fts5(
+        title, author, summary, content='', columnsize=0, tokenize='trigram'
+    )
+"""
+
+
+def build_export(conn, path, page_size=PAGE_SIZE):
+    """conn のスナップショットから path に書き出し用の DB を作り、作品数を返す"""
+    if os.path.exists(path):
+        os.remove(path)
+    out = sqlite3.connect(path)
+    # page_size はテーブルを作る前に決める
+    out.execute(f"PRAGMA page_size = {int(page_size)}")
+    out.execute("PRAGMA journal_mode = OFF")
+    out.execute("PRAGMA synchronous = OFF")
+    out.executescript(EXPORT_SCHEMA)
+    try:
+        out.execute(FTS_SCHEMA)
+        fts = True
+    except sqlite3.OperationalError:
+        print("⚠️ この SQLite は trigram トークナイザに対応していないため全文検索索引を省きます")
+        fts = False
+
+    # 一覧と同じ著者・年の順に入れて、著者で絞り込んだ行が近いページに並ぶようにする
+    count = 0
+    with out:
+        for work in gen.iter_all_works(conn):
+            count += 1
+            summary = summary_codec.decode_summary(work['summary']) or ''
+            out.execute("""
+                INSERT INTO works (id, title, author, author_reading, year, genre, char_count,
+                                   excerpt, href, title_key, author_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (work['id'], work['title'], work['author'], work.get('author_reading'),
+                  work.get('year'), work.get('genre'), work.get('char_count'),
+                  gen.work_excerpt(work['summary']), gen.work_filename(work),
+                  suggest_index.normalize_key(work['title']), suggest_index.normalize_key(work['author'])))
+            if fts:
+                out.execute("INSERT INTO works_fts (rowid, title, author, summary) VALUES (?, ?, ?, ?)",
+                            (work['id'], work['title'], work['author'], summary))
+
+        try:
+            out.executemany("INSERT INTO tags (id, name) VALUES (?, ?)",
+                            conn.execute("SELECT id, name FROM tags ORDER BY id"))
+            out.executemany("INSERT INTO work_tags (tag_id, work_id) VALUES (?, ?)",
+                            conn.execute("SELECT tag_id, summary_id FROM summary_tags"))
+        except sqlite3.Error:
+            pass
+
+        # 件数は書き出した行から数え直す（元 DB の集計テーブルがなくても同じ結果になる）
+        out.executemany("INSERT INTO author_counts (author, href, works) VALUES (?, ?, ?)",
+                        [(author, gen.author_filename(author), count) for author, count in
+                         out.execute("SELECT author, COUNT(*) FROM works GROUP BY author").fetchall()])
+        out.execute("""
+            INSERT INTO genre_counts SELECT genre, COUNT(*) FROM works WHERE genre IS NOT NULL GROUP BY genre
+        """)
+        # year_counts.year は INTEGER PRIMARY KEY なので、文字列の年（「明治頃」など）は数えない（facet_counts と同じ）
+        out.execute("""
+            INSERT INTO year_counts SELECT year, COUNT(*) FROM works WHERE typeof(year) = 'integer' GROUP BY year
+        """)
+        out.execute("""
+            INSERT INTO tag_counts SELECT wt.tag_id, COUNT(*) FROM work_tags wt
+            JOIN works w ON w.id = wt.work_id GROUP BY wt.tag_id
+        """)
+        if fts:
+            out.execute("INSERT INTO works_fts (works_fts) VALUES ('optimize')")
+    out.execute("ANALYZE")
+    # Range リクエストで読むファイルなので WAL にはしない
+    out.execute("PRAGMA journal_mode = DELETE")
+    out.execute("VACUUM")
+    out.close()
+    return count
+
+
+def chunk_name(digest, index):
+    return f"{CHUNK_PREFIX}{digest}.sqlite3.{index:0{CHUNK_SUFFIX_LENGTH}d}"
+
+
+def file_digest(path, block_size=CHUNK_SIZE):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()[:12]
+
+
+def write_chunks(path, page_size=PAGE_SIZE, chunk_size=CHUNK_SIZE):
+    """DB ファイルをチャンクに分けて出力し、config.json の内容を返す
+
+    ハッシュの計算と書き出しはどちらもチャンク単位で読むので、DB 全体をメモリに載せない。
+    """
+    digest = file_digest(path, chunk_size)
+    length = os.path.getsize(path)
+    with open(path, "rb") as f:
+        for i, data in enumerate(iter(lambda: f.read(chunk_size), b"")):
+            gen.write_output(f"{EXPORT_DIR}/{chunk_name(digest, i)}", data)
+    # sql.js-httpvfs の chunked モードの設定
+    config = {
+        'serverMode': 'chunked',
+        'requestChunkSize': page_size,
+        'databaseLengthBytes': length,
+        'serverChunkSize': chunk_size,
+        'urlPrefix': f"{CHUNK_PREFIX}{digest}.sqlite3.",
+        'suffixLength': CHUNK_SUFFIX_LENGTH,
+    }
+    return config
+
+
+def read_config(export_dir):
+    try:
+        with open(os.path.join(export_dir, CONFIG_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def remove_stale_chunks(export_dir, keep_prefixes):
+    """keep_prefixes 以外の世代のチャンクを削除し、削除数を返す"""
+    removed = 0
+    for path in glob.glob(os.path.join(export_dir, f"{CHUNK_PREFIX}*.sqlite3.*")):
+        name = os.path.basename(path)
+        if not any(name.startswith(prefix) for prefix in keep_prefixes):
+            gen.remove_output(f"{EXPORT_DIR}/{name}")
+            removed += 1
+    return removed
+
+
+def export(db_path=DB_PATH, page_size=PAGE_SIZE, chunk_size=CHUNK_SIZE):
+    if chunk_size % page_size:
+        raise ValueError(f"チャンクサイズ {chunk_size} はページサイズ {page_size} の倍数にしてください")
+    started = time.perf_counter()
+    export_dir = os.path.join(gen.OUTPUT_DIR, EXPORT_DIR)
+    os.makedirs(export_dir, exist_ok=True)
+    build_path = os.path.join(export_dir, "export.build")
+    previous = read_config(export_dir)
+    try:
+        with db.snapshot(db_path) as conn:
+            count = build_export(conn, build_path, page_size)
+        config = write_chunks(build_path, page_size, chunk_size)
+    finally:
+        if os.path.exists(build_path):
+            os.remove(build_path)
+
+    gen.write_output(f"{EXPORT_DIR}/{CONFIG_NAME}", json.dumps(config, indent=1))
+    # 古い config.json をキャッシュしているクライアントのために直前の世代は残す
+    keep = [config['urlPrefix']]
+    if previous and previous.get('urlPrefix'):
+        keep.append(previous['urlPrefix'])
+    removed = remove_stale_chunks(export_dir, keep)
+    gen.save_output_hashes()
+
+    length = config['databaseLengthBytes']
+    chunks = -(-length // chunk_size)
+    print(f"✅ {count}作品を書き出し: {length / 1024:.1f} KB"
+          f" ({length // page_size}ページ × {page_size} bytes, {chunks}チャンク)"
+          f" ({time.perf_counter() - started:.1f}秒)")
+    if removed:
+        print(f"🗑️ 古いチャンク {removed}個を削除")
+    print(f"🌐 {export_dir}/{CONFIG_NAME}")
+    return config
+
+
+def check(export_dir=None):
+    """チャンクを組み立て直して整合性と代表的なクエリを確認する"""
+    export_dir = export_dir or os.path.join(gen.OUTPUT_DIR, EXPORT_DIR)
+    config = read_config(export_dir)
+    if config is None:
+        print(f"❌ {export_dir}/{CONFIG_NAME} がありません")
+        return False
+    chunks = -(-config['databaseLengthBytes'] // config['serverChunkSize'])
+    check_path = os.path.join(export_dir, "export.check")
+    with open(check_path, "wb") as out:
+        for i in range(chunks):
+            name = f"{config['urlPrefix']}{i:0{config['suffixLength']}d}"
+            with open(os.path.join(export_dir, name), "rb") as f:
+                out.write(f.read())
+    try:
+        return _check_file(check_path, config)
+    finally:
+        os.remove(check_path)
+
+
+def _check_file(path, config):
+    size = os.path.getsize(path)
+    if size != config['databaseLengthBytes']:
+        print(f"❌ サイズが一致しません ({size} != {config['databaseLengthBytes']})")
+        return False
+
+    conn = db.connect(path, readonly=True)
+    ok = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    works, = conn.execute("SELECT COUNT(*) FROM works").fetchone()
+    print(f"{'✅' if ok == 'ok' else '❌'} integrity_check: {ok} / {works}作品 / page_size {page_size}")
+    title, = conn.execute("SELECT title FROM works ORDER BY id LIMIT 1").fetchone() or ("",)
+    key = suggest_index.normalize_key(title[:2])
+    queries = [
+        ("ジャンル一覧", "SELECT genre, works FROM genre_counts ORDER BY works DESC LIMIT 3", ()),
+        ("前方一致", "SELECT title, author FROM works WHERE title_key >= ? AND title_key < ? LIMIT 3",
+         (key, key + '\U0010ffff')),
+    ]
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'works_fts'").fetchone():
+        queries.append(("全文検索", """
+            SELECT w.title, w.author FROM works_fts f JOIN works w ON w.id = f.rowid
+            WHERE works_fts MATCH ? LIMIT 3
+        """, (json.dumps(title[:3], ensure_ascii=False),)))
+    for label, sql, params in queries:
+        rows = conn.execute(sql, params).fetchall()
+        print(f"   {label}: {', '.join(' / '.join(str(v) for v in row) for row in rows) or '(なし)'}")
+    conn.close()
+    return ok == 'ok'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="静的ホスティング向けの読み取り専用 DB を書き出す")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="SQLite のページサイズ")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="チャンクのバイト数")
+    parser.add_argument("--check", action="store_true", help="書き出し済みのチャンクを検証する")
+    args = parser.parse_args()
+
+    if args.check:
+        check()
+        return
+    if not os.path.exists(DB_PATH):
+        print(f"❌ {DB_PATH} が見つかりません")
+        return
+    export(page_size=args.page_size, chunk_size=args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# ============================================================
+# fast_template.py - 単純なテンプレート用の高速描画バックエンド
+# ============================================================
+#
+# 使い方:
+#   python fast_template.py --check              # 全ページを Jinja2 と描き比べてバイト一致を確認
+#                                                #（DB がなければ EDGE_CASES の特殊な値だけ）
+#   python fast_template.py --bench              # 作品ページ1枚あたりの描画時間を比較
+#   python fast_template.py --bench --pages 50000
+#
+# 作品ページ（WORK_TEMPLATE）は変数の差し込みと単純な if / for だけの平坦なテンプレートなので、
+# 読み込み時に「静的な文字列」と「エスケープして差し込む変数」の並び（セグメント列）に変換し、
+# 描画はセグメントを順に連結するだけにする。Jinja2 の Context 生成や Undefined の処理を
+# 通らない分、1ページあたりの描画が速い。
+# 対応するのは次の構文だけで、それ以外（フィルタ・式・elif・loop 変数・空白制御・コメントなど）を
+# 含むテンプレートは compile_template() が None を返し、呼び出し側は Jinja2 で描画する。
+#   {{ name }} / {{ name.attr }}
+#   {% if name %} ... {% else %} ... {% endif %}（name.attr も可）
+#   {% for item in name %} ... {% endfor %}
+# エスケープは Jinja2 の autoescape（markupsafe.escape）と同じ規則で、str / int 以外は markupsafe に任せる。
+# 未定義の変数は空文字、name.attr は getattr → [] の順に引くので、出力は Jinja2 と1バイトも違わない。
+# 同じ変数（タイトル・著者名は1ページに5回ずつ現れる）のエスケープは描画1回につき1度だけ行う。
+
+import argparse
+import os
+import re
+import time
+
+from markupsafe import escape
+
+# テンプレートの区切り（Jinja2 の既定と同じ）
+_TAG_RE = re.compile(r'(\{\{.*?\}\}|\{%.*?%\}|\{#.*?#\})', re.S)
+_REF_RE = re.compile(r'([A-Za-z_]\w*)(?:\.([A-Za-z_]\w*))?')
+_FOR_RE = re.compile(r'for\s+([A-Za-z_]\w*)\s+in\s+(.+)', re.S)
+# Jinja2 ではリテラルやグローバル関数として解釈される名前
+_RESERVED = {'true', 'false', 'none', 'True', 'False', 'None', 'loop',
+             'range', 'dict', 'lipsum', 'cycler', 'joiner', 'namespace'}
+
+TEXT, VAR, IF, FOR = range(4)
+_MISSING = object()
+
+
+class Unsupported(Exception):
+    """セグメント列に変換できない構文"""
+
+
+def _ref(expr):
+    m = _REF_RE.fullmatch(expr.strip())
+    if m is None or m.group(1) in _RESERVED:
+        raise Unsupported(expr)
+    return m.group(1), m.group(2)
+
+
+def _merge_text(segments):
+    """隣り合う静的文字列をつなげ、ネストしたブロックはタプルに固める"""
+    merged = []
+    for seg in segments:
+        if seg[0] == TEXT and merged and merged[-1][0] == TEXT:
+            merged[-1] = (TEXT, merged[-1][1] + seg[1])
+        elif seg[0] == IF:
+            merged.append((IF, seg[1], seg[2], _merge_text(seg[3]), _merge_text(seg[4])))
+        elif seg[0] == FOR:
+            merged.append((FOR, seg[1], seg[2], seg[3], _merge_text(seg[4])))
+        else:
+            merged.append(seg)
+    return tuple(merged)
+
+
+def parse(source):
+    """テンプレートをセグメント列に変換する。対応しない構文があれば Unsupported"""
+    # Jinja2 は改行コードを正規化し、末尾の改行1つを落とす
+    if '\r' in source:
+        raise Unsupported('\\r')
+    if source.endswith('\n'):
+        source = source[:-1]
+
+    root = []
+    # (ブロックの種類, ブロックのノード, 追加先のリスト)
+    stack = [(None, None, root)]
+    for i, token in enumerate(_TAG_RE.split(source)):
+        body = stack[-1][2]
+        if i % 2 == 0:
+            if token:
+                body.append((TEXT, token))
+            continue
+        inner = token[2:-2]
+        if token.startswith('{#') or inner[:1] in '-+' or inner[-1:] in '-+':
+            raise Unsupported(token)
+        inner = inner.strip()
+        if token.startswith('{{'):
+            body.append((VAR,) + _ref(inner))
+            continue
+
+        keyword = inner.split(None, 1)[0] if inner else ''
+        if keyword == 'if':
+            node = [IF, *_ref(inner[2:]), [], []]
+            body.append(node)
+            stack.append(('if', node, node[3]))
+        elif inner == 'else' and stack[-1][0] == 'if':
+            kind, node, _ = stack.pop()
+            stack.append(('else', node, node[4]))
+        elif inner == 'endif' and stack[-1][0] in ('if', 'else'):
+            stack.pop()
+        elif keyword == 'for':
+            m = _FOR_RE.fullmatch(inner)
+            if m is None or m.group(1) in _RESERVED:
+                raise Unsupported(token)
+            node = [FOR, m.group(1), *_ref(m.group(2)), []]
+            body.append(node)
+            stack.append(('for', node, node[4]))
+        elif inner == 'endfor' and stack[-1][0] == 'for':
+            stack.pop()
+        else:
+            raise Unsupported(token)
+    if len(stack) > 1:
+        raise Unsupported(f"閉じていない {stack[-1][0]}")
+    return _merge_text(root)
+
+
+def _lookup(context, name, attr):
+    value = context.get(name, _MISSING)
+    if value is _MISSING or attr is None:
+        return value
+    # Jinja2 の Environment.getattr と同じ順序
+    try:
+        return getattr(value, attr)
+    except AttributeError:
+        pass
+    try:
+        return value[attr]
+    except (TypeError, LookupError):
+        return _MISSING
+
+
+def _escape(value):
+    """markupsafe.escape と同じ文字列を返す（str / int は Markup を作らずに済ませる）"""
+    cls = type(value)
+    if cls is str:
+        if '&' in value:
+            value = value.replace('&', '&amp;')
+        if '<' in value:
+            value = value.replace('<', '&lt;')
+        if '>' in value:
+            value = value.replace('>', '&gt;')
+        if '"' in value:
+            value = value.replace('"', '&#34;')
+        if "'" in value:
+            value = value.replace("'", '&#39;')
+        return value
+    if cls is int:
+        return str(value)
+    return str(escape(value))
+
+
+def _render(segments, context, out, escaped):
+    # escaped: 同じ変数を何度も差し込むので、エスケープ結果を描画1回の間だけ覚えておく
+    for seg in segments:
+        kind = seg[0]
+        if kind == TEXT:
+            out.append(seg[1])
+        elif kind == VAR:
+            key = seg[1:]
+            text = escaped.get(key)
+            if text is None:
+                value = _lookup(context, seg[1], seg[2])
+                text = escaped[key] = '' if value is _MISSING else _escape(value)
+            out.append(text)
+        elif kind == IF:
+            value = _lookup(context, seg[1], seg[2])
+            _render(seg[3] if value is not _MISSING and value else seg[4], context, out, escaped)
+        else:
+            items = _lookup(context, seg[2], seg[3])
+            if items is _MISSING:
+                continue
+            inner = dict(context)
+            for item in items:
+                inner[seg[1]] = item
+                _render(seg[4], inner, out, {})
+
+
+class FastTemplate:
+    """セグメント列で描画するテンプレート（jinja2.Template と同じく render(**context) で呼ぶ）"""
+
+    def __init__(self, segments):
+        self.segments = segments
+
+    def render(self, *args, **kwargs):
+        out = []
+        _render(self.segments, dict(*args, **kwargs), out, {})
+        return ''.join(out)
+
+
+def compile_template(source):
+    """対応する構文だけなら FastTemplate を、そうでなければ None を返す"""
+    try:
+        return FastTemplate(parse(source))
+    except Unsupported:
+        return None
+
+
+# ============================================================
+# Jinja2 との比較・ベンチマーク
+# ============================================================
+
+# 記号・空値・関連作品なし・長い要約・年やジャンルの欠けなど、DB に現れにくい値も描き比べる
+EDGE_CASES = [
+    {'id': -1, 'title': '<script>alert("x")</script>', 'author': "O'Brien & <b>", 'year': None,
+     'genre': None, 'length': None, 'char_count': None, 'summary': '1行目\n\n  <i>2行目</i> &amp;',
+     'source_url': 'https://example.com/?a=1&b="2"'},
+    {'id': -2, 'title': '空の値', 'author': '著者', 'year': 0, 'genre': '', 'length': '短編',
+     'char_count': 0, 'summary': '', 'source_url': ''},
+    {'id': -3, 'title': '{{ title }}', 'author': '{% if %}', 'year': 1900, 'genre': '小説',
+     'length': '長編', 'char_count': 1234567, 'summary': None, 'source_url': 'x'},
+    {'id': -4, 'title': '長い要約', 'author': '著者', 'year': 1925, 'genre': '随筆', 'length': '長編',
+     'char_count': 400000, 'summary': '長い要約の本文です。<&>"\'\n' * 20000, 'source_url': 'x'},
+    # year / genre / length / char_count の列自体がない行。抜粋の80文字目が記号の途中にかかる
+    {'id': -5, 'title': '年・ジャンルなし', 'author': '著者', 'summary': 'x' * 78 + '<&>"' + 'y' * 10,
+     'source_url': 'x'},
+    {'id': -6, 'title': '年が文字列', 'author': '著者', 'year': '明治頃', 'genre': '小説', 'length': '',
+     'char_count': None, 'summary': '\\n を含む要約\\n2行目', 'source_url': 'x'},
+]
+
+
+def _render_site(gen, works, related, works_data, facets, date):
+    """作品・索引・著者・年代/ジャンル別の全ページを {パス: HTML} で返す"""
+    pages = {}
+    for work in works:
+        pages[gen.work_filename(work) + f"#{work['id']}"] = gen.work_page_html(work, related.get(work['id']), date)
+    pages["index.html"] = gen.index_html(works_data, facets, date)
+    author_counts = gen.count_authors(works_data)
+    pages["by_author.html"] = gen.author_directory_html(author_counts)
+    start = 0
+    for author, count in author_counts:
+        pages[gen.author_filename(author)] = gen.author_page_html(author, works_data[start:start + count], date)
+        start += count
+    pages.update(gen.facet_pages_html(facets))
+    return pages
+
+
+def check():
+    import db
+    import generator_v2 as gen
+
+    works, related, facets = [], {}, None
+    if os.path.exists(gen.DB_PATH):
+        with db.snapshot(gen.DB_PATH) as conn:
+            works = gen.get_all_works(conn)
+            related = gen.get_related_works(conn)
+            facets = gen.get_facet_counts(conn)
+    else:
+        print(f"ℹ️ {gen.DB_PATH} がないため、特殊な値（EDGE_CASES）だけを描き比べます")
+    related[EDGE_CASES[0]['id']] = [{'title': '<関連>', 'author': 'A&B', 'filename': 'a"b.html'}]
+    works = works + EDGE_CASES
+    works_data = sorted((gen.index_entry(work) for work in works if work['summary'] is not None), key=gen.index_order)
+    facets = facets or gen.facet_counts_from(works_data)
+    date = "2000-01-01"
+
+    results = {}
+    for backend in ("jinja2", "fast"):
+        gen.set_render_backend(backend)
+        results[backend] = _render_site(gen, works, related, works_data, facets, date)
+    backends = dict(gen.TEMPLATE_BACKENDS)
+    gen.set_render_backend(gen.DEFAULT_RENDER_BACKEND)
+
+    expected, actual = results["jinja2"], results["fast"]
+    diffs = [path for path in expected if expected[path].encode('utf-8') != actual[path].encode('utf-8')]
+    print("テンプレートごとの描画方式: " + ", ".join(f"{name}={b}" for name, b in sorted(backends.items())))
+    if diffs:
+        print(f"❌ {len(diffs)}/{len(expected)}ページが Jinja2 と一致しません")
+        for path in diffs[:10]:
+            a, b = expected[path], actual[path]
+            pos = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+            print(f"   {path}: {pos}文字目 jinja2={a[pos:pos + 40]!r} fast={b[pos:pos + 40]!r}")
+        return False
+    print(f"✅ {len(expected)}ページ（作品 {len(works)} / 特殊な値 {len(EDGE_CASES)}）がバイト単位で一致")
+    return True
+
+
+def bench(n_pages):
+    import db
+    import generator_v2 as gen
+
+    with db.snapshot(gen.DB_PATH) as conn:
+        works = gen.get_all_works(conn)
+        related = gen.get_related_works(conn)
+    if not works:
+        print("⚠️ データがありません")
+        return
+    sample = [works[i % len(works)] for i in range(n_pages)]
+
+    timings = {}
+    for backend in ("jinja2", "fast"):
+        gen.set_render_backend(backend)
+        gen.work_page_html(sample[0], related.get(sample[0]['id']), "2000-01-01")
+        started = time.perf_counter()
+        for work in sample:
+            gen.work_page_html(work, related.get(work['id']), "2000-01-01")
+        timings[backend] = (time.perf_counter() - started) / n_pages
+    gen.set_render_backend(gen.DEFAULT_RENDER_BACKEND)
+
+    for backend, seconds in timings.items():
+        print(f"   {backend:>6}: {seconds * 1e6:7.1f} µs/ページ ({1 / seconds:,.0f} ページ/秒)")
+    print(f"⚡ 作品ページ {n_pages:,}枚: {timings['jinja2'] / timings['fast']:.1f}倍")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="高速描画バックエンドの検証・ベンチマーク")
+    parser.add_argument("--check", action="store_true", help="全ページを Jinja2 と描き比べる")
+    parser.add_argument("--bench", action="store_true", help="作品ページの描画時間を比較する")
+    parser.add_argument("--pages", type=int, default=20000, help="ベンチマークで描画するページ数")
+    args = parser.parse_args()
+
+    if not (args.check or args.bench):
+        parser.print_help()
+        return
+    if args.check and not check():
+        raise SystemExit(1)
+    if args.bench:
+        bench(args.pages)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,12 +6,50 @@ import os
 import sqlite3
 import re
 import json
+import hashlib
+import argparse
+from contextlib import contextmanager, nullcontext
+from itertools import groupby
 from datetime import datetime
-from jinja2 import Template
-from urllib.parse import quote
+from urllib.parse import quote, urlencode
+
+import change_log
+import db
+import service_worker
+import site_pack
+import suggest_index
+import summary_codec
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 DB_PATH = "summaries.db"
 OUTPUT_DIR = "aozora_summaries"
+# 著者ページの出力先（OUTPUT_DIR からの相対パス）
+AUTHOR_DIR = "authors"
+# --pack のときは OUTPUT_DIR にファイルを書かず、このアーカイブ1つにまとめる（site_pack.py）
+PACK_PATH = "aozora_summaries.pack"
+
+# テンプレート読み込み時に空白・CSSを圧縮する（ページごとのコストはゼロ）
+MINIFY_TEMPLATES = True
+
+# 描画方式。"fast" は単純なテンプレート（作品ページ）を fast_template のセグメント連結で描き、
+# それ以外は Jinja2 に任せる。"jinja2" はすべて Jinja2 で描く
+DEFAULT_RENDER_BACKEND = "fast"
+RENDER_BACKEND = DEFAULT_RENDER_BACKEND
+
+# HTML と同じパスで出力する JSON API（パスはいずれも OUTPUT_DIR からの相対）
+EMIT_API = True
+API_DIR = "api/v1"
+API_PAGE_SIZE = 100
+# 差分ビルドで一覧を組み立てるための索引エントリ（index_entries テーブル。出力先ごとに持つ）
+INDEX_ENTRY_COLUMNS = ('id', 'title', 'author', 'year', 'genre', 'excerpt', 'filename')
+# 一覧カードの抜粋の文字数
+EXCERPT_CHARS = 80
+# 前回の manifest.json にだけ載っていて、次のビルドで消すサジェストのチャンク
+SUGGEST_RETIRED_PATH = f"{suggest_index.SUGGEST_DIR}/retired.json"
 
 # ============================================================
 # テンプレート
@@ -50,6 +88,12 @@ WORK_TEMPLATE = '''<!DOCTYPE html>
     .source-box { background: #f0f4ff; padding: 25px; border-radius: 8px; margin-top: 30px; }
     .source-box h3 { color: #667eea; margin-bottom: 15px; font-size: 1.1em; }
     .source-box a { color: #667eea; word-break: break-all; }
+    .related-section { margin-top: 30px; }
+    .related-section h3 { color: #667eea; margin-bottom: 15px; font-size: 1.1em; }
+    .related-list { list-style: none; display: grid; gap: 10px; }
+    .related-list a { color: #667eea; text-decoration: none; font-weight: bold; }
+    .related-list a:hover { text-decoration: underline; }
+    .related-list .related-author { color: #999; font-size: 0.9em; margin-left: 8px; }
     footer { background: #2c3e50; color: white; padding: 40px 20px; text-align: center; margin-top: 60px; }
     @media (max-width: 768px) {
       header h1 { font-size: 1.2em; }
@@ -79,7 +123,7 @@ WORK_TEMPLATE = '''<!DOCTYPE html>
   <main>
     <div class="breadcrumb">
       <a href="index.html">トップ</a> &gt; 
-      <a href="by_author.html#{{ author }}">{{ author }}</a> &gt; 
+      <a href="{{ author_page }}">{{ author }}</a> &gt; 
       {{ title }}
     </div>
 
@@ -90,7 +134,7 @@ WORK_TEMPLATE = '''<!DOCTYPE html>
           <span>👤 {{ author }}</span>
           {% if year %}<span>📅 {{ year }}年</span>{% endif %}
           {% if genre %}<span>📖 {{ genre }}</span>{% endif %}
-          {% if length %}<span>📏 {{ length }}</span>{% endif %}
+          {% if length %}<span>📏 {{ length }}{% if char_count %}（約{{ char_count }}字）{% endif %}</span>{% endif %}
         </div>
       </div>
 
@@ -104,6 +148,17 @@ WORK_TEMPLATE = '''<!DOCTYPE html>
         <p><a href="{{ source_url }}" target="_blank" rel="noopener noreferrer">{{ source_url }}</a></p>
         <p style="margin-top: 10px; font-size: 0.9em; color: #666;">青空文庫『{{ title }}』{{ author }} 著</p>
       </div>
+
+      {% if related %}
+      <div class="related-section">
+        <h3>🔗 関連作品</h3>
+        <ul class="related-list">
+          {% for work in related %}
+          <li><a href="{{ work.filename }}">{{ work.title }}</a><span class="related-author">{{ work.author }}</span></li>
+          {% endfor %}
+        </ul>
+      </div>
+      {% endif %}
     </article>
   </main>
 
@@ -111,6 +166,7 @@ WORK_TEMPLATE = '''<!DOCTYPE html>
     <p>&copy; 2025 LitLite -要約文庫-</p>
     <p style="margin-top: 10px; opacity: 0.8;">最終更新: {{ date }}</p>
   </footer>
+  <script>if ('serviceWorker' in navigator) navigator.serviceWorker.register('sw.js').catch(() => {});</script>
 </body>
 </html>'''
 
@@ -137,9 +193,13 @@ INDEX_TEMPLATE = '''<!DOCTYPE html>
     .stat-box .number { font-size: 2.5em; color: #667eea; font-weight: bold; }
     .stat-box .label { color: #666; margin-top: 5px; }
     main { max-width: 1200px; margin: 40px auto; padding: 0 20px; }
-    .search-box { background: white; padding: 25px; border-radius: 12px; margin-bottom: 40px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
+    .search-box { position: relative; background: white; padding: 25px; border-radius: 12px; margin-bottom: 40px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
     .search-box input { width: 100%; padding: 15px 20px; font-size: 1.1em; border: 2px solid #e0e0e0; border-radius: 8px; }
     .search-box input:focus { outline: none; border-color: #667eea; }
+    .suggest-list { position: absolute; left: 25px; right: 25px; z-index: 50; list-style: none; background: white; border: 1px solid #e0e0e0; border-radius: 8px; box-shadow: 0 4px 10px rgba(0,0,0,0.1); max-height: 400px; overflow-y: auto; }
+    .suggest-list a { display: block; padding: 10px 20px; color: #2c3e50; text-decoration: none; }
+    .suggest-list a:hover { background: #f0f4ff; }
+    .suggest-list span { color: #999; font-size: 0.85em; margin-left: 10px; }
     .filter-tabs { margin-bottom: 30px; display: flex; gap: 10px; flex-wrap: wrap; }
     .filter-tabs button { padding: 10px 20px; border: none; background: white; border-radius: 20px; cursor: pointer; font-size: 1em; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
     .filter-tabs button.active { background: #667eea; color: white; }
@@ -193,12 +253,13 @@ INDEX_TEMPLATE = '''<!DOCTYPE html>
 
   <main>
     <div class="search-box">
-      <input type="text" id="searchInput" placeholder="🔍 作品名や著者名で検索...">
+      <input type="text" id="searchInput" placeholder="🔍 作品名や著者名で検索..." autocomplete="off">
+      <ul class="suggest-list" id="suggestList" style="display: none;"></ul>
     </div>
 
     <div class="works-grid" id="worksGrid">
       {% for work in works %}
-      <article class="work-card" data-title="{{ work.title }}" data-author="{{ work.author }}" data-genre="{{ work.genre }}">
+      <article class="work-card" data-title="{{ work.title }}" data-author="{{ work.author }}" data-genre="{{ work.genre or '' }}" data-year="{{ work.year or '' }}">
         <h3>{{ work.title }}</h3>
         <div class="author">{{ work.author }}</div>
         <div class="meta">
@@ -223,19 +284,92 @@ INDEX_TEMPLATE = '''<!DOCTYPE html>
 
   <script>
     const searchInput = document.getElementById('searchInput');
+    const suggestList = document.getElementById('suggestList');
     const worksGrid = document.getElementById('worksGrid');
     const noResults = document.getElementById('noResults');
 
-    searchInput.addEventListener('input', function() {
-      const query = this.value.toLowerCase().trim();
-      const cards = worksGrid.querySelectorAll('.work-card');
+    // suggest_index.normalize_key() と同じ規則（NFKC・小文字・カタカナ→ひらがな・空白除去）
+    function foldKey(text) {
+      return text.normalize('NFKC').toLowerCase()
+        .replace(/[\\u30a1-\\u30f6\\u30fd\\u30fe]/g, c => String.fromCharCode(c.charCodeAt(0) - 0x60))
+        .replace(/\\s+/g, '');
+    }
+
+    const cards = Array.from(worksGrid.querySelectorAll('.work-card'));
+    const cardKeys = cards.map(card => [foldKey(card.dataset.title), foldKey(card.dataset.author)]);
+
+    // サジェスト索引: manifest の先頭キーを二分探索し、必要なチャンクだけ取得する
+    const SUGGEST_LIMIT = 10;
+    let suggestManifest = null;
+    const suggestChunks = {};
+    let suggestSeq = 0;
+
+    function loadJSON(url) {
+      return fetch(url).then(res => res.json());
+    }
+
+    function loadChunk(i) {
+      if (!suggestChunks[i]) {
+        suggestChunks[i] = loadJSON(suggestManifest.files[i]);
+      }
+      return suggestChunks[i];
+    }
+
+    function findChunk(chunks, key) {
+      let lo = 0, hi = chunks.length - 1, found = 0;
+      while (lo <= hi) {
+        const mid = (lo + hi) >> 1;
+        if (chunks[mid] <= key) { found = mid; lo = mid + 1; } else { hi = mid - 1; }
+      }
+      return found;
+    }
+
+    async function suggest(key) {
+      if (!suggestManifest) suggestManifest = await loadJSON('suggest/manifest.json');
+      const chunks = suggestManifest.chunks;
+      const results = [];
+      for (let i = findChunk(chunks, key); i < chunks.length && results.length < SUGGEST_LIMIT; i++) {
+        if (results.length > 0 && !chunks[i].startsWith(key)) break;
+        for (const entry of await loadChunk(i)) {
+          if (entry[0].startsWith(key)) {
+            results.push(entry);
+            if (results.length >= SUGGEST_LIMIT) break;
+          } else if (entry[0] > key) {
+            return results;
+          }
+        }
+      }
+      return results;
+    }
+
+    function renderSuggestions(entries) {
+      suggestList.textContent = '';
+      entries.forEach(entry => {
+        const li = document.createElement('li');
+        const a = document.createElement('a');
+        a.href = entry[3];
+        a.textContent = entry[1];
+        const sub = document.createElement('span');
+        sub.textContent = entry[2];
+        a.appendChild(sub);
+        li.appendChild(a);
+        suggestList.appendChild(li);
+      });
+      suggestList.style.display = entries.length ? 'block' : 'none';
+    }
+
+    // by_genre.html / by_year.html からのリンク（?genre= / ?year=）で絞り込む
+    const params = new URLSearchParams(location.search);
+    const facetGenre = params.get('genre');
+    const facetYear = params.get('year');
+
+    function filterCards(query) {
       let visibleCount = 0;
 
-      cards.forEach(card => {
-        const title = card.dataset.title.toLowerCase();
-        const author = card.dataset.author.toLowerCase();
-        
-        if (title.includes(query) || author.includes(query)) {
+      cards.forEach((card, i) => {
+        const facetMatch = (!facetGenre || card.dataset.genre === facetGenre)
+          && (!facetYear || card.dataset.year === facetYear);
+        if (facetMatch && (cardKeys[i][0].includes(query) || cardKeys[i][1].includes(query))) {
           card.style.display = 'block';
           visibleCount++;
         } else {
@@ -244,12 +378,29 @@ INDEX_TEMPLATE = '''<!DOCTYPE html>
       });
 
       noResults.style.display = visibleCount === 0 ? 'block' : 'none';
+    }
+
+    if (facetGenre || facetYear) filterCards('');
+
+    searchInput.addEventListener('input', function() {
+      const query = foldKey(this.value);
+      filterCards(query);
+
+      const seq = ++suggestSeq;
+      if (!query) {
+        renderSuggestions([]);
+        return;
+      }
+      suggest(query).then(entries => {
+        if (seq === suggestSeq) renderSuggestions(entries);
+      }).catch(() => renderSuggestions([]));
     });
   </script>
+  <script>if ('serviceWorker' in navigator) navigator.serviceWorker.register('sw.js').catch(() => {});</script>
 </body>
 </html>'''
 
-# 著者別一覧ページ
+# 著者別一覧ページ（著者ディレクトリ：著者名と作品数のみ）
 AUTHOR_TEMPLATE = '''<!DOCTYPE html>
 <html lang="ja">
 <head>
@@ -261,13 +412,86 @@ AUTHOR_TEMPLATE = '''<!DOCTYPE html>
     body { font-family: 'Hiragino Sans', 'Yu Gothic', sans-serif; background: #f8f9fa; }
     header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 40px 20px; text-align: center; }
     header h1 { font-size: 2.2em; }
+    header p { margin-top: 10px; opacity: 0.9; }
     nav { background: #34495e; padding: 15px; position: sticky; top: 0; z-index: 100; }
     nav .container { max-width: 1200px; margin: 0 auto; display: flex; gap: 20px; justify-content: center; flex-wrap: wrap; }
     nav a { color: white; text-decoration: none; padding: 8px 16px; border-radius: 4px; font-weight: bold; }
     nav a:hover { background: rgba(255,255,255,0.2); }
     main { max-width: 1200px; margin: 40px auto; padding: 0 20px; }
+    .initials { display: flex; flex-wrap: wrap; gap: 8px; margin-bottom: 30px; }
+    .initials a { display: inline-block; min-width: 2.2em; text-align: center; padding: 6px 10px; background: white; color: #667eea; border-radius: 6px; text-decoration: none; font-weight: bold; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+    .initial-section { background: white; padding: 25px 30px; border-radius: 12px; margin-bottom: 20px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
+    .initial-section h2 { color: #2c3e50; margin-bottom: 15px; font-size: 1.5em; border-bottom: 3px solid #667eea; padding-bottom: 8px; }
+    .author-list { display: grid; grid-template-columns: repeat(auto-fill, minmax(220px, 1fr)); gap: 10px; list-style: none; }
+    .author-list a { color: #667eea; text-decoration: none; font-weight: bold; }
+    .author-list a:hover { text-decoration: underline; }
+    .author-list .count { color: #999; font-size: 0.9em; margin-left: 5px; }
+    footer { background: #2c3e50; color: white; padding: 40px 20px; text-align: center; margin-top: 80px; }
+  </style>
+</head>
+<body>
+  <header>
+    <h1>📝 著者別一覧</h1>
+    <p>{{ total_authors }}人の著者</p>
+  </header>
+
+  <nav>
+    <div class="container">
+      <a href="index.html">全作品</a>
+      <a href="by_author.html">著者別</a>
+      <a href="by_year.html">年代別</a>
+      <a href="by_genre.html">ジャンル別</a>
+    </div>
+  </nav>
+
+  <main>
+    <div class="initials">
+      {% for initial in initials %}
+      <a href="#initial-{{ loop.index }}">{{ initial.label }}</a>
+      {% endfor %}
+    </div>
+
+    {% for initial in initials %}
+    <section class="initial-section" id="initial-{{ loop.index }}">
+      <h2>{{ initial.label }}</h2>
+      <ul class="author-list">
+        {% for author in initial.authors %}
+        <li><a href="{{ author.filename }}">{{ author.name }}</a><span class="count">({{ author.count }}作品)</span></li>
+        {% endfor %}
+      </ul>
+    </section>
+    {% endfor %}
+  </main>
+
+  <footer>
+    <p>&copy; 2025 LitLite -要約文庫-</p>
+  </footer>
+  <script>if ('serviceWorker' in navigator) navigator.serviceWorker.register('sw.js').catch(() => {});</script>
+</body>
+</html>'''
+
+# 著者ページ（authors/ 配下に1著者1ページ）
+AUTHOR_PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="ja">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <meta name="description" content="{{ author }}の作品{{ works|length }}作品のあらすじ・要約一覧。">
+  <title>{{ author }}の作品一覧 - LitLite -要約文庫-</title>
+  <style>
+    * { margin: 0; padding: 0; box-sizing: border-box; }
+    body { font-family: 'Hiragino Sans', 'Yu Gothic', sans-serif; background: #f8f9fa; }
+    header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 40px 20px; text-align: center; }
+    header h1 { font-size: 2.2em; }
+    header p { margin-top: 10px; opacity: 0.9; }
+    nav { background: #34495e; padding: 15px; position: sticky; top: 0; z-index: 100; }
+    nav .container { max-width: 1200px; margin: 0 auto; display: flex; gap: 20px; justify-content: center; flex-wrap: wrap; }
+    nav a { color: white; text-decoration: none; padding: 8px 16px; border-radius: 4px; font-weight: bold; }
+    nav a:hover { background: rgba(255,255,255,0.2); }
+    main { max-width: 1200px; margin: 40px auto; padding: 0 20px; }
+    .breadcrumb { margin-bottom: 20px; font-size: 0.9em; color: #666; }
+    .breadcrumb a { color: #667eea; text-decoration: none; }
     .author-section { background: white; padding: 30px; border-radius: 12px; margin-bottom: 25px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
-    .author-section h2 { color: #2c3e50; margin-bottom: 20px; font-size: 1.8em; border-bottom: 3px solid #667eea; padding-bottom: 10px; }
     .works-list { display: grid; gap: 15px; }
     .work-item { padding: 15px; border-left: 4px solid #667eea; background: #f8f9fa; border-radius: 4px; }
     .work-item a { color: #667eea; text-decoration: none; font-size: 1.1em; font-weight: bold; }
@@ -278,26 +502,31 @@ AUTHOR_TEMPLATE = '''<!DOCTYPE html>
 </head>
 <body>
   <header>
-    <h1>📝 著者別一覧</h1>
+    <h1>👤 {{ author }}</h1>
+    <p>{{ works|length }}作品</p>
   </header>
 
   <nav>
     <div class="container">
-      <a href="index.html">全作品</a>
-      <a href="by_author.html">著者別</a>
-      <a href="by_year.html">年代別</a>
-      <a href="by_genre.html">ジャンル別</a>
+      <a href="../index.html">全作品</a>
+      <a href="../by_author.html">著者別</a>
+      <a href="../by_year.html">年代別</a>
+      <a href="../by_genre.html">ジャンル別</a>
     </div>
   </nav>
 
   <main>
-    {% for author_name, works in authors.items() %}
-    <section class="author-section" id="{{ author_name }}">
-      <h2>{{ author_name }} ({{ works|length }}作品)</h2>
+    <div class="breadcrumb">
+      <a href="../index.html">トップ</a> &gt; 
+      <a href="../by_author.html">著者別</a> &gt; 
+      {{ author }}
+    </div>
+
+    <section class="author-section">
       <div class="works-list">
         {% for work in works %}
         <div class="work-item">
-          <a href="{{ work.filename }}">{{ work.title }}</a>
+          <a href="../{{ work.filename }}">{{ work.title }}</a>
           <div class="meta">
             {% if work.year %}{{ work.year }}年{% endif %}
             {% if work.genre %} | {{ work.genre }}{% endif %}
@@ -306,15 +535,331 @@ AUTHOR_TEMPLATE = '''<!DOCTYPE html>
         {% endfor %}
       </div>
     </section>
+  </main>
+
+  <footer>
+    <p>&copy; 2025 LitLite -要約文庫-</p>
+    <p style="margin-top: 10px; opacity: 0.8;">最終更新: {{ date }}</p>
+  </footer>
+  <script>if ('serviceWorker' in navigator) navigator.serviceWorker.register('../sw.js').catch(() => {});</script>
+</body>
+</html>'''
+
+# 年代別・ジャンル別一覧ページ（件数のみのファセット一覧）
+FACET_TEMPLATE = '''<!DOCTYPE html>
+<html lang="ja">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <title>{{ heading }} - LitLite -要約文庫-</title>
+  <style>
+    * { margin: 0; padding: 0; box-sizing: border-box; }
+    body { font-family: 'Hiragino Sans', 'Yu Gothic', sans-serif; background: #f8f9fa; }
+    header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 40px 20px; text-align: center; }
+    header h1 { font-size: 2.2em; }
+    header p { margin-top: 10px; opacity: 0.9; }
+    nav { background: #34495e; padding: 15px; position: sticky; top: 0; z-index: 100; }
+    nav .container { max-width: 1200px; margin: 0 auto; display: flex; gap: 20px; justify-content: center; flex-wrap: wrap; }
+    nav a { color: white; text-decoration: none; padding: 8px 16px; border-radius: 4px; font-weight: bold; }
+    nav a:hover { background: rgba(255,255,255,0.2); }
+    main { max-width: 1200px; margin: 40px auto; padding: 0 20px; }
+    .facet-section { background: white; padding: 25px 30px; border-radius: 12px; margin-bottom: 20px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
+    .facet-section h2 { color: #2c3e50; margin-bottom: 15px; font-size: 1.5em; border-bottom: 3px solid #667eea; padding-bottom: 8px; }
+    .facet-list { display: grid; grid-template-columns: repeat(auto-fill, minmax(200px, 1fr)); gap: 10px; list-style: none; }
+    .facet-list a { color: #667eea; text-decoration: none; font-weight: bold; }
+    .facet-list a:hover { text-decoration: underline; }
+    .facet-list .count { color: #999; font-size: 0.9em; margin-left: 5px; }
+    .empty { text-align: center; padding: 60px 20px; color: #999; font-size: 1.2em; }
+    footer { background: #2c3e50; color: white; padding: 40px 20px; text-align: center; margin-top: 80px; }
+  </style>
+</head>
+<body>
+  <header>
+    <h1>{{ heading }}</h1>
+    <p>{{ summary }}</p>
+  </header>
+
+  <nav>
+    <div class="container">
+      <a href="index.html">全作品</a>
+      <a href="by_author.html">著者別</a>
+      <a href="by_year.html">年代別</a>
+      <a href="by_genre.html">ジャンル別</a>
+    </div>
+  </nav>
+
+  <main>
+    {% for group in groups %}
+    <section class="facet-section">
+      <h2>{{ group.label }}</h2>
+      <ul class="facet-list">
+        {% for item in group['items'] %}
+        <li>{% if item.href %}<a href="{{ item.href }}">{{ item.label }}</a>{% else %}{{ item.label }}{% endif %}<span class="count">({{ item.count }}作品)</span></li>
+        {% endfor %}
+      </ul>
+    </section>
+    {% else %}
+    <div class="empty">まだ分類された作品がありません</div>
     {% endfor %}
   </main>
 
   <footer>
     <p>&copy; 2025 LitLite -要約文庫-</p>
   </footer>
+  <script>if ('serviceWorker' in navigator) navigator.serviceWorker.register('sw.js').catch(() => {});</script>
 </body>
 </html>'''
 
+TEMPLATE_SOURCES = {
+    'work': WORK_TEMPLATE,
+    'index': INDEX_TEMPLATE,
+    'author': AUTHOR_TEMPLATE,
+    'author_page': AUTHOR_PAGE_TEMPLATE,
+    'facet': FACET_TEMPLATE,
+}
+
+
+# ============================================================
+# テンプレートの圧縮・読み込み
+# ============================================================
+
+# 空白をそのまま残す要素（.summary-text は pre-wrap なので一切触らない）
+_PRESERVE_RE = re.compile(
+    r'<style\b[^>]*>.*?</style>'
+    r'|<script\b[^>]*>.*?</script>'
+    r'|<(?:pre|textarea)\b[^>]*>.*?</(?:pre|textarea)>'
+    r'|<div class="summary-text">.*?</div>',
+    re.S
+)
+# タグ・制御ブロック同士の間の改行を含む空白
+_BETWEEN_TAGS_RE = re.compile(r'(>|%\})\s*\n\s*(<|\{%)')
+_NEWLINE_SPACE_RE = re.compile(r'\s*\n\s*')
+
+# テンプレート名 -> (元のバイト数, 圧縮後のバイト数)
+TEMPLATE_STATS = {}
+# テンプレート名 -> レンダリング回数
+RENDER_COUNTS = {}
+# テンプレート名 -> 描画に使ったバックエンド（"fast" / "jinja2"）
+TEMPLATE_BACKENDS = {}
+OUTPUT_STATS = {'files': 0, 'bytes': 0, 'unchanged': 0}
+# 書き出したファイルの {相対パス: [サイズ, mtime_ns, ハッシュ]}（OUTPUT_DIR の隣の .hashes.json に保存）
+OUTPUT_HASHES = None
+# 読み込んでから変わった記録 {相対パス: [サイズ, mtime_ns, ハッシュ] または None（削除）}
+_output_hash_changes = {}
+# 書き出し先のアーカイブ（site_pack.PackWriter）。None なら OUTPUT_DIR にファイルを書く
+OUTPUT_SINK = None
+_compiled_templates = {}
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{}:;,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    # 改行は ASI のために残し、インデントと空行だけ落とす
+    return '\n'.join(line.strip() for line in js.splitlines() if line.strip())
+
+
+def _minify_preserved(block):
+    if block.startswith('<style'):
+        open_end = block.index('>') + 1
+        return block[:open_end] + minify_css(block[open_end:-len('</style>')]) + '</style>'
+    if block.startswith('<script'):
+        open_end = block.index('>') + 1
+        return block[:open_end] + minify_js(block[open_end:-len('</script>')]) + '</script>'
+    return block
+
+
+def minify_html(src):
+    # 保護する要素はタグ形のプレースホルダに置き換えてから空白を畳む
+    preserved = []
+
+    def stash(m):
+        preserved.append(_minify_preserved(m.group(0)))
+        return f'<\x00{len(preserved) - 1}>'
+
+    html = _PRESERVE_RE.sub(stash, src)
+    html = _BETWEEN_TAGS_RE.sub(r'\1\2', html)
+    html = _NEWLINE_SPACE_RE.sub(' ', html).strip()
+    return re.sub(r'<\x00(\d+)>', lambda m: preserved[int(m.group(1))], html)
+
+
+def get_template(name):
+    """テンプレートを初回のみ圧縮・コンパイルして返す"""
+    template = _compiled_templates.get(name)
+    if template is None:
+        source = TEMPLATE_SOURCES[name]
+        minified = minify_html(source) if MINIFY_TEMPLATES else source
+        TEMPLATE_STATS[name] = (len(source.encode('utf-8')), len(minified.encode('utf-8')))
+        if RENDER_BACKEND == "fast":
+            import fast_template
+            template = fast_template.compile_template(minified)
+        if template is None:
+            # Jinja2 の読み込みは重いので、実際に描画するときまで遅らせる
+            from jinja2 import Template
+            template = Template(minified, autoescape=True)
+            TEMPLATE_BACKENDS[name] = "jinja2"
+        else:
+            TEMPLATE_BACKENDS[name] = "fast"
+        _compiled_templates[name] = template
+    return template
+
+
+def set_render_backend(backend):
+    """描画方式を切り替え、コンパイル済みのテンプレートを捨てる"""
+    global RENDER_BACKEND
+    RENDER_BACKEND = backend
+    _compiled_templates.clear()
+    TEMPLATE_BACKENDS.clear()
+
+
+def render_template(name, **context):
+    RENDER_COUNTS[name] = RENDER_COUNTS.get(name, 0) + 1
+    return get_template(name).render(**context)
+
+
+def _output_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _hashes_path():
+    return f"{OUTPUT_DIR.rstrip('/')}.hashes.json"
+
+
+def _output_hashes():
+    global OUTPUT_HASHES
+    if OUTPUT_HASHES is None:
+        try:
+            with open(_hashes_path(), encoding="utf-8") as f:
+                OUTPUT_HASHES = json.load(f)
+        except (OSError, ValueError):
+            OUTPUT_HASHES = {}
+    return OUTPUT_HASHES
+
+
+def _record_output(relpath, st, digest):
+    entry = [st.st_size, st.st_mtime_ns, digest]
+    _output_hashes()[relpath] = entry
+    _output_hash_changes[relpath] = entry
+
+
+def output_hash_changes():
+    """このプロセスで変わったハッシュの記録を返す（シャードはこれをフラグメントとして渡す）"""
+    return dict(_output_hash_changes)
+
+
+def apply_output_hash_changes(changes):
+    """別プロセスの output_hash_changes() を取り込む（次の save_output_hashes() で保存される）"""
+    hashes = _output_hashes()
+    for relpath, entry in changes.items():
+        if entry is None:
+            hashes.pop(relpath, None)
+        else:
+            hashes[relpath] = entry
+        _output_hash_changes[relpath] = entry
+
+
+def save_output_hashes():
+    """書き出したファイルのハッシュを保存する（ビルドの最後に呼ぶ。保存しなくても次回は中身を読んで比べるだけ）
+
+    同じ OUTPUT_DIR に並列で書くプロセス（シャード）からは呼ばず、最後に1プロセスだけが保存する。
+    """
+    if not _output_hash_changes:
+        return
+    tmp_path = _hashes_path() + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(OUTPUT_HASHES, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, _hashes_path())
+    _output_hash_changes.clear()
+
+
+def _unchanged(relpath, path, data, digest):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != len(data):
+        return False
+    # 前回書いたときからサイズ・更新日時が変わっていなければ、記録したハッシュだけで比べる
+    known = _output_hashes().get(relpath)
+    if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+        return known[2] == digest
+    # 記録がない（初回・よそで書き換えられた）ファイルだけ中身を読んで比べ、以後のために記録する
+    with open(path, "rb") as f:
+        same = f.read() == data
+    if same:
+        _record_output(relpath, st, digest)
+    return same
+
+
+def write_output(relpath, text):
+    """OUTPUT_DIR 配下にファイルを書き出し、出力サイズを記録する
+
+    中身が前回と同じファイルは書き込まない（更新日時が変わらないので rsync・CDN の差分が小さくなる）。
+    """
+    data = text.encode('utf-8') if isinstance(text, str) else text
+    path = os.path.join(OUTPUT_DIR, relpath)
+    OUTPUT_STATS['files'] += 1
+    OUTPUT_STATS['bytes'] += len(data)
+    if OUTPUT_SINK is not None:
+        # 前回のアーカイブと同じ中身なら圧縮し直さずに写される
+        if OUTPUT_SINK.add(relpath, data):
+            OUTPUT_STATS['unchanged'] += 1
+        return
+    digest = _output_hash(data)
+    if _unchanged(relpath, path, data, digest):
+        OUTPUT_STATS['unchanged'] += 1
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    _record_output(relpath, os.stat(path), digest)
+
+
+def read_output(relpath):
+    """書き出し済みのファイルの中身を返す。なければ None"""
+    if OUTPUT_SINK is not None:
+        return OUTPUT_SINK.read(relpath)
+    try:
+        with open(os.path.join(OUTPUT_DIR, relpath), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def output_pack(path, inherit=False):
+    """ブロック内の write_output をアーカイブ path に書き、正常に抜けたら path を置き換える
+
+    inherit=True（差分ビルド）なら、書かなかったページは前回のアーカイブから引き継ぐ。
+    """
+    global OUTPUT_SINK
+    with site_pack.PackWriter(path, base=path, inherit=inherit) as sink:
+        OUTPUT_SINK = sink
+        try:
+            yield sink
+        finally:
+            OUTPUT_SINK = None
+    print(f"🗜️ アーカイブ: {path} ({os.path.getsize(path) / 1024:.1f} KB,"
+          f" 前回から流用 {sink.reused}件)")
+
+
+def report_output_size():
+    saved = 0
+    for name, (raw, minified) in TEMPLATE_STATS.items():
+        saved += (raw - minified) * RENDER_COUNTS.get(name, 0)
+    print(f"📦 出力: {OUTPUT_STATS['files']}ファイル / {OUTPUT_STATS['bytes'] / 1024:.1f} KB"
+          f" (変更なし {OUTPUT_STATS['unchanged']}ファイルは書き込みを省略)")
+    for name, (raw, minified) in sorted(TEMPLATE_STATS.items()):
+        print(f"   {name}: テンプレート {raw:,} → {minified:,} bytes "
+              f"(-{(raw - minified) * 100 / raw:.0f}%) × {RENDER_COUNTS.get(name, 0)}回"
+              f" [{TEMPLATE_BACKENDS.get(name, '-')}]")
+    if saved:
+        print(f"   テンプレート圧縮による削減: 約 {saved / 1024:.1f} KB")
+
 
 # ============================================================
 # 関数
@@ -328,123 +873,800 @@ def sanitize_filename(text):
     return text[:100] if text else "untitled"
 
 
-def get_all_works():
+def work_filename(work):
+    return f"{sanitize_filename(work['title'])}.html"
+
+
+def author_filename(author):
+    return f"{AUTHOR_DIR}/{sanitize_filename(author)}.html"
+
+
+def get_all_works(conn):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
         cur = conn.cursor()
-        cur.execute("SELECT * FROM summaries ORDER BY author, year")
-        rows = [dict(row) for row in cur.fetchall()]
-        conn.close()
-        return rows
+        cur.row_factory = sqlite3.Row
+        summary_codec.load_dictionaries(conn)
+        cur.execute("SELECT * FROM summaries ORDER BY author, year, id")
+        return [dict(row) for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        print(f"❌ DBエラー: {e}")
+        return []
+
+
+def iter_all_works(conn, batch_size=500):
+    """get_all_works と同じ順で作品を batch_size 件ずつ読みながら返す（全件をメモリに載せない）"""
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    summary_codec.load_dictionaries(conn)
+    cur.execute("SELECT * FROM summaries ORDER BY author, year, id")
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            yield dict(row)
+
+
+def _chunks(ids, size=900):
+    # SQLite のパラメータ数の上限（既定 999）を超えないように分ける
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def get_works_by_id(conn, ids):
+    cur = conn.cursor()
+    cur.row_factory = sqlite3.Row
+    summary_codec.load_dictionaries(conn)
+    works = []
+    for chunk in _chunks(ids):
+        cur.execute(f"SELECT * FROM summaries WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        works.extend(dict(row) for row in cur.fetchall())
+    return works
+
+
+def get_related_works(conn, ids=None):
+    """related_works.py で事前計算した関連作品を {作品ID: [作品, ...]} で返す（ids で絞り込み可）"""
+    related = {}
+    query = """
+        SELECT r.summary_id, s.id, s.title, s.author
+        FROM related_works r
+        JOIN summaries s ON s.id = r.related_id
+        {where}
+        ORDER BY r.summary_id, r.rank
+    """
+    if ids is None:
+        batches = [(query.format(where=""), ())]
+    else:
+        batches = [(query.format(where=f"WHERE r.summary_id IN ({','.join('?' * len(chunk))})"), chunk)
+                   for chunk in _chunks(ids)]
+    try:
+        rows = [row for sql, params in batches for row in conn.execute(sql, params)]
+        for summary_id, related_id, title, author in rows:
+            related.setdefault(summary_id, []).append({
+                'id': related_id,
+                'title': title,
+                'author': author,
+                'filename': work_filename({'title': title})
+            })
+    except sqlite3.Error:
+        # 関連作品を未計算の DB では何も表示しない
+        pass
+    return related
+
+
+def get_author_works(conn, author):
+    # idx_author を使って1著者分だけ読む
+    try:
+        cur = conn.cursor()
+        cur.row_factory = sqlite3.Row
+        summary_codec.load_dictionaries(conn)
+        cur.execute("SELECT * FROM summaries WHERE author = ? ORDER BY year", (author,))
+        return [dict(row) for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        print(f"❌ DBエラー: {e}")
+        return []
+
+
+def get_facet_counts(conn):
+    """トリガーで保守している集計テーブルから {ファセット: [(値, 作品数), ...]} を返す
+
+    集計テーブルがない（マイグレーション前の）DB では None を返す。
+    """
+    try:
+        return {
+            'authors': conn.execute("SELECT author, works FROM author_counts ORDER BY author").fetchall(),
+            'genres': conn.execute("SELECT genre, works FROM genre_counts ORDER BY genre").fetchall(),
+            'years': conn.execute("SELECT year, works FROM year_counts ORDER BY year").fetchall(),
+            'tags': conn.execute("""
+                SELECT t.name, c.works FROM tag_counts c JOIN tags t ON t.id = c.tag_id ORDER BY t.name
+            """).fetchall(),
+        }
+    except sqlite3.Error:
+        return None
+
+
+def facet_counts_from(works_data):
+    """集計テーブルが使えないときに、索引エントリから同じ形の集計を作る"""
+    counts = {'authors': {}, 'genres': {}, 'years': {}}
+    for work in works_data:
+        # 年は集計テーブルと同じく整数のものだけを数える
+        year = work.get('year') if isinstance(work.get('year'), int) else None
+        for facet, value in (('authors', work['author']), ('genres', work.get('genre')), ('years', year)):
+            if value is not None:
+                counts[facet][value] = counts[facet].get(value, 0) + 1
+    facets = {facet: sorted(values.items()) for facet, values in counts.items()}
+    facets['tags'] = []
+    return facets
+
+
+def get_author_counts(conn):
+    # 集計テーブルがあればそれを読み、なければ idx_author の順序どおりに走査して数える
+    facets = get_facet_counts(conn)
+    if facets is not None:
+        return facets['authors']
+    try:
+        return conn.execute("SELECT author, COUNT(*) FROM summaries GROUP BY author ORDER BY author").fetchall()
     except sqlite3.Error as e:
         print(f"❌ DBエラー: {e}")
         return []
 
 
-def generate_work_page(work):
-    template = Template(WORK_TEMPLATE, autoescape=True)
-    html = template.render(
+def today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def work_page_html(work, related=None, date=None):
+    return render_template(
+        'work',
         title=work['title'],
         author=work['author'],
         year=work.get('year'),
         genre=work.get('genre'),
         length=work.get('length'),
-        summary=work['summary'],
+        # 桁区切りはここで済ませ、テンプレートは変数の差し込みだけにする
+        char_count=f"{work['char_count']:,}" if work.get('char_count') else None,
+        summary=summary_codec.decode_summary(work['summary']),
         source_url=work['source_url'],
-        date=datetime.now().strftime("%Y-%m-%d")
+        author_page=author_filename(work['author']),
+        related=related or [],
+        date=date or today()
     )
+
+
+def generate_work_page(work, related=None):
+    html = work_page_html(work, related)
+    filename = work_filename(work)
+    write_output(filename, html)
+    if EMIT_API:
+        write_output(api_work_path(work['id']), dump_json(work_api_doc(work, related)))
     
-    filename = f"{sanitize_filename(work['title'])}.html"
-    filepath = os.path.join(OUTPUT_DIR, filename)
+    return filename
+
+
+def work_excerpt(summary):
+    """一覧カードの抜粋（export_db.py の excerpt 列も同じ規則で作る）"""
+    # 圧縮された要約でも抜粋に必要な先頭部分だけを展開する
+    return (summary_codec.decode_summary_prefix(summary, EXCERPT_CHARS) or '').replace('\\n', ' ') + '...'
+
+
+def index_entry(work):
+    excerpt = work_excerpt(work['summary'])
+    return {
+        'id': work.get('id'),
+        'title': work['title'],
+        'author': work['author'],
+        'year': work.get('year'),
+        'genre': work.get('genre'),
+        'excerpt': excerpt,
+        'filename': work_filename(work)
+    }
+
+
+def index_order(entry):
+    """get_all_works の ORDER BY author, year, id と同じ順序になるソートキー（NULL が先、数値は文字列より前）"""
+    year = entry.get('year')
+    if year is None:
+        return (entry['author'], 0, 0, entry['id'])
+    return (entry['author'], 2 if isinstance(year, str) else 1, year, entry['id'])
+
+
+def build_target(pack=None):
+    """ハイウォーターマークと索引エントリを覚えておく出力先の名前（--pack ならアーカイブ、なければ OUTPUT_DIR）"""
+    return os.path.normpath(pack or OUTPUT_DIR)
+
+
+def load_index_entries(conn, target, hwm):
+    """target への前回のビルドが保存した索引エントリを一覧の順で返す。hwm 時点のものでなければ None"""
+    try:
+        row = conn.execute("SELECT index_change_id FROM build_targets WHERE target = ?", (target,)).fetchone()
+        if row is None or row[0] != hwm:
+            return None
+        cur = conn.execute(f"""
+            SELECT summary_id, {', '.join(INDEX_ENTRY_COLUMNS[1:])} FROM index_entries
+            WHERE target = ? ORDER BY author, year, summary_id
+        """, (target,))
+        return [dict(zip(INDEX_ENTRY_COLUMNS, row)) for row in cur]
+    except sqlite3.Error:
+        return None
+
+
+def save_index_entries(db_path, target, cache, change_id):
+    """target へのビルドに使った索引エントリを保存し、change_id までの変更を反映済みとして記録する"""
+    conn = db.connect(db_path)
+    with conn:
+        if cache['replace']:
+            conn.execute("DELETE FROM index_entries WHERE target = ?", (target,))
+        conn.executemany("DELETE FROM index_entries WHERE target = ? AND summary_id = ?",
+                         [(target, i) for i in cache['deleted']])
+        conn.executemany(
+            f"INSERT OR REPLACE INTO index_entries (target, summary_id, {', '.join(INDEX_ENTRY_COLUMNS[1:])})"
+            f" VALUES (?, {', '.join('?' * len(INDEX_ENTRY_COLUMNS))})",
+            [(target,) + tuple(entry[c] for c in INDEX_ENTRY_COLUMNS) for entry in cache['entries']]
+        )
+        conn.execute("""
+            INSERT INTO build_targets (target, index_change_id) VALUES (?, ?)
+            ON CONFLICT(target) DO UPDATE SET index_change_id = excluded.index_change_id
+        """, (target, change_id))
+    conn.close()
+
+
+def index_html(works_data, facets=None, date=None):
+    # 統計は集計テーブルの行数だけで決まる。なければ索引エントリから数える
+    if facets is None:
+        facets = facet_counts_from(works_data)
     
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(html)
+    return render_template(
+        'index',
+        works=works_data,
+        total_works=len(works_data),
+        total_authors=len(facets['authors']),
+        total_genres=len(facets['genres']),
+        date=date or today()
+    )
+
+
+def render_index(works_data, facets=None):
+    write_output("index.html", index_html(works_data, facets))
+
+
+def author_page_html(author, works_data, date=None):
+    return render_template(
+        'author_page',
+        author=author,
+        works=works_data,
+        date=date or today()
+    )
+
+
+def generate_author_page(author, works_data):
+    """1著者分のページを authors/ 配下に生成"""
+    write_output(author_filename(author), author_page_html(author, works_data))
+
+
+def count_authors(works_data):
+    # works_data は著者順に並んでいる前提
+    return [(author, sum(1 for _ in group))
+            for author, group in groupby(works_data, key=lambda w: w['author'])]
+
+
+def author_directory_html(author_counts):
+    initials = []
+    for initial, group in groupby(sorted(author_counts), key=lambda a: a[0][:1]):
+        initials.append({
+            'label': initial,
+            'authors': [
+                {'name': author, 'count': count, 'filename': author_filename(author)}
+                for author, count in group
+            ]
+        })
     
-    return filename
+    return render_template(
+        'author',
+        initials=initials,
+        total_authors=len(author_counts)
+    )
+
+
+def render_author_directory(author_counts):
+    """著者名と作品数だけの軽量な著者ディレクトリ（by_author.html）を生成"""
+    write_output("by_author.html", author_directory_html(author_counts))
 
 
 def generate_index(works):
-    works_data = []
-    for work in works:
-        excerpt = work['summary'][:80].replace('\\n', ' ') + '...'
-        works_data.append({
-            'title': work['title'],
-            'author': work['author'],
-            'year': work.get('year'),
-            'genre': work.get('genre'),
-            'excerpt': excerpt,
-            'filename': f"{sanitize_filename(work['title'])}.html"
+    render_index([index_entry(work) for work in works])
+
+
+def facet_pages_html(facets):
+    """年代別・ジャンル別一覧を {出力パス: HTML} で返す"""
+    pages = {}
+    decades = []
+    for decade, group in groupby(facets['years'], key=lambda y: y[0] // 10 * 10):
+        decades.append({
+            'label': f"{decade}年代",
+            'items': [{'label': f"{year}年", 'count': count, 'href': f"index.html?{urlencode({'year': year})}"}
+                      for year, count in group]
         })
-    
-    authors = set(w['author'] for w in works)
-    genres = set(w.get('genre') for w in works if w.get('genre'))
-    
-    template = Template(INDEX_TEMPLATE, autoescape=True)
-    html = template.render(
-        works=works_data,
-        total_works=len(works),
-        total_authors=len(authors),
-        total_genres=len(genres),
-        date=datetime.now().strftime("%Y-%m-%d")
+    pages["by_year.html"] = render_template(
+        'facet',
+        heading="📅 年代別一覧",
+        summary=f"{sum(c for _, c in facets['years'])}作品 / {len(facets['years'])}年",
+        groups=decades
     )
     
-    with open(os.path.join(OUTPUT_DIR, "index.html"), "w", encoding="utf-8") as f:
-        f.write(html)
+    genres = [{
+        'label': "ジャンル",
+        'items': [{'label': genre, 'count': count, 'href': f"index.html?{urlencode({'genre': genre})}"}
+                  for genre, count in facets['genres']]
+    }] if facets['genres'] else []
+    if facets['tags']:
+        genres.append({
+            'label': "タグ",
+            # 一覧ページはタグで絞り込めないので、タグはリンクにせず件数だけを出す
+            'items': [{'label': tag, 'count': count, 'href': None} for tag, count in facets['tags']]
+        })
+    pages["by_genre.html"] = render_template(
+        'facet',
+        heading="📖 ジャンル別一覧",
+        summary=f"{len(facets['genres'])}ジャンル",
+        groups=genres
+    )
+    return pages
+
+
+def render_facet_pages(facets):
+    """年代別（by_year.html）・ジャンル別（by_genre.html）の一覧を生成"""
+    for relpath, html in facet_pages_html(facets).items():
+        write_output(relpath, html)
+
+
+# ============================================================
+# JSON API
+# ============================================================
+
+def dump_json(obj):
+    """API 用の JSON をバイト列で返す（orjson があれば使い、なければ標準の json）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def api_work_path(work_id):
+    return f"{API_DIR}/works/{work_id}.json"
+
+
+def api_author_path(author):
+    return f"{API_DIR}/authors/{sanitize_filename(author)}.json"
+
+
+def api_genre_path(genre):
+    return f"{API_DIR}/genres/{sanitize_filename(genre)}.json"
+
+
+def api_list_path(page):
+    return f"{API_DIR}/works/page-{page}.json"
+
+
+def work_api_doc(work, related=None):
+    return {
+        'id': work['id'],
+        'title': work['title'],
+        'author': work['author'],
+        'author_reading': work.get('author_reading'),
+        'year': work.get('year'),
+        'genre': work.get('genre'),
+        'length': work.get('length'),
+        'char_count': work.get('char_count'),
+        'summary': summary_codec.decode_summary(work['summary']),
+        'source_url': work['source_url'],
+        'html': work_filename(work),
+        'author_api': api_author_path(work['author']),
+        'related': [
+            {'id': r['id'], 'title': r['title'], 'author': r['author'], 'api': api_work_path(r['id'])}
+            for r in related or []
+        ],
+    }
+
+
+def api_entry(entry):
+    """索引エントリを一覧 API の1件分に変換する"""
+    return {
+        'id': entry['id'],
+        'title': entry['title'],
+        'author': entry['author'],
+        'year': entry['year'],
+        'genre': entry['genre'],
+        'excerpt': entry['excerpt'],
+        'html': entry['filename'],
+        'api': api_work_path(entry['id']),
+    }
+
+
+def author_api_doc(author, works_data):
+    return dump_json({
+        'author': author,
+        'count': len(works_data),
+        'html': author_filename(author),
+        'works': [api_entry(w) for w in works_data],
+    })
+
+
+def generate_author_api(author, works_data):
+    write_output(api_author_path(author), author_api_doc(author, works_data))
+
+
+def changed_api_pages(old, new):
+    """一覧 API のうち中身が変わるページ番号を返す（件数が変わると全ページの total が変わる）"""
+    if len(old) != len(new):
+        return set(range(1, max(1, -(-len(new) // API_PAGE_SIZE)) + 1))
+    return {i // API_PAGE_SIZE + 1 for i, (a, b) in enumerate(zip(old, new)) if a != b}
+
+
+def api_list_files(works_data, facets, touched=None):
+    """一覧 API の {相対パス: JSON} と、ページ数・著者一覧・ジャンル一覧を返す（serve.py も使う）
+
+    touched（差分ビルド）を渡すと、そこに挙がらない一覧ページ・著者・ジャンルのファイルは省く。
+    """
+    files = {}
+    total = len(works_data)
+    pages = max(1, -(-total // API_PAGE_SIZE))
+    for page in range(1, pages + 1):
+        if touched is not None and page not in touched['pages']:
+            continue
+        chunk = works_data[(page - 1) * API_PAGE_SIZE:page * API_PAGE_SIZE]
+        files[api_list_path(page)] = dump_json({
+            'page': page,
+            'pages': pages,
+            'total': total,
+            'next': api_list_path(page + 1) if page < pages else None,
+            'works': [api_entry(w) for w in chunk],
+        })
+
+    # works_data は著者順なので、著者ごとにまとめて1回で書ける
+    authors = []
+    for author, group in groupby(works_data, key=lambda w: w['author']):
+        group = list(group)
+        if touched is None or author in touched['authors']:
+            files[api_author_path(author)] = author_api_doc(author, group)
+        authors.append({'author': author, 'count': len(group), 'api': api_author_path(author)})
+    files[f"{API_DIR}/authors/index.json"] = dump_json({'authors': authors})
+
+    by_genre = {}
+    for entry in works_data:
+        if entry.get('genre'):
+            by_genre.setdefault(entry['genre'], []).append(entry)
+    genres = []
+    for genre, entries in sorted(by_genre.items()):
+        if touched is None or genre in touched['genres']:
+            files[api_genre_path(genre)] = dump_json({
+                'genre': genre, 'count': len(entries), 'works': [api_entry(e) for e in entries]})
+        genres.append({'genre': genre, 'count': len(entries), 'api': api_genre_path(genre)})
+    files[f"{API_DIR}/genres/index.json"] = dump_json({'genres': genres})
+
+    files[f"{API_DIR}/index.json"] = dump_json({
+        'version': 1,
+        'total_works': total,
+        'total_authors': len(authors),
+        'total_genres': len(genres),
+        'years': [{'year': year, 'count': count} for year, count in facets['years']],
+        'works': api_list_path(1),
+        'authors': f"{API_DIR}/authors/index.json",
+        'genres': f"{API_DIR}/genres/index.json",
+    })
+    return files, pages, authors, genres
+
+
+def generate_api_lists(works_data, facets, touched=None):
+    """作品一覧（ページ分割）・著者別・ジャンル別の一覧 API を出力
+
+    touched（差分ビルド）を渡すと、そこに挙がった一覧ページ・著者・ジャンルのファイルだけを書き直す。
+    """
+    # 前回の一覧にあって今回なくなる著者・ジャンルのファイルを消すため、書き換える前に読んでおく
+    previous = {}
+    for key in ('authors', 'genres'):
+        data = read_output(f"{API_DIR}/{key}/index.json")
+        try:
+            previous[key] = {item['api'] for item in json.loads(data)[key]} if data else set()
+        except (ValueError, KeyError, TypeError):
+            previous[key] = set()
+    files, pages, authors, genres = api_list_files(works_data, facets, touched)
+    for relpath, data in files.items():
+        write_output(relpath, data)
+    # 件数が減って余ったページ（ページは 1 から連番なので、最初に見つからなかったところで止まる）
+    page = pages + 1
+    while remove_output(api_list_path(page)):
+        page += 1
+    # 作品がなくなった著者・ジャンル
+    for key, current in (('authors', authors), ('genres', genres)):
+        for path in sorted(previous[key] - {item['api'] for item in current}):
+            remove_output(path)
+    if touched is not None:
+        genre_names = {item['genre'] for item in genres}
+        for genre in touched['genres'] - genre_names:
+            remove_output(api_genre_path(genre))
+    return pages
+
+
+def generate_suggest_index(works_data, author_counts):
+    """検索ボックス用の前方一致サジェスト索引を suggest/ 配下に出力
+
+    チャンクは中身のハッシュつきの名前なので、使われなくなったものを消す。ただし前回の manifest.json に
+    載っていたチャンクは、古い manifest.json を先読みしたままのクライアントのために1回分だけ残す。
+    """
+    entries = suggest_index.build_entries(works_data, author_counts, author_filename)
+    files = suggest_index.build_chunks(entries)
+    previous = suggest_index.chunk_files(read_output(suggest_index.MANIFEST_PATH))
+    retired_data = read_output(SUGGEST_RETIRED_PATH)
+    try:
+        retired = set(json.loads(retired_data)) if retired_data else set()
+    except ValueError:
+        retired = set()
+    for relpath, text in files.items():
+        write_output(relpath, text)
+    current = set(files)
+    for relpath in sorted(retired - current - previous):
+        remove_output(relpath)
+    write_output(SUGGEST_RETIRED_PATH, json.dumps(sorted(previous - current), ensure_ascii=False))
+    return len(entries)
+
+
+def generate_service_worker():
+    """出力済みの一覧ページのハッシュから precache マニフェストと sw.js を生成し、更新したかを返す
+
+    中身が前回と同じなら sw.js も同じバイト列になり、write_output が書き込みを省く。
+    """
+    pages = {}
+    for relpath in service_worker.PRECACHE_PAGES:
+        data = read_output(relpath)
+        if data is not None:
+            pages[relpath] = data
+    files = service_worker.build_files(pages)
+    manifest = files[service_worker.MANIFEST_PATH].encode('utf-8')
+    changed = read_output(service_worker.MANIFEST_PATH) != manifest
+    for relpath, text in files.items():
+        write_output(relpath, text)
+    return changed
+
+
+def generate_author_pages(works):
+    """著者順の作品列を1回走査して著者ページを生成し、著者ごとの作品数を返す"""
+    author_counts = []
+    for author, group in groupby(works, key=lambda w: w['author']):
+        works_data = [index_entry(work) for work in group]
+        generate_author_page(author, works_data)
+        author_counts.append((author, len(works_data)))
+    return author_counts
 
 
 def generate_author_index(works):
-    authors_dict = {}
+    render_author_directory(generate_author_pages(works))
+
+
+def rebuild_authors(conn, authors):
+    """指定した著者のページと著者ディレクトリだけを再生成"""
+    for author in authors:
+        works = get_author_works(conn, author)
+        if works:
+            works_data = [index_entry(work) for work in works]
+            generate_author_page(author, works_data)
+            if EMIT_API:
+                generate_author_api(author, works_data)
+            print(f"✅ {author} ({len(works)}作品)")
+        else:
+            print(f"⚠️ {author} の作品がありません")
+    
+    render_author_directory(get_author_counts(conn))
+    print(f"✅ 著者別ページ生成")
+    generate_service_worker()
+
+
+def build_site(conn):
+    """conn のスナップショットから全ページを生成し、保存する索引エントリを返す"""
+    works = get_all_works(conn)
+    if not works:
+        print("⚠️ データがありません")
+        return None
+    
+    print(f"📚 {len(works)}件を処理中...\\n")
+    
+    related = get_related_works(conn)
+    
+    # 各作品ページ生成
     for work in works:
-        author = work['author']
-        if author not in authors_dict:
-            authors_dict[author] = []
-        authors_dict[author].append({
-            'title': work['title'],
-            'year': work.get('year'),
-            'genre': work.get('genre'),
-            'filename': f"{sanitize_filename(work['title'])}.html"
-        })
+        generate_work_page(work, related.get(work['id']))
+        print(f"✅ {work['title']}")
+    
+    generate_author_pages(works)
+    works_data = [index_entry(work) for work in works]
+    render_listings(conn, works_data)
     
-    # 著者名でソート
-    authors_dict = dict(sorted(authors_dict.items()))
+    print(f"\\n✨ 完了: {len(works)}作品 + 索引ページを生成")
+    report_output_size()
+    print(f"🌐 確認: {OUTPUT_DIR}/index.html")
+    return {'entries': works_data, 'deleted': set(), 'replace': True}
+
+
+def remove_output(relpath):
+    if OUTPUT_SINK is not None:
+        return OUTPUT_SINK.remove(relpath)
+    if _output_hashes().pop(relpath, None) is not None:
+        _output_hash_changes[relpath] = None
+    try:
+        os.remove(os.path.join(OUTPUT_DIR, relpath))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def build_changed(conn, target, after, until):
+    """change_log の after < id <= until に載った作品・著者のページだけを作り直し、保存する索引エントリを返す
+
+    一覧は前回保存した索引エントリに変わった作品だけを差し替えて組み立てるので、要約を全件読み直さない。
+    """
+    changes = change_log.read_changes(conn, after, until)
+    if not changes['count']:
+        print("✅ 変更なし")
+        return {'entries': [], 'deleted': set(), 'replace': False}
+    print(f"📝 変更 {changes['count']}件: 作品 {len(changes['ids'])} / 削除 {len(changes['deleted'])}"
+          f" / 著者 {len(changes['authors'])}\n")
+    
+    # 変更・削除された作品を関連作品に載せているページも作り直す（idx_related_related_id を使う）
+    touched = sorted(changes['ids'] | changes['deleted'])
+    for chunk in _chunks(touched):
+        changes['ids'].update(row[0] for row in conn.execute(
+            f"SELECT DISTINCT summary_id FROM related_works WHERE related_id IN ({','.join('?' * len(chunk))})",
+            chunk))
+    changes['ids'] -= changes['deleted']
+    
+    ids = sorted(changes['ids'])
+    related = get_related_works(conn, ids)
+    updated = {}
+    for work in get_works_by_id(conn, ids):
+        generate_work_page(work, related.get(work['id']))
+        updated[work['id']] = index_entry(work)
+        print(f"✅ {work['title']}")
+    
+    # 改題・削除で使われなくなったページを消す（同じタイトルの作品が残っていれば消さない）
+    for title in sorted(changes['old_titles']):
+        if conn.execute("SELECT 1 FROM summaries WHERE title = ?", (title,)).fetchone() is None:
+            if remove_output(work_filename({'title': title})):
+                print(f"🗑️ {work_filename({'title': title})}")
+    for summary_id in changes['deleted']:
+        remove_output(api_work_path(summary_id))
+    
+    cached = load_index_entries(conn, target, after)
+    if cached is None:
+        print("ℹ️ 前回の索引エントリがないため、一覧は全作品から作り直します")
+        works_data = [index_entry(work) for work in get_all_works(conn)]
+        listing = None
+        cache = {'entries': works_data, 'deleted': set(), 'replace': True}
+    else:
+        previous = {entry['id']: entry for entry in cached}
+        modified = {i: entry for i, entry in updated.items() if previous.get(i) != entry}
+        removed = changes['deleted'] & previous.keys()
+        works_data = [entry for entry in cached if entry['id'] not in modified and entry['id'] not in removed]
+        works_data.extend(modified.values())
+        works_data.sort(key=index_order)
+        # 変わった作品の変更前・変更後の著者とジャンルの一覧だけを書き直す
+        before = [previous[i] for i in removed | modified.keys() if i in previous]
+        listing = {
+            'changed': bool(modified or removed),
+            'authors': changes['authors'] | {e['author'] for e in before + list(modified.values())},
+            'genres': {e['genre'] for e in before + list(modified.values()) if e.get('genre')},
+            'pages': changed_api_pages(cached, works_data),
+        }
+        cache = {'entries': list(modified.values()), 'deleted': removed, 'replace': False}
     
-    template = Template(AUTHOR_TEMPLATE, autoescape=True)
-    html = template.render(authors=authors_dict)
+    # 著者ページは索引エントリだけで作れる
+    by_author = {}
+    for entry in works_data:
+        if entry['author'] in changes['authors']:
+            by_author.setdefault(entry['author'], []).append(entry)
+    for author in sorted(changes['authors']):
+        if author in by_author:
+            generate_author_page(author, by_author[author])
+        else:
+            remove_output(author_filename(author))
+            remove_output(api_author_path(author))
     
-    with open(os.path.join(OUTPUT_DIR, "by_author.html"), "w", encoding="utf-8") as f:
-        f.write(html)
+    render_listings(conn, works_data, listing)
+    report_output_size()
+    return cache
+
+
+def render_listings(conn, works_data, touched=None):
+    """索引・著者ディレクトリ・年代別/ジャンル別・API 一覧・サジェスト索引を生成
+
+    touched（差分ビルド）を渡すと、一覧に載る項目が変わっていなければ集計ページだけを作り直し、
+    一覧 API は touched に挙がった著者・ジャンル・ページだけを書き直す。
+    """
+    facets = get_facet_counts(conn) or facet_counts_from(works_data)
+    changed = touched is None or touched['changed']
+    if changed:
+        render_index(works_data, facets)
+        print(f"\\n✅ トップページ生成")
+        
+        author_counts = count_authors(works_data)
+        render_author_directory(author_counts)
+        print(f"✅ 著者別ページ生成")
+    
+    # タグの付け替えは一覧に出ないが、ジャンル別ページのタグの件数は変わる
+    render_facet_pages(facets)
+    print(f"✅ 年代別・ジャンル別ページ生成")
+    
+    if EMIT_API:
+        if changed:
+            pages = generate_api_lists(works_data, facets, touched)
+            print(f"✅ JSON API 生成 ({API_DIR}/, 一覧 {pages}ページ)")
+    
+    if changed:
+        count = generate_suggest_index(works_data, author_counts)
+        print(f"✅ サジェスト索引生成 ({count}件)")
+    else:
+        print(f"✅ 一覧に載る項目は変更なし")
+    
+    changed = generate_service_worker()
+    print(f"✅ サービスワーカー生成 ({'precache 更新' if changed else 'precache 変更なし'})")
 
 
 def main():
+    parser = argparse.ArgumentParser(description="LitLite HTML ジェネレーター")
+    parser.add_argument("--author", action="append", metavar="NAME",
+                        help="指定した著者のページだけを再生成（複数指定可）")
+    parser.add_argument("--changed", action="store_true",
+                        help="前回のビルド以降に変更された作品・著者のページだけを再生成")
+    parser.add_argument("--pack", nargs="?", const=PACK_PATH, metavar="PATH",
+                        help=f"ファイルを個別に書かず1つのアーカイブにまとめる（既定: {PACK_PATH}。"
+                             f"export_db.py の db/ は含まない）")
+    args = parser.parse_args()
+    
     if not os.path.exists(DB_PATH):
         print(f"❌ {DB_PATH} が見つかりません")
         print("まず migrate_database.py を実行してください")
         return
-    
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    
-    works = get_all_works()
-    if not works:
-        print("⚠️ データがありません")
+    if args.pack and args.author and not os.path.exists(args.pack):
+        print(f"❌ {args.pack} がありません（先に --pack で全体をビルドしてください）")
         return
     
-    print(f"📚 {len(works)}件を処理中...\\n")
+    if not args.pack:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+    # ハイウォーターマークと索引エントリは出力先ごとに持つ（ディレクトリと --pack で互いに影響しない）
+    target = build_target(args.pack)
     
-    # 各作品ページ生成
-    for work in works:
-        generate_work_page(work)
-        print(f"✅ {work['title']}")
+    if not args.author:
+        # サーバー側の前方一致検索に使う正規化キーを最新にしておく（マイグレーションもここで適用される）。
+        # 差分ビルドでは前回のビルド以降に変更された作品だけを見る
+        ids = change_log.pending_ids(DB_PATH, target) if args.changed else None
+        updated = suggest_index.update_keys(DB_PATH, ids)
+        if updated:
+            print(f"🔤 正規化キーを更新: {updated}件")
     
-    # 索引ページ生成
-    generate_index(works)
-    print(f"\\n✅ トップページ生成")
-    
-    generate_author_index(works)
-    print(f"✅ 著者別ページ生成")
+    # 以降の読み取りはすべて1つのスナップショットから行う。
+    # WAL なのでビルド中も取り込み・編集は止まらず、その変更は次回のビルドに反映される
+    with db.snapshot(DB_PATH) as conn:
+        # スナップショットに含まれる最後の変更まで処理済みにする（以降の変更は次回に回る）
+        hwm = change_log.get_high_water_mark(conn, target)
+        latest = change_log.latest_change_id(conn)
+        # アーカイブに書く差分ビルドは、前回のアーカイブがなければ引き継ぎようがない
+        incremental = args.changed and hwm is not None and not (args.pack and not os.path.exists(args.pack))
+        with output_pack(args.pack, inherit=bool(args.author or incremental)) if args.pack else nullcontext():
+            if args.author:
+                rebuild_authors(conn, args.author)
+                report_output_size()
+            elif incremental:
+                cache = build_changed(conn, target, hwm, latest)
+            else:
+                if args.changed:
+                    print("ℹ️ 前回のビルド位置（--pack では前回のアーカイブ）がないため全体をビルドします\n")
+                cache = build_site(conn)
+    save_output_hashes()
+    if args.author:
+        return
     
-    print(f"\\n✨ 完了: {len(works)}作品 + 索引ページを生成")
-    print(f"🌐 確認: {OUTPUT_DIR}/index.html")
+    if latest is not None:
+        if cache is not None:
+            save_index_entries(DB_PATH, target, cache, latest)
+        change_log.set_high_water_mark(DB_PATH, target, latest)
+        change_log.compact(DB_PATH)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,186 @@
+# ============================================================
+# link_checker.py - 生成サイトの内部リンクチェッカー
+# ============================================================
+#
+# 使い方:
+#   python link_checker.py                  # OUTPUT_DIR を検査
+#   python link_checker.py --jobs 8 DIR     # 並列数と対象ディレクトリを指定
+#
+# 全 HTML をプロセスプールで並列に字句解析し、各ページのアンカー（id / name）と
+# リンク先（href / src）を集めてから、リンク切れ・存在しないアンカー・
+# どこからもリンクされていない孤立ページを報告する。
+# リンク切れがあれば終了コード 1 を返すので、ビルド後にそのまま実行できる。
+
+import argparse
+import html
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote, urlsplit
+
+OUTPUT_DIR = "aozora_summaries"
+
+# どこからもリンクされなくてよい入口ページ
+ROOT_PAGES = {"index.html"}
+# 表示するリンク切れの最大件数
+REPORT_LIMIT = 50
+
+# コメント・script/style の中身は読み飛ばし、開始タグだけを拾う単一パスのトークナイザ
+_TOKEN_RE = re.compile(
+    rb'<!--.*?-->'
+    rb'|<(script|style)\b([^>]*)>.*?</\1\s*>'
+    rb'|<([a-zA-Z][a-zA-Z0-9:-]*)\b([^>]*)>',
+    re.S | re.I
+)
+_ATTR_RE = re.compile(rb'''([a-zA-Z_:][-a-zA-Z0-9_:.]*)\s*=\s*("[^"]*"|'[^']*'|[^\s"'=<>`]+)''')
+
+_LINK_ATTRS = {b'href', b'src'}
+_SKIP_SCHEMES = ('mailto:', 'javascript:', 'data:', 'tel:')
+
+
+def _attrs(raw):
+    for name, value in _ATTR_RE.findall(raw):
+        if value[:1] in (b'"', b"'"):
+            value = value[1:-1]
+        yield name.lower(), html.unescape(value.decode('utf-8', 'replace'))
+
+
+def scan_page(args):
+    """1ページを字句解析して (相対パス, アンカー一覧, リンク一覧) を返す"""
+    root, relpath = args
+    with open(os.path.join(root, relpath), 'rb') as f:
+        data = f.read()
+
+    anchors = []
+    links = []
+    for m in _TOKEN_RE.finditer(data):
+        if m.group(1):
+            tag, raw = m.group(1).lower(), m.group(2)
+        elif m.group(3):
+            tag, raw = m.group(3).lower(), m.group(4)
+        else:
+            continue
+        for name, value in _attrs(raw):
+            if name == b'id' or (name == b'name' and tag == b'a'):
+                anchors.append(value)
+            elif name in _LINK_ATTRS:
+                links.append(value)
+    return relpath, anchors, links
+
+
+def list_pages(root):
+    pages = []
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith('.html'):
+                    pages.append(os.path.relpath(entry.path, root).replace(os.sep, '/'))
+    pages.sort()
+    return pages
+
+
+def resolve_link(page, href):
+    """リンクをサイト内の (相対パス, フラグメント) に解決する。外部リンクなら None"""
+    if href.startswith(_SKIP_SCHEMES) or href.startswith('//'):
+        return None
+    parts = urlsplit(href)
+    if parts.scheme or parts.netloc:
+        return None
+    fragment = unquote(parts.fragment)
+    if not parts.path:
+        return page, fragment
+    path = unquote(parts.path)
+    if path.startswith('/'):
+        target = path.lstrip('/')
+    else:
+        target = os.path.join(os.path.dirname(page), path)
+    target = os.path.normpath(target).replace(os.sep, '/')
+    if path.endswith('/'):
+        target = f"{target}/index.html"
+    return target, fragment
+
+
+def check_site(root=OUTPUT_DIR, jobs=None):
+    started = time.perf_counter()
+    pages = list_pages(root)
+    if not pages:
+        print(f"⚠️ {root} に HTML がありません")
+        return False
+
+    anchors = {}
+    outgoing = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        chunksize = max(1, len(pages) // ((jobs or os.cpu_count() or 1) * 8))
+        for relpath, page_anchors, links in pool.map(scan_page, [(root, p) for p in pages], chunksize=chunksize):
+            anchors[relpath] = set(page_anchors)
+            outgoing[relpath] = links
+    scanned = time.perf_counter()
+
+    dangling = []        # (ページ, リンク, 理由)
+    inbound = set()
+    other_files = {}
+    n_links = 0
+    for page, links in outgoing.items():
+        for href in links:
+            resolved = resolve_link(page, href)
+            if resolved is None:
+                continue
+            n_links += 1
+            target, fragment = resolved
+            if target in anchors:
+                if target != page:
+                    inbound.add(target)
+                if fragment and fragment not in anchors[target]:
+                    dangling.append((page, href, "アンカーなし"))
+            else:
+                # HTML 以外（画像・JSON など）はファイルの存在だけを確認する
+                exists = other_files.get(target)
+                if exists is None:
+                    exists = other_files[target] = os.path.isfile(os.path.join(root, target))
+                if not exists:
+                    dangling.append((page, href, "ファイルなし"))
+
+    orphans = [p for p in pages if p not in inbound and p not in ROOT_PAGES]
+    elapsed = time.perf_counter() - started
+
+    print(f"🔍 {len(pages)}ページ / 内部リンク {n_links}件を検査 "
+          f"(解析 {scanned - started:.2f}秒, 合計 {elapsed:.2f}秒)")
+
+    if dangling:
+        by_link = {}
+        for page, href, reason in dangling:
+            by_link.setdefault((href, reason), []).append(page)
+        print(f"\n❌ リンク切れ: {len(dangling)}件 ({len(by_link)}種類)")
+        for (href, reason), sources in sorted(by_link.items(), key=lambda kv: -len(kv[1]))[:REPORT_LIMIT]:
+            print(f"   {href} [{reason}] ← {sources[0]}" + (f" ほか{len(sources) - 1}ページ" if len(sources) > 1 else ""))
+    else:
+        print("✅ リンク切れなし")
+
+    if orphans:
+        print(f"\n⚠️ 孤立ページ: {len(orphans)}件")
+        for page in orphans[:REPORT_LIMIT]:
+            print(f"   {page}")
+
+    return not dangling
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成サイトの内部リンクチェック")
+    parser.add_argument("root", nargs="?", default=OUTPUT_DIR)
+    parser.add_argument("--jobs", type=int, default=None, help="並列プロセス数（既定: CPU数）")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        print(f"❌ {args.root} が見つかりません")
+        sys.exit(1)
+    sys.exit(0 if check_site(args.root, args.jobs) else 1)
+
+
+if __name__ == "__main__":
+    main()
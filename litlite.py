@@ -0,0 +1,145 @@
+# ============================================================
+# litlite.py - 各スクリプトをまとめた統合 CLI
+# ============================================================
+#
+# 使い方:
+#   python litlite.py generate [--author 名前]      # HTML 生成（generator_v2.py）
+#   python litlite.py generate --changed            # 前回のビルド以降に変わったページだけ生成
+#   python litlite.py generate --pack               # 1つのアーカイブ（aozora_summaries.pack）に生成
+#   python litlite.py migrate [--status]            # スキーマ移行（migrate_database.py）
+#   python litlite.py ingest ~/aozorabunko          # 文字数の取り込み（aozora_ingest.py）
+#   python litlite.py search なつめ                  # 作品名・著者名の前方一致検索
+#   python litlite.py stats                         # DB の概要
+#   python litlite.py --timing stats                # 起動・インポートにかかった時間も表示
+#   python litlite.py --help                        # そのほかのサブコマンド一覧
+#
+# サブコマンドのモジュールは実行するときに初めて import するので、
+# search / stats のように SQLite しか使わないコマンドは Jinja2 や NumPy を読み込まない。
+# 各サブコマンドの引数は元のスクリプトと同じ（litlite.py <コマンド> --help で確認できる）。
+
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import importlib
+import os
+import sys
+
+DB_PATH = "summaries.db"
+
+# サブコマンド → (モジュール, 説明)。モジュールの main() に残りの引数を渡す
+COMMANDS = {
+    "generate": ("generator_v2", "HTML を生成"),
+    "build": ("sharded_build", "シャード分割ビルド"),
+    "migrate": ("migrate_database", "スキーマを最新に移行"),
+    "ingest": ("aozora_ingest", "青空文庫のテキストから文字数を取り込む"),
+    "enrich": ("enrich_metadata", "作品リスト CSV で年・ジャンル・読みを補完"),
+    "related": ("related_works", "関連作品を計算"),
+    "dedup": ("dedup", "重複した要約を検出"),
+    "suggest": ("suggest_index", "サジェスト用の正規化キーを管理"),
+    "compress": ("summary_codec", "要約の圧縮・展開"),
+    "changes": ("change_log", "変更履歴の確認・圧縮"),
+    "serve": ("serve", "オンデマンド描画サーバー"),
+    "export": ("export_db", "静的ホスティング向けの読み取り専用 DB を出力"),
+    "pack": ("site_pack", "生成サイトのアーカイブの作成・配信・展開"),
+    "check-links": ("link_checker", "生成サイトのリンクチェック"),
+}
+
+
+def cmd_search(args):
+    import sqlite3
+    import migrate_database
+    import suggest_index
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if migrate_database.get_version(conn) < migrate_database.LATEST_VERSION:
+            # 正規化キー列がまだない DB では、移行してキーを埋めてから検索する
+            print("⏳ スキーマを移行し、正規化キーを作成しています...")
+            suggest_index.update_keys(DB_PATH)
+        rows = suggest_index.lookup(conn, args.prefix, args.limit)
+    except sqlite3.Error as e:
+        print(f"❌ DBエラー: {e}")
+        print("litlite.py migrate を実行してから検索してください")
+        return
+    finally:
+        conn.close()
+    if not rows:
+        print("該当なし")
+    for summary_id, title, author in rows:
+        print(f"{summary_id}\t{title}\t{author}")
+
+
+def cmd_stats(args):
+    import sqlite3
+    import migrate_database
+
+    conn = sqlite3.connect(DB_PATH)
+    version = migrate_database.get_version(conn)
+    works, authors, genres = conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT author), COUNT(DISTINCT genre) FROM summaries").fetchone()
+    missing = conn.execute("""
+        SELECT SUM(year IS NULL), SUM(genre IS NULL), SUM(NULLIF(length, '') IS NULL) FROM summaries
+    """).fetchone()
+    compressed = conn.execute("SELECT COUNT(*) FROM summaries WHERE typeof(summary) = 'blob'").fetchone()[0]
+    conn.close()
+
+    print(f"📚 {works}作品 / {authors}著者 / {genres}ジャンル")
+    print(f"   年なし {missing[0] or 0}件 / ジャンルなし {missing[1] or 0}件 / 長さなし {missing[2] or 0}件")
+    print(f"   圧縮済みの要約: {compressed}件")
+    print(f"📋 スキーマ v{version} / 最新 v{migrate_database.LATEST_VERSION}")
+    print(f"💾 {DB_PATH}: {os.path.getsize(DB_PATH) / 1024:.1f} KB")
+
+
+def run_module(command, argv):
+    """サブコマンドのモジュールを読み込み、引数を差し替えて main() を呼ぶ"""
+    module_name = COMMANDS[command][0]
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed = time.perf_counter() - started
+    sys.argv = [f"litlite.py {command}"] + argv
+    return module, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="litlite.py",
+        description="LitLite -要約文庫- の統合コマンド",
+        epilog="各コマンドのオプションは litlite.py <コマンド> --help で確認できます"
+    )
+    parser.add_argument("--timing", action="store_true", help="起動・インポートにかかった時間を表示")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        # オプションはモジュール側で解釈するので、ここでは受け取らずにそのまま渡す
+        sub.add_parser(name, help=help_text, add_help=False)
+    p_search = sub.add_parser("search", help="作品名・著者名の前方一致検索")
+    p_search.add_argument("prefix")
+    p_search.add_argument("--limit", type=int, default=10)
+    sub.add_parser("stats", help="DB の概要を表示")
+    args, rest = parser.parse_known_args()
+    if rest and args.command not in COMMANDS:
+        parser.error(f"不明な引数: {' '.join(rest)}")
+
+    if args.command in ("search", "stats") and not os.path.exists(DB_PATH):
+        print(f"❌ {DB_PATH} が見つかりません")
+        return
+
+    import_time = 0.0
+    if args.command in COMMANDS:
+        module, import_time = run_module(args.command, rest)
+        ready = time.perf_counter()
+        module.main()
+    else:
+        ready = time.perf_counter()
+        {"search": cmd_search, "stats": cmd_stats}[args.command](args)
+
+    if args.timing:
+        finished = time.perf_counter()
+        print(f"⏱️ 起動 {(ready - _STARTED) * 1000:.1f}ms"
+              f" (うちモジュール読み込み {import_time * 1000:.1f}ms)"
+              f" / 実行 {(finished - ready) * 1000:.1f}ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,65 @@
 # ============================================================
-# migrate_database.py - 既存DBを新構造に移行
+# migrate_database.py - スキーマのバージョン管理とその場での移行
 # ============================================================
+#
+# 使い方:
+#   python migrate_database.py            # 未適用のマイグレーションをすべて適用
+#   python migrate_database.py --status   # 現在のバージョンを表示
+#
+# DB のスキーマバージョンは PRAGMA user_version に記録する。
+# マイグレーションは MIGRATIONS に番号順に並べ、未適用のものだけを順に適用する。
+# 各マイグレーションは何度実行しても同じ結果になるように書き（IF NOT EXISTS・列の存在確認）、
+# 大量の行を書き換える処理は BATCH_SIZE 件ずつコミットするので、
+# 途中で止まっても再実行すれば続きから進み、DB 全体のコピーも不要。
+import argparse
 import sqlite3
 import os
 
-OLD_DB = "summaries.db"
-NEW_DB = "summaries_new.db"
+DB_PATH = "summaries.db"
 
-def migrate_database():
-    """既存のDBを新しい構造に移行"""
-    if not os.path.exists(OLD_DB):
-        print(f"❌ {OLD_DB} が見つかりません")
-        return
-    
-    # 旧DBから読み込み
-    old_conn = sqlite3.connect(OLD_DB)
-    old_cur = old_conn.cursor()
-    old_cur.execute("SELECT title, author, summary, source_url FROM summaries")
-    old_data = old_cur.fetchall()
-    old_conn.close()
-    
-    # 新DBを作成
-    new_conn = sqlite3.connect(NEW_DB)
-    new_cur = new_conn.cursor()
-    
-    # 新テーブル作成
-    new_cur.execute("""
+# 行の書き換えをまとめてコミットする件数
+BATCH_SIZE = 1000
+# build_state にこのキーがある間の summary の書き換えは、圧縮形式だけの変更として change_log に記録しない
+# （summary_codec.py が書き換えと同じトランザクションで入れて消す）
+SUMMARY_REWRITE_KEY = "summary_rewrite"
+
+
+def get_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def add_column(conn, table, column, decl):
+    if column not in get_columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def backfill(conn, select_sql, update_sql, compute, batch_size=BATCH_SIZE):
+    """select_sql の結果 (id, ...) を id 順にバッチで読み、compute の結果で update_sql を実行する
+
+    select_sql は「WHERE id > ? ... ORDER BY id LIMIT ?」を受け取れる形で書く。
+    compute は (id, ...) から update_sql のパラメータを返す（None なら更新しない）。
+    """
+    last_id = 0
+    updated = 0
+    while True:
+        rows = conn.execute(select_sql, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        params = [p for p in (compute(row) for row in rows) if p is not None]
+        with conn:
+            conn.executemany(update_sql, params)
+        updated += len(params)
+        last_id = rows[-1][0]
+    return updated
+
+
+# ============================================================
+# マイグレーション
+# ============================================================
+
+def migration_001_base_schema(conn):
+    """作品テーブル（旧形式の DB には不足している列を追加）"""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS summaries (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
@@ -39,27 +73,428 @@ def migrate_database():
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     """)
-    
-    new_cur.execute("CREATE INDEX IF NOT EXISTS idx_title ON summaries(title)")
-    new_cur.execute("CREATE INDEX IF NOT EXISTS idx_author ON summaries(author)")
-    new_cur.execute("CREATE INDEX IF NOT EXISTS idx_genre ON summaries(genre)")
-    
-    # データ移行
-    for title, author, summary, source_url in old_data:
-        new_cur.execute("""
-            INSERT INTO summaries (title, author, summary, source_url)
-            VALUES (?, ?, ?, ?)
-        """, (title, author, summary, source_url))
-    
-    new_conn.commit()
-    new_conn.close()
-    
-    print(f"✅ {len(old_data)}件のデータを移行しました")
-    print(f"✅ 新しいDB: {NEW_DB}")
-    print("\n次の手順:")
-    print("1. summaries.db をバックアップ")
-    print("2. summaries_new.db を summaries.db にリネーム")
-    print("3. python generator_v2.py を実行")
+
+    if 'id' not in get_columns(conn, 'summaries'):
+        # 主キーは ALTER TABLE で追加できないので、このテーブルだけを1トランザクションで作り直す
+        conn.execute("BEGIN")
+        try:
+            conn.execute("ALTER TABLE summaries RENAME TO summaries_legacy")
+            conn.execute("""
+                CREATE TABLE summaries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT NOT NULL,
+                    author TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    source_url TEXT
+                )
+            """)
+            conn.execute("""
+                INSERT INTO summaries (id, title, author, summary, source_url)
+                SELECT rowid, title, author, summary, source_url FROM summaries_legacy
+            """)
+            conn.execute("DROP TABLE summaries_legacy")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    add_column(conn, 'summaries', 'year', 'INTEGER')
+    add_column(conn, 'summaries', 'genre', 'TEXT')
+    add_column(conn, 'summaries', 'length', 'TEXT')
+    # ALTER TABLE では CURRENT_TIMESTAMP を既定値にできないので、既存行は埋めておく
+    add_column(conn, 'summaries', 'created_at', 'TIMESTAMP')
+    add_column(conn, 'summaries', 'updated_at', 'TIMESTAMP')
+    conn.commit()
+    backfill(
+        conn,
+        "SELECT id FROM summaries WHERE id > ? AND (created_at IS NULL OR updated_at IS NULL) ORDER BY id LIMIT ?",
+        "UPDATE summaries SET created_at = COALESCE(created_at, CURRENT_TIMESTAMP), "
+        "updated_at = COALESCE(updated_at, CURRENT_TIMESTAMP) WHERE id = ?",
+        lambda row: (row[0],)
+    )
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_title ON summaries(title)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_author ON summaries(author)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_genre ON summaries(genre)")
+
+
+def migration_002_tags(conn):
+    """タグテーブル（多対多）"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS summary_tags (
+            summary_id INTEGER,
+            tag_id INTEGER,
+            FOREIGN KEY (summary_id) REFERENCES summaries(id) ON DELETE CASCADE,
+            FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE,
+            PRIMARY KEY (summary_id, tag_id)
+        )
+    """)
+
+
+def migration_003_search_keys(conn):
+    """サジェスト用の正規化キー列"""
+    from suggest_index import normalize_key
+
+    add_column(conn, 'summaries', 'title_key', 'TEXT')
+    add_column(conn, 'summaries', 'author_key', 'TEXT')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_title_key ON summaries(title_key)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_author_key ON summaries(author_key)")
+    conn.commit()
+    backfill(
+        conn,
+        "SELECT id, title, author FROM summaries WHERE id > ? AND title_key IS NULL ORDER BY id LIMIT ?",
+        "UPDATE summaries SET title_key = ?, author_key = ? WHERE id = ?",
+        lambda row: (normalize_key(row[1]), normalize_key(row[2]), row[0])
+    )
+
+
+def migration_004_related_works(conn):
+    """関連作品（related_works.py が計算結果を保存する）"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS related_works (
+            summary_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            related_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (summary_id, rank)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_related_related_id ON related_works(related_id)")
+    # 計算時点の updated_at を覚えておき、差分計算に使う
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS related_works_state (
+            summary_id INTEGER PRIMARY KEY,
+            source_updated_at TIMESTAMP
+        )
+    """)
+
+
+def migration_005_compression_dicts(conn):
+    """summary 列の zstd 圧縮辞書（summary_codec.py）"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS compression_dicts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            algo TEXT NOT NULL,
+            data BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def migration_006_facet_counts(conn):
+    """著者・ジャンル・年・タグごとの作品数（トリガーで常に正確に保つ）"""
+    conn.execute("CREATE TABLE IF NOT EXISTS author_counts (author TEXT PRIMARY KEY, works INTEGER NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS genre_counts (genre TEXT PRIMARY KEY, works INTEGER NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS year_counts (year INTEGER PRIMARY KEY, works INTEGER NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS tag_counts (tag_id INTEGER PRIMARY KEY, works INTEGER NOT NULL)")
+
+    # REPLACE が競合する行を消すとき、削除トリガーは recursive_triggers が有効な接続でしか動かない。
+    # そこで集計に入れた値を facet_rows / facet_tags に行ごとに控えておき、控えと比べて増減する。
+    # 削除トリガーが動いた場合は控えがもう消えているので、どちらの設定でも二重に数えない。
+    # year_counts.year は整数の主キーなので、整数でない年（「明治」など）は集計に入れない
+    year = "CASE WHEN typeof({row}.year) = 'integer' THEN {row}.year END"
+
+    # 加算・減算のSQL片（NEW / OLD を差し替えて使う）
+    def increment(row):
+        return f"""
+            INSERT INTO author_counts (author, works) VALUES ({row}.author, 1)
+                ON CONFLICT(author) DO UPDATE SET works = works + 1;
+            INSERT INTO genre_counts (genre, works) SELECT {row}.genre, 1 WHERE {row}.genre IS NOT NULL
+                ON CONFLICT(genre) DO UPDATE SET works = works + 1;
+            INSERT INTO year_counts (year, works) SELECT {year.format(row=row)}, 1
+                WHERE typeof({row}.year) = 'integer'
+                ON CONFLICT(year) DO UPDATE SET works = works + 1;
+            INSERT INTO facet_rows (summary_id, author, genre, year)
+                VALUES ({row}.id, {row}.author, {row}.genre, {year.format(row=row)});
+        """
+
+    def decrement(summary_id):
+        rows = f"FROM facet_rows WHERE summary_id = {summary_id}"
+        return f"""
+            UPDATE author_counts SET works = works - 1 WHERE author = (SELECT author {rows});
+            DELETE FROM author_counts WHERE author = (SELECT author {rows}) AND works <= 0;
+            UPDATE genre_counts SET works = works - 1 WHERE genre = (SELECT genre {rows});
+            DELETE FROM genre_counts WHERE genre = (SELECT genre {rows}) AND works <= 0;
+            UPDATE year_counts SET works = works - 1 WHERE year = (SELECT year {rows});
+            DELETE FROM year_counts WHERE year = (SELECT year {rows}) AND works <= 0;
+            DELETE {rows};
+        """
+
+    # タグは控えにない組だけ +1、控えにある組だけ -1 する（REPLACE で同じ組を入れ直しても数は変わらない）
+    def tag_added(row):
+        tag = f"FROM facet_tags WHERE summary_id = {row}.summary_id AND tag_id = {row}.tag_id"
+        return f"""
+            INSERT INTO tag_counts (tag_id, works) SELECT {row}.tag_id, 1 WHERE NOT EXISTS (SELECT 1 {tag})
+                ON CONFLICT(tag_id) DO UPDATE SET works = works + 1;
+            INSERT OR IGNORE INTO facet_tags (summary_id, tag_id) VALUES ({row}.summary_id, {row}.tag_id);
+        """
+
+    def tag_removed(row):
+        tag = f"FROM facet_tags WHERE summary_id = {row}.summary_id AND tag_id = {row}.tag_id"
+        return f"""
+            UPDATE tag_counts SET works = works - 1 WHERE tag_id = {row}.tag_id AND EXISTS (SELECT 1 {tag});
+            DELETE FROM tag_counts WHERE tag_id = {row}.tag_id AND works <= 0;
+            DELETE {tag};
+        """
+
+    conn.executescript(f"""
+        BEGIN;
+        CREATE TABLE IF NOT EXISTS facet_rows (
+            summary_id INTEGER PRIMARY KEY,
+            author TEXT,
+            genre TEXT,
+            year INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS facet_tags (
+            summary_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (summary_id, tag_id)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS trg_facets_summary_insert AFTER INSERT ON summaries
+        BEGIN {decrement("NEW.id")} {increment("NEW")} END;
+
+        -- UPDATE OR REPLACE で id を付け替えると、付け替え先の行も消える
+        CREATE TRIGGER IF NOT EXISTS trg_facets_summary_update AFTER UPDATE OF id, author, genre, year ON summaries
+        BEGIN {decrement("OLD.id")} {decrement("NEW.id")} {increment("NEW")} END;
+
+        -- 外部キー制約は既定で無効なので、タグの付け替えもここで行い tag_counts を保つ
+        CREATE TRIGGER IF NOT EXISTS trg_facets_summary_delete AFTER DELETE ON summaries
+        BEGIN {decrement("OLD.id")} DELETE FROM summary_tags WHERE summary_id = OLD.id; END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_facets_tag_insert AFTER INSERT ON summary_tags
+        BEGIN {tag_added("NEW")} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_facets_tag_delete AFTER DELETE ON summary_tags
+        BEGIN {tag_removed("OLD")} END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_facets_tag_update AFTER UPDATE OF summary_id, tag_id ON summary_tags
+        BEGIN {tag_removed("OLD")} {tag_added("NEW")} END;
+
+        -- トリガー作成と同じトランザクションで初期値を数え直す（書き込みとの競合で数がずれない）
+        DELETE FROM facet_rows;
+        DELETE FROM facet_tags;
+        INSERT INTO facet_rows (summary_id, author, genre, year)
+            SELECT id, author, genre, {year.format(row="summaries")} FROM summaries;
+        INSERT OR IGNORE INTO facet_tags (summary_id, tag_id) SELECT summary_id, tag_id FROM summary_tags;
+        DELETE FROM author_counts;
+        DELETE FROM genre_counts;
+        DELETE FROM year_counts;
+        DELETE FROM tag_counts;
+        INSERT INTO author_counts SELECT author, COUNT(*) FROM facet_rows GROUP BY author;
+        INSERT INTO genre_counts SELECT genre, COUNT(*) FROM facet_rows WHERE genre IS NOT NULL GROUP BY genre;
+        INSERT INTO year_counts SELECT year, COUNT(*) FROM facet_rows WHERE year IS NOT NULL GROUP BY year;
+        INSERT INTO tag_counts SELECT tag_id, COUNT(*) FROM facet_tags GROUP BY tag_id;
+        COMMIT;
+    """)
+
+
+def migration_007_char_count(conn):
+    """本文の文字数（aozora_ingest.py が青空文庫のテキストから数える）"""
+    add_column(conn, 'summaries', 'char_count', 'INTEGER')
+
+
+def migration_008_author_reading(conn):
+    """著者名の読み（enrich_metadata.py が青空文庫の作品リストから埋める）"""
+    add_column(conn, 'summaries', 'author_reading', 'TEXT')
+
+
+def migration_009_minhash(conn):
+    """重複検出用の MinHash 署名と LSH バケット（dedup.py が保守する）"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS minhash_signatures (
+            summary_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL,
+            source_updated_at TIMESTAMP
+        )
+    """)
+    # 同じ (band, bucket) に入った作品が重複候補。主キー順に並ぶので GROUP BY が索引だけで済む
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS lsh_buckets (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            summary_id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, summary_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_lsh_buckets_summary_id ON lsh_buckets(summary_id)")
+
+
+def migration_010_wal(conn):
+    """WAL モード（ビルド中の読み取りと取り込みの書き込みを並行させる）"""
+    # journal_mode は DB ファイルに記録されるので、以後の接続はすべて WAL で開かれる
+    conn.execute("PRAGMA journal_mode = WAL")
+
+
+def migration_011_change_log(conn):
+    """変更履歴（トリガーで追記し、生成側は処理済みの位置から先だけを読む）"""
+    # ページに出る列だけを監視する（title_key などの保守用の列の更新では記録しない）
+    watched = "title, author, summary, source_url, year, genre, length, char_count, author_reading"
+    conn.executescript(f"""
+        BEGIN;
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            summary_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            title TEXT,
+            author TEXT,
+            old_title TEXT,
+            old_author TEXT,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        -- serve.py が作品ごとの最新の変更を引く
+        CREATE INDEX IF NOT EXISTS idx_change_log_summary_id ON change_log(summary_id);
+        -- 生成側・保守スクリプトの状態
+        CREATE TABLE IF NOT EXISTS build_state (
+            key TEXT PRIMARY KEY,
+            value
+        );
+        -- 出力先（ディレクトリ・--pack のアーカイブ）や aozora_ingest.py の重複チェックごとの
+        -- 処理済みの change_log.id（ハイウォーターマーク）と、index_entries に保存した索引エントリがどの時点のものか
+        CREATE TABLE IF NOT EXISTS build_targets (
+            target TEXT PRIMARY KEY,
+            change_id INTEGER,
+            index_change_id INTEGER
+        );
+
+        CREATE TRIGGER IF NOT EXISTS trg_log_summary_insert AFTER INSERT ON summaries
+        BEGIN
+            INSERT INTO change_log (summary_id, op, title, author) VALUES (NEW.id, 'insert', NEW.title, NEW.author);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_log_summary_update AFTER UPDATE OF {watched} ON summaries
+        WHEN NOT EXISTS (SELECT 1 FROM build_state WHERE key = '{SUMMARY_REWRITE_KEY}')
+        BEGIN
+            INSERT INTO change_log (summary_id, op, title, author, old_title, old_author)
+            VALUES (NEW.id, 'update', NEW.title, NEW.author, OLD.title, OLD.author);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_log_summary_delete AFTER DELETE ON summaries
+        BEGIN
+            INSERT INTO change_log (summary_id, op, old_title, old_author) VALUES (OLD.id, 'delete', OLD.title, OLD.author);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_log_tag_insert AFTER INSERT ON summary_tags
+        BEGIN
+            INSERT INTO change_log (summary_id, op) VALUES (NEW.summary_id, 'tags');
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_log_tag_delete AFTER DELETE ON summary_tags
+        BEGIN
+            INSERT INTO change_log (summary_id, op) VALUES (OLD.summary_id, 'tags');
+        END;
+
+        -- related_works.py が関連作品を計算し直した作品もページを作り直す
+        CREATE TRIGGER IF NOT EXISTS trg_log_related AFTER INSERT ON related_works_state
+        BEGIN
+            INSERT INTO change_log (summary_id, op) VALUES (NEW.summary_id, 'related');
+        END;
+        COMMIT;
+    """)
+
+
+def migration_012_index_entries(conn):
+    """一覧ページ用の索引エントリ（generator_v2.py が保存し、差分ビルドは要約を読まずに一覧を組み立てる）"""
+    # 出力先（build_targets.target）ごとに持つ
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS index_entries (
+            target TEXT NOT NULL,
+            summary_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            year INTEGER,
+            genre TEXT,
+            excerpt TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            PRIMARY KEY (target, summary_id)
+        )
+    """)
+    # 一覧は get_all_works と同じ著者・年順で読む
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_index_entries_order ON index_entries(target, author, year, summary_id)
+    """)
+
+
+# (バージョン, 関数) を番号順に並べる。適用済みの番号は書き換えないこと
+MIGRATIONS = [
+    (1, migration_001_base_schema),
+    (2, migration_002_tags),
+    (3, migration_003_search_keys),
+    (4, migration_004_related_works),
+    (5, migration_005_compression_dicts),
+    (6, migration_006_facet_counts),
+    (7, migration_007_char_count),
+    (8, migration_008_author_reading),
+    (9, migration_009_minhash),
+    (10, migration_010_wal),
+    (11, migration_011_change_log),
+    (12, migration_012_index_entries),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn, verbose=False):
+    """未適用のマイグレーションを順に適用し、適用した数を返す"""
+    current = get_version(conn)
+    applied = 0
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        if verbose:
+            print(f"⏳ v{version}: {migration.__doc__}")
+        migration(conn)
+        # 途中で落ちた場合はバージョンが進まず、次回は同じマイグレーションを頭からやり直す
+        with conn:
+            conn.execute(f"PRAGMA user_version = {version}")
+        applied += 1
+    return applied
+
+
+def migrate_database(db_path=DB_PATH):
+    """DB をその場で最新のスキーマに移行"""
+    if not os.path.exists(db_path):
+        print(f"🆕 {db_path} を新規作成します")
+
+    conn = sqlite3.connect(db_path)
+    before = get_version(conn)
+    applied = apply_migrations(conn, verbose=True)
+    conn.close()
+
+    if applied:
+        print(f"✅ v{before} → v{LATEST_VERSION} ({applied}件のマイグレーションを適用)")
+    else:
+        print(f"✅ 最新です (v{before})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スキーマのマイグレーション")
+    parser.add_argument("--status", action="store_true", help="現在のバージョンを表示")
+    args = parser.parse_args()
+
+    if args.status:
+        if not os.path.exists(DB_PATH):
+            print(f"❌ {DB_PATH} が見つかりません")
+            return
+        conn = sqlite3.connect(DB_PATH)
+        version = get_version(conn)
+        conn.close()
+        pending = [v for v, _ in MIGRATIONS if v > version]
+        print(f"📋 v{version} / 最新 v{LATEST_VERSION} (未適用 {len(pending)}件)")
+        return
+
+    migrate_database()
+
 
 if __name__ == "__main__":
-    migrate_database()
\ No newline at end of file
+    main()
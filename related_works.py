@@ -0,0 +1,238 @@
+# ============================================================
+# related_works.py - 関連作品の事前計算（文字 n-gram TF-IDF）
+# ============================================================
+#
+# 使い方:
+#   python related_works.py          # 変更のあった作品だけ再計算
+#   python related_works.py --full   # 全作品を再計算
+#
+# 要約を文字 2-gram / 3-gram の TF-IDF ベクトル（SciPy 疎行列）に変換し、
+# コサイン類似度の上位 k 件をブロック単位の行列積で求めて related_works に保存する。
+# 全ペアを Python で比較しないので 10 万作品でも 1 CPU で数分で終わる。
+# 語彙は特徴量ハッシュで固定長にするため、n-gram の辞書を作る必要もない。
+
+import argparse
+import sqlite3
+import time
+
+import numpy as np
+from scipy import sparse
+
+import migrate_database
+import summary_codec
+
+DB_PATH = "summaries.db"
+
+TOP_K = 5
+BLOCK_SIZE = 256
+# 特徴量ハッシュの次元（2^HASH_BITS）
+HASH_BITS = 20
+# これ未満の類似度は関連作品として扱わない
+MIN_SCORE = 0.05
+# 全作品のこの割合以上に現れる n-gram は区別に役立たないので落とす
+MAX_DF = 0.5
+
+_HASH_MULT = np.uint64(0x9E3779B97F4A7C15)
+
+
+# ============================================================
+# ベクトル化
+# ============================================================
+
+def ngram_features(text, hash_bits=HASH_BITS):
+    """文字 2-gram / 3-gram をハッシュした特徴量 ID とその出現回数を返す"""
+    chars = np.frombuffer(''.join(text.split()).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    grams = []
+    if len(chars) >= 2:
+        grams.append((chars[:-1] << np.uint64(21)) | chars[1:])
+    if len(chars) >= 3:
+        grams.append((chars[:-2] << np.uint64(42)) | (chars[1:-1] << np.uint64(21)) | chars[2:])
+    if not grams:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+    ids = ((np.concatenate(grams) * _HASH_MULT) >> np.uint64(64 - hash_bits)).astype(np.int32)
+    return np.unique(ids, return_counts=True)
+
+
+def build_tfidf(texts, hash_bits=HASH_BITS):
+    """L2 正規化済みの TF-IDF 疎行列 (作品数 × 2^hash_bits) を作る"""
+    indptr = [0]
+    indices = []
+    counts = []
+    for text in texts:
+        ids, cnt = ngram_features(text, hash_bits)
+        indices.append(ids)
+        counts.append(cnt)
+        indptr.append(indptr[-1] + len(ids))
+
+    n_docs = len(indptr) - 1
+    n_features = 1 << hash_bits
+    indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int32)
+    tf = 1.0 + np.log(np.concatenate(counts)) if counts else np.empty(0)
+
+    # 1作品にしか現れない n-gram は類似度に寄与せず、頻出しすぎる n-gram は行列積を重くするだけなので落とす
+    df = np.bincount(indices, minlength=n_features)
+    idf = np.log((1.0 + n_docs) / (1.0 + df)) + 1.0
+    idf[df < 2] = 0.0
+    if n_docs >= 10:
+        idf[df > MAX_DF * n_docs] = 0.0
+
+    X = sparse.csr_matrix(
+        ((tf * idf[indices]).astype(np.float32), indices, np.asarray(indptr)),
+        shape=(n_docs, n_features)
+    )
+    X.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags((1.0 / norms).astype(np.float32)) @ X
+
+
+# ============================================================
+# 近傍探索
+# ============================================================
+
+def top_k_neighbors(X, rows, top_k=TOP_K, block_size=BLOCK_SIZE, on_block=None):
+    """rows の各行について類似度上位 top_k 件 (列番号, スコア) を返す
+
+    on_block(rows_in_block, dense_scores) を渡すとブロックごとの類似度行列を受け取れる。
+    """
+    XT = X.T.tocsr()
+    results = {}
+    for start in range(0, len(rows), block_size):
+        block = np.asarray(rows[start:start + block_size])
+        scores = (X[block] @ XT).toarray()
+        scores[np.arange(len(block)), block] = -1.0
+        if on_block:
+            on_block(block, scores)
+
+        k = min(top_k, scores.shape[1] - 1)
+        if k <= 0:
+            for row in block:
+                results[int(row)] = []
+            continue
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for i, row in enumerate(block):
+            cols = candidates[i]
+            cols = cols[np.argsort(-scores[i, cols], kind='stable')]
+            results[int(row)] = [(int(c), float(scores[i, c])) for c in cols if scores[i, c] >= MIN_SCORE]
+    return results
+
+
+# ============================================================
+# DB 更新
+# ============================================================
+
+def load_summaries(conn):
+    summary_codec.load_dictionaries(conn)
+    cur = conn.execute("SELECT id, summary, updated_at FROM summaries ORDER BY id")
+    ids, texts, updated = [], [], []
+    for summary_id, summary, updated_at in cur:
+        ids.append(summary_id)
+        texts.append(summary_codec.decode_summary(summary))
+        updated.append(updated_at)
+    return ids, texts, updated
+
+
+def find_changed(conn):
+    """前回計算以降に追加・更新・削除された作品 ID を返す"""
+    changed = {row[0] for row in conn.execute("""
+        SELECT s.id FROM summaries s
+        LEFT JOIN related_works_state r ON r.summary_id = s.id
+        WHERE r.summary_id IS NULL OR r.source_updated_at IS NOT s.updated_at
+    """)}
+    deleted = {row[0] for row in conn.execute("""
+        SELECT summary_id FROM related_works_state
+        WHERE summary_id NOT IN (SELECT id FROM summaries)
+    """)}
+    return changed, deleted
+
+
+def save_results(conn, ids, updated, results, deleted=()):
+    with conn:
+        stale = [(summary_id,) for summary_id in deleted]
+        stale += [(ids[row],) for row in results]
+        conn.executemany("DELETE FROM related_works WHERE summary_id = ?", stale)
+        conn.executemany("DELETE FROM related_works_state WHERE summary_id = ?", stale)
+        conn.executemany(
+            "INSERT INTO related_works (summary_id, rank, related_id, score) VALUES (?, ?, ?, ?)",
+            [(ids[row], rank, ids[col], score)
+             for row, neighbors in results.items()
+             for rank, (col, score) in enumerate(neighbors, 1)]
+        )
+        conn.executemany(
+            "INSERT INTO related_works_state (summary_id, source_updated_at) VALUES (?, ?)",
+            [(ids[row], updated[row]) for row in results]
+        )
+
+
+def update_related_works(full=False, top_k=TOP_K, block_size=BLOCK_SIZE):
+    conn = sqlite3.connect(DB_PATH)
+    migrate_database.apply_migrations(conn)
+
+    started = time.perf_counter()
+    ids, texts, updated = load_summaries(conn)
+    if not ids:
+        print("⚠️ データがありません")
+        conn.close()
+        return
+
+    X = build_tfidf(texts)
+    position = {summary_id: i for i, summary_id in enumerate(ids)}
+    print(f"🔢 ベクトル化: {len(ids)}作品 / 非ゼロ要素 {X.nnz:,} ({time.perf_counter() - started:.1f}秒)")
+
+    if full:
+        deleted = {row[0] for row in conn.execute("SELECT summary_id FROM related_works_state")} - set(ids)
+        results = top_k_neighbors(X, list(range(len(ids))), top_k, block_size)
+    else:
+        changed, deleted = find_changed(conn)
+        if not changed and not deleted:
+            print("✅ 変更なし")
+            conn.close()
+            return
+
+        # 既存の関連作品リストの k 位スコア。変更作品がこれを上回れば入れ替えが必要
+        thresholds = np.full(len(ids), -1.0)
+        for summary_id, min_score, n in conn.execute(
+                "SELECT summary_id, MIN(score), COUNT(*) FROM related_works GROUP BY summary_id"):
+            if summary_id in position and n >= top_k:
+                thresholds[position[summary_id]] = min_score
+        affected = set()
+
+        def collect(block, scores):
+            # 類似度は対称なので、変更作品の行から「リストが変わる作品」を拾える
+            hits = np.nonzero((scores >= MIN_SCORE) & (scores > thresholds))[1]
+            affected.update(int(c) for c in hits)
+
+        changed_rows = sorted(position[i] for i in changed)
+        results = top_k_neighbors(X, changed_rows, top_k, block_size, on_block=collect)
+
+        # 変更・削除された作品をリストに含んでいた作品も再計算する
+        conn.execute("CREATE TEMP TABLE stale_ids (id INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO stale_ids (id) VALUES (?)", [(i,) for i in changed | deleted])
+        for (summary_id,) in conn.execute("""
+            SELECT DISTINCT r.summary_id FROM related_works r
+            JOIN stale_ids s ON s.id = r.related_id
+        """):
+            if summary_id in position:
+                affected.add(position[summary_id])
+        affected -= set(results)
+        if affected:
+            results.update(top_k_neighbors(X, sorted(affected), top_k, block_size))
+
+    save_results(conn, ids, updated, results, deleted)
+    conn.close()
+
+    print(f"✅ 関連作品を更新: {len(results)}作品 (削除 {len(deleted)}件, {time.perf_counter() - started:.1f}秒)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="関連作品の事前計算")
+    parser.add_argument("--full", action="store_true", help="全作品を再計算")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    args = parser.parse_args()
+    update_related_works(args.full, args.top_k, args.block_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+# ============================================================
+# serve.py - summaries.db からページをその場で描画する WSGI サーバー
+# ============================================================
+#
+# 使い方:
+#   python serve.py run                        # http://127.0.0.1:8000/ で起動（wsgiref）
+#   python serve.py run --port 8080 --cache 5000
+#   python serve.py bench --requests 20000     # プロセス内で負荷試験
+#   gunicorn -w 4 --threads 8 serve:app        # 本番向け WSGI サーバーで動かす場合
+#
+# 静的生成と同じテンプレート・URL 構成（index.html / 作品.html / authors/著者.html /
+# by_*.html / suggest/*.json / api/v1/*.json / sw.js）を、リクエストされた時点で描画して返す。
+# 描画結果は件数上限つきの LRU キャッシュに保持し、DB が更新されたとき
+# （PRAGMA data_version の変化）だけ change_log の最新 ID などのスタンプを取り直す。
+# 作品ページはその作品か関連作品に載る作品の変更履歴が増えたものだけを描き直し、
+# 一覧ページはスタンプが変わったときに描き直す。
+# レスポンスには本文のハッシュから作った ETag と updated_at 由来の
+# Last-Modified を付けるので、ブラウザの再検証には 304 で答えられる。
+
+import argparse
+import hashlib
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, make_server
+
+import change_log
+import db
+import generator_v2 as gen
+import service_worker
+import suggest_index
+import summary_codec
+
+DB_PATH = gen.DB_PATH
+# LRU キャッシュに保持するページ数
+CACHE_SIZE = 2048
+
+_LISTING_PAGES = ("index.html", "by_author.html", "by_year.html", "by_genre.html")
+_CONTENT_TYPES = {".html": "text/html; charset=utf-8", ".json": "application/json; charset=utf-8",
+                  ".js": "text/javascript; charset=utf-8"}
+
+
+def _http_date(timestamp):
+    """SQLite の CURRENT_TIMESTAMP（UTC）を HTTP 日付に変換する"""
+    if not timestamp:
+        return None
+    dt = datetime.strptime(str(timestamp)[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+    return format_datetime(dt, usegmt=True)
+
+
+def _etag(body):
+    return '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+class Page:
+    __slots__ = ("body", "content_type", "etag", "last_modified", "stamp", "validator")
+
+    def __init__(self, body, content_type, last_modified, stamp, validator=None):
+        self.body = body
+        self.content_type = content_type
+        self.etag = _etag(body)
+        self.last_modified = last_modified
+        self.stamp = stamp
+        # 作品ページは _work_validator の値、一覧ページは None（スタンプだけで判定）
+        self.validator = validator
+
+
+class PageCache:
+    """スレッドセーフな件数上限つき LRU キャッシュ"""
+
+    def __init__(self, max_pages=CACHE_SIZE):
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+            return page
+
+    def put(self, key, page):
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def __len__(self):
+        return len(self._pages)
+
+
+class SiteApp:
+    """WSGI アプリ本体。スレッドごとに読み取り専用の接続を持つ"""
+
+    def __init__(self, db_path=DB_PATH, cache_size=CACHE_SIZE):
+        self.db_path = db_path
+        self.cache = PageCache(cache_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # DB 全体のスタンプと、スタンプごとに作り直す URL → 行 の対応表
+        self._stamp = None
+        self._site = None
+
+    # ------------------------------------------------------------
+    # DB 接続とスタンプ
+    # ------------------------------------------------------------
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = db.connect(self.db_path, readonly=True)
+            conn.row_factory = sqlite3.Row
+            summary_codec.load_dictionaries(conn)
+            self._local.conn = conn
+            self._local.data_version = None
+        return conn
+
+    def _current_stamp(self, conn):
+        # data_version は他の接続がコミットしたときだけ変わるので、普段は1回の PRAGMA で済む
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._local.data_version or self._stamp is None:
+            self._local.data_version = data_version
+            # change_log の ID は変更のたびに必ず増えるので、同じ秒に続いた更新やタグ・関連作品の
+            # 付け替えでもスタンプが変わる。COUNT / MAX は change_log がない DB 向けの予備と日付用
+            stamp = (change_log.latest_change_id(conn),) + tuple(conn.execute(
+                "SELECT COUNT(*), MAX(id), MAX(updated_at) FROM summaries").fetchone())
+            with self._lock:
+                if stamp != self._stamp:
+                    self._stamp = stamp
+                    self._site = None
+        return self._stamp
+
+    def _site_map(self, conn, stamp):
+        """作品・著者のファイル名 → 行 の対応表（スタンプが変わるまで使い回す）"""
+        site = self._site
+        if site is not None and site["stamp"] == stamp:
+            return site
+        works = {}
+        # 同名作品は静的生成と同じく後に書かれた方（著者・年の順で後）を返す
+        for row in conn.execute("SELECT id, title FROM summaries ORDER BY author, year"):
+            works[gen.work_filename(row)] = row["id"]
+        author_counts = conn.execute(
+            "SELECT author, COUNT(*) FROM summaries GROUP BY author ORDER BY author").fetchall()
+        authors = {gen.author_filename(author): author for author, _ in author_counts}
+        site = {"stamp": stamp, "works": works, "authors": authors,
+                "author_counts": [tuple(r) for r in author_counts]}
+        with self._lock:
+            if self._stamp == stamp:
+                self._site = site
+        return site
+
+    # ------------------------------------------------------------
+    # ページ描画
+    # ------------------------------------------------------------
+
+    def _work_validator(self, conn, summary_id):
+        """作品ページを描き直すかどうかを決める値（行の updated_at と、関連する変更履歴の最新 ID）
+
+        関連作品の欄には他の作品の題名・著者が載るので、関連先の変更と関連作品の再計算でも値が変わる。
+        """
+        row = conn.execute("SELECT updated_at FROM summaries WHERE id = ?", (summary_id,)).fetchone()
+        if row is None:
+            return None
+        try:
+            change = conn.execute("""
+                SELECT MAX(id) FROM change_log
+                WHERE summary_id = ? OR summary_id IN (SELECT related_id FROM related_works WHERE summary_id = ?)
+            """, (summary_id, summary_id)).fetchone()[0]
+        except sqlite3.Error:
+            change = None
+        return (row[0], change)
+
+    def _related(self, conn, summary_id):
+        try:
+            return [
+                {"id": related_id, "title": title, "author": author,
+                 "filename": gen.work_filename({"title": title})}
+                for related_id, title, author in conn.execute("""
+                    SELECT s.id, s.title, s.author FROM related_works r
+                    JOIN summaries s ON s.id = r.related_id
+                    WHERE r.summary_id = ? ORDER BY r.rank
+                """, (summary_id,))
+            ]
+        except sqlite3.Error:
+            return []
+
+    def _render_work(self, conn, summary_id, stamp):
+        # 描画より先に読んでおけば、途中で更新が入っても次のリクエストで描き直される
+        validator = self._work_validator(conn, summary_id)
+        row = conn.execute("SELECT * FROM summaries WHERE id = ?", (summary_id,)).fetchone()
+        if row is None:
+            return None
+        work = dict(row)
+        updated_at = work.get("updated_at")
+        html = gen.work_page_html(work, self._related(conn, summary_id), date=str(updated_at or "")[:10] or None)
+        return Page(html.encode("utf-8"), _CONTENT_TYPES[".html"], _http_date(updated_at), stamp,
+                    validator=validator)
+
+    def _render_work_api(self, conn, summary_id, stamp):
+        """作品 API（api/v1/works/ID.json）。作品ページと同じ値で描き直しを判定する"""
+        validator = self._work_validator(conn, summary_id)
+        row = conn.execute("SELECT * FROM summaries WHERE id = ?", (summary_id,)).fetchone()
+        if row is None:
+            return None
+        work = dict(row)
+        body = gen.dump_json(gen.work_api_doc(work, self._related(conn, summary_id)))
+        return Page(body, _CONTENT_TYPES[".json"], _http_date(work.get("updated_at")), stamp,
+                    validator=validator)
+
+    def _index_entries(self, conn):
+        rows = conn.execute(
+            "SELECT id, title, author, year, genre, summary FROM summaries ORDER BY author, year, id")
+        return [gen.index_entry(dict(row)) for row in rows]
+
+    def _render_listing(self, conn, path, stamp, site):
+        date = str(stamp[-1] or "")[:10] or None
+        if path == "index.html":
+            html = gen.index_html(self._index_entries(conn), self._facets(conn, site), date=date)
+        elif path == "by_author.html":
+            html = gen.author_directory_html(site["author_counts"])
+        elif path in ("by_year.html", "by_genre.html"):
+            html = gen.facet_pages_html(self._facets(conn, site))[path]
+        elif path.startswith(suggest_index.SUGGEST_DIR + "/"):
+            # チャンクは全件から一度に切り出すので、スタンプごとにまとめて作っておく
+            if "suggest" not in site:
+                entries = suggest_index.build_entries(self._index_entries(conn), site["author_counts"],
+                                                      gen.author_filename)
+                site["suggest"] = suggest_index.build_chunks(entries)
+            text = site["suggest"].get(path)
+            if text is None:
+                return None
+            return Page(text.encode("utf-8"), _CONTENT_TYPES[".json"], _http_date(stamp[-1]), stamp)
+        elif path.startswith(gen.API_DIR + "/"):
+            # 一覧 API も全件から一度に作るので、サジェストと同じくスタンプごとにまとめて作っておく
+            if "api" not in site:
+                site["api"] = gen.api_list_files(self._index_entries(conn), self._facets(conn, site))[0]
+            body = site["api"].get(path)
+            if body is None:
+                return None
+            return Page(body, _CONTENT_TYPES[".json"], _http_date(stamp[-1]), stamp)
+        elif path in (service_worker.SW_PATH, service_worker.MANIFEST_PATH):
+            # 先読み対象の一覧ページを（キャッシュ経由で）描画し、そのハッシュから作る
+            pages = {p: self.get_page(p).body for p in service_worker.PRECACHE_PAGES}
+            text = service_worker.build_files(pages)[path]
+            content_type = _CONTENT_TYPES[".js" if path.endswith(".js") else ".json"]
+            return Page(text.encode("utf-8"), content_type, _http_date(stamp[-1]), stamp)
+        elif path in site["authors"]:
+            author = site["authors"][path]
+            rows = conn.execute("SELECT * FROM summaries WHERE author = ? ORDER BY year", (author,))
+            html = gen.author_page_html(author, [gen.index_entry(dict(row)) for row in rows], date=date)
+        else:
+            return None
+        return Page(html.encode("utf-8"), _CONTENT_TYPES[".html"], _http_date(stamp[-1]), stamp)
+
+    def _facets(self, conn, site):
+        try:
+            return {
+                "authors": site["author_counts"],
+                "genres": conn.execute("SELECT genre, works FROM genre_counts ORDER BY genre").fetchall(),
+                "years": conn.execute("SELECT year, works FROM year_counts ORDER BY year").fetchall(),
+                "tags": conn.execute("""
+                    SELECT t.name, c.works FROM tag_counts c JOIN tags t ON t.id = c.tag_id ORDER BY t.name
+                """).fetchall(),
+            }
+        except sqlite3.Error:
+            return gen.facet_counts_from(self._index_entries(conn))
+
+    def get_page(self, path):
+        """URL パス（先頭の / なし）に対応するページを返す。なければ None"""
+        if path in ("", "/"):
+            path = "index.html"
+        conn = self._conn()
+        stamp = self._current_stamp(conn)
+
+        page = self.cache.get(path)
+        if page is not None and page.stamp == stamp:
+            self.cache.hits += 1
+            return page
+
+        site = self._site_map(conn, stamp)
+        summary_id = site["works"].get(path)
+        render = self._render_work
+        if summary_id is None:
+            summary_id = _api_work_id(path)
+            render = self._render_work_api
+        if summary_id is not None and path not in _LISTING_PAGES:
+            # DB が更新されても、この作品と関連作品に変更がなければキャッシュを使い続ける
+            if page is not None and page.validator is not None:
+                if self._work_validator(conn, summary_id) == page.validator:
+                    page.stamp = stamp
+                    self.cache.hits += 1
+                    return page
+            page = render(conn, summary_id, stamp)
+        else:
+            page = self._render_listing(conn, path, stamp, site)
+        self.cache.misses += 1
+        if page is not None:
+            self.cache.put(path, page)
+        return page
+
+    # ------------------------------------------------------------
+    # WSGI
+    # ------------------------------------------------------------
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD", "GET") not in ("GET", "HEAD"):
+            start_response("405 Method Not Allowed", [("Allow", "GET, HEAD")])
+            return [b""]
+        # PEP 3333 では PATH_INFO は latin-1 で渡される
+        path = environ.get("PATH_INFO", "/").encode("latin-1").decode("utf-8", "replace").lstrip("/")
+        page = self.get_page(path)
+        if page is None:
+            body = "404 Not Found".encode("utf-8")
+            start_response("404 Not Found", [("Content-Type", "text/plain; charset=utf-8"),
+                                             ("Content-Length", str(len(body)))])
+            return [body]
+
+        headers = [("ETag", page.etag), ("Cache-Control", "no-cache")]
+        if page.last_modified:
+            headers.append(("Last-Modified", page.last_modified))
+        if _not_modified(environ, page):
+            start_response("304 Not Modified", headers)
+            return [b""]
+        headers += [("Content-Type", page.content_type), ("Content-Length", str(len(page.body)))]
+        start_response("200 OK", headers)
+        return [b""] if environ.get("REQUEST_METHOD") == "HEAD" else [page.body]
+
+
+def _api_work_id(path):
+    """api/v1/works/ID.json なら作品 ID を返す（一覧の works/page-N.json は None）"""
+    prefix = gen.API_DIR + "/works/"
+    if not path.startswith(prefix) or not path.endswith(".json"):
+        return None
+    stem = path[len(prefix):-len(".json")]
+    return int(stem) if stem.isdigit() else None
+
+
+def _not_modified(environ, page):
+    if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+    if if_none_match is not None:
+        # If-None-Match があるときは If-Modified-Since を見ない（RFC 9110）
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or page.etag in tags or f"W/{page.etag}" in tags
+    since = environ.get("HTTP_IF_MODIFIED_SINCE")
+    if since and page.last_modified:
+        try:
+            return parsedate_to_datetime(page.last_modified) <= parsedate_to_datetime(since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+app = SiteApp()
+
+
+# ============================================================
+# 起動・負荷試験
+# ============================================================
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def run_server(host, port, cache_size):
+    application = SiteApp(DB_PATH, cache_size)
+    with make_server(host, port, application, server_class=ThreadingWSGIServer) as httpd:
+        print(f"🌐 http://{host}:{port}/ で待ち受け中 (Ctrl+C で終了)")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def bench(n_requests, threads, cache_size, revalidate, hot_share):
+    """プロセス内で WSGI アプリを直接呼び、スループットとキャッシュ効率を測る"""
+    application = SiteApp(DB_PATH, cache_size)
+    conn = sqlite3.connect(DB_PATH)
+    titles = [row[0] for row in conn.execute("SELECT title FROM summaries ORDER BY id")]
+    conn.close()
+    if not titles:
+        print("⚠️ データがありません")
+        return
+    works = [gen.work_filename({"title": t}) for t in titles]
+    # アクセスは一部の人気ページに偏る（hot_share の割合で上位 1% と一覧ページ）
+    hot = list(_LISTING_PAGES) + works[:max(1, len(works) // 100)]
+    rng = random.Random(0)
+    paths = [rng.choice(hot) if rng.random() < hot_share else rng.choice(works) for _ in range(n_requests)]
+    etags = {}
+    statuses = {}
+    latencies = []
+
+    def request(path):
+        environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/" + path.encode("utf-8").decode("latin-1")}
+        if path in etags and rng.random() < revalidate:
+            environ["HTTP_IF_NONE_MATCH"] = etags[path]
+        result = {}
+
+        def start_response(status, headers):
+            result["status"] = status[:3]
+            result["headers"] = dict(headers)
+
+        started = time.perf_counter()
+        b"".join(application(environ, start_response))
+        latencies.append(time.perf_counter() - started)
+        if "ETag" in result["headers"]:
+            etags[path] = result["headers"]["ETag"]
+        statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(request, paths, chunksize=64))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"⚡ {n_requests}リクエスト / {threads}スレッド: {elapsed:.2f}秒 ({n_requests / elapsed:,.0f} req/s)")
+    print(f"   レイテンシ p50 {latencies[len(latencies) // 2] * 1000:.2f}ms"
+          f" / p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms")
+    print(f"   ステータス: " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items())))
+    total = application.cache.hits + application.cache.misses
+    print(f"   キャッシュ: ヒット {application.cache.hits / total:.1%} / 保持 {len(application.cache)}ページ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="オンデマンド描画サーバー")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_run = sub.add_parser("run", help="HTTP サーバーを起動")
+    p_run.add_argument("--host", default="127.0.0.1")
+    p_run.add_argument("--port", type=int, default=8000)
+    p_run.add_argument("--cache", type=int, default=CACHE_SIZE, help="キャッシュするページ数")
+    p_bench = sub.add_parser("bench", help="プロセス内で負荷試験")
+    p_bench.add_argument("--requests", type=int, default=10000)
+    p_bench.add_argument("--threads", type=int, default=8)
+    p_bench.add_argument("--cache", type=int, default=CACHE_SIZE)
+    p_bench.add_argument("--revalidate", type=float, default=0.3,
+                         help="ETag 付きで再検証するリクエストの割合")
+    p_bench.add_argument("--hot", type=float, default=0.8, help="人気ページへのアクセスの割合")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_server(args.host, args.port, args.cache)
+    else:
+        bench(args.requests, args.threads, args.cache, args.revalidate, args.hot)
+
+
+if __name__ == "__main__":
+    main()
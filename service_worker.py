@@ -0,0 +1,124 @@
+# ============================================================
+# service_worker.py - サービスワーカー（sw.js）と precache マニフェスト
+# ============================================================
+#
+# 生成サイトの直下に sw.js と precache-manifest.json を出力する。
+#   - 一覧ページ（index.html / by_*.html）とサジェストの manifest.json は、
+#     中身のハッシュ（revision）つきでインストール時に先読みし、以降はキャッシュから返す。
+#     revision はフッターの「最終更新」の日付を除いて計算するので、日付だけが変わったビルドでは変わらない
+#   - 作品・著者ページなどそのほかの HTML / JSON は stale-while-revalidate
+#     （キャッシュにあれば即座に返し、裏で取り直して次回に備える）。
+#     サジェストのチャンクは中身のハッシュつきの名前なので、先読みした manifest.json と版がずれない
+# sw.js にはマニフェスト全体のハッシュを埋め込む。先読み対象の中身が変わったときだけ
+# sw.js のバイト列が変わるので、ブラウザが新しいワーカーを入れ直すのもそのときだけになる。
+# マニフェストに日時などは含めないため、中身が同じなら前回と同じバイト列になり書き込みも省かれる。
+
+import hashlib
+import json
+import re
+
+SW_PATH = "sw.js"
+MANIFEST_PATH = "precache-manifest.json"
+# インストール時に先読みするページ（OUTPUT_DIR からの相対パス）
+PRECACHE_PAGES = (
+    "index.html",
+    "by_author.html",
+    "by_year.html",
+    "by_genre.html",
+    "suggest/manifest.json",
+)
+# revision に含めないビルド日付（generator_v2.py のフッター）
+_BUILD_DATE_RE = re.compile('最終更新: \\d{4}-\\d{2}-\\d{2}'.encode('utf-8'))
+# stale-while-revalidate で保持する作品・著者ページの上限
+RUNTIME_CACHE_LIMIT = 200
+
+SW_TEMPLATE = '''// LitLite -要約文庫- サービスワーカー（generator_v2.py が生成）
+const VERSION = '__VERSION__';
+const PRECACHE = 'litlite-precache-' + VERSION;
+const RUNTIME = 'litlite-pages';
+const RUNTIME_LIMIT = __RUNTIME_LIMIT__;
+const PRECACHE_URLS = __PRECACHE_URLS__.map(path => new URL(path, self.location).href);
+const PRECACHED = new Set(PRECACHE_URLS);
+
+self.addEventListener('install', event => {
+  event.waitUntil(caches.open(PRECACHE)
+    .then(cache => cache.addAll(PRECACHE_URLS.map(url => new Request(url, {cache: 'reload'}))))
+    .then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(caches.keys()
+    .then(keys => Promise.all(keys
+      .filter(key => key.startsWith('litlite-precache-') && key !== PRECACHE)
+      .map(key => caches.delete(key))))
+    .then(() => self.clients.claim()));
+});
+
+function trimRuntime(cache) {
+  return cache.keys().then(keys => Promise.all(
+    keys.slice(0, Math.max(0, keys.length - RUNTIME_LIMIT)).map(key => cache.delete(key))));
+}
+
+function staleWhileRevalidate(event, request) {
+  return caches.open(RUNTIME).then(cache => cache.match(request).then(cached => {
+    const network = fetch(request).then(response => {
+      if (response.ok) {
+        event.waitUntil(cache.put(request, response.clone()).then(() => trimRuntime(cache)));
+      }
+      return response;
+    });
+    if (cached) {
+      event.waitUntil(network.catch(() => {}));
+      return cached;
+    }
+    return network;
+  }));
+}
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  if (request.method !== 'GET') return;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) return;
+
+  // 一覧ページの ?year= などはページ内で解釈するので、キャッシュはクエリなしで引く
+  url.search = '';
+  url.hash = '';
+  if (url.pathname.endsWith('/')) url.pathname += 'index.html';
+  if (PRECACHED.has(url.href)) {
+    event.respondWith(caches.open(PRECACHE)
+      .then(cache => cache.match(url.href))
+      .then(cached => cached || fetch(request)));
+    return;
+  }
+  if (/\\.(html|json)$/.test(url.pathname)) {
+    event.respondWith(staleWhileRevalidate(event, request));
+  }
+});
+'''
+
+
+def revision(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def build_manifest(pages):
+    """{相対パス: バイト列} から precache マニフェストを作る（PRECACHE_PAGES にあるものだけ）"""
+    entries = [{'url': path, 'revision': revision(_BUILD_DATE_RE.sub(b'', pages[path]))}
+               for path in PRECACHE_PAGES if path in pages]
+    version = revision(json.dumps(entries, sort_keys=True).encode('utf-8'))
+    return {'version': version, 'entries': entries}
+
+
+def build_files(pages):
+    """{出力パス: 文字列} で sw.js と precache-manifest.json を返す"""
+    manifest = build_manifest(pages)
+    urls = json.dumps([entry['url'] for entry in manifest['entries']], ensure_ascii=False)
+    sw = (SW_TEMPLATE
+          .replace('__VERSION__', manifest['version'])
+          .replace('__RUNTIME_LIMIT__', str(RUNTIME_CACHE_LIMIT))
+          .replace('__PRECACHE_URLS__', urls))
+    return {
+        MANIFEST_PATH: json.dumps(manifest, ensure_ascii=False, indent=1),
+        SW_PATH: sw,
+    }
@@ -0,0 +1,249 @@
+# ============================================================
+# sharded_build.py - シャード分割ビルド（複数プロセス・複数ノード対応）
+# ============================================================
+#
+# 使い方:
+#   python sharded_build.py render --shard 0 --shards 4   # シャード0を生成
+#   python sharded_build.py merge --shards 4              # 索引ページを組み立て
+#   python sharded_build.py run --shards 4                # ローカルで4プロセス並列 + マージ
+#
+# 各シャードは著者名のハッシュで担当作品を決め、作品ページを書き出すと同時に
+# 索引フラグメント（JSON Lines）を出力する。著者ページもシャード内で生成する。
+# マージ処理はフラグメント（と数行の集計テーブル）だけを読み、作品表を走査せずに
+# index.html・by_author.html（著者ディレクトリ）・年代別/ジャンル別ページを組み立てる。
+# 別ノードで render した場合はフラグメントディレクトリを集めてから merge する。
+# run では開始時点の DB を VACUUM INTO で1ファイルに固め、全シャードとマージが同じ内容を読む。
+
+import argparse
+import heapq
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import zlib
+
+import db
+import generator_v2 as gen
+
+FRAGMENT_DIR = os.path.join(gen.OUTPUT_DIR, "_fragments")
+
+
+def shard_of(author, num_shards):
+    # hash() はプロセスごとに値が変わるため、安定した crc32 を使う
+    return zlib.crc32(author.encode("utf-8")) % num_shards
+
+
+def fragment_path(fragment_dir, shard, num_shards):
+    return os.path.join(fragment_dir, f"shard-{shard:04d}-of-{num_shards:04d}.jsonl")
+
+
+def hashes_fragment_path(fragment_dir, shard, num_shards):
+    return os.path.join(fragment_dir, f"shard-{shard:04d}-of-{num_shards:04d}.hashes.json")
+
+
+def get_shard_works(conn, shard, num_shards):
+    try:
+        conn.create_function("shard_of", 2, shard_of, deterministic=True)
+        gen.summary_codec.load_dictionaries(conn)
+        cur = conn.cursor()
+        cur.row_factory = sqlite3.Row
+        cur.execute(
+            "SELECT * FROM summaries WHERE shard_of(author, ?) = ? ORDER BY author, year, id",
+            (num_shards, shard)
+        )
+        return [dict(row) for row in cur.fetchall()]
+    except sqlite3.Error as e:
+        print(f"❌ DBエラー: {e}")
+        return None
+
+
+def render_shard(shard, num_shards, fragment_dir=FRAGMENT_DIR):
+    """担当シャードの作品ページとフラグメントを生成"""
+    # 作品と関連作品は同じスナップショットから読む
+    with db.snapshot(gen.DB_PATH) as conn:
+        works = get_shard_works(conn, shard, num_shards)
+        # 関連作品は担当作品の分だけ読む
+        related = gen.get_related_works(conn, [w['id'] for w in works]) if works else {}
+    if works is None:
+        return False
+
+    os.makedirs(gen.OUTPUT_DIR, exist_ok=True)
+    os.makedirs(fragment_dir, exist_ok=True)
+
+    path = fragment_path(fragment_dir, shard, num_shards)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for work in works:
+            gen.generate_work_page(work, related.get(work['id']))
+            f.write(json.dumps(gen.index_entry(work), ensure_ascii=False) + "\n")
+    # シャードは著者単位なので著者ページもシャード内で完結する
+    gen.generate_author_pages(works)
+    # 書き込み途中のフラグメントをマージが読まないようにリネームで確定
+    os.replace(tmp_path, path)
+
+    # 出力ハッシュは全シャードが同じファイルを書き換えると競合するので、
+    # シャードごとの差分だけを書き出し、マージで1回にまとめて保存する
+    hashes_path = hashes_fragment_path(fragment_dir, shard, num_shards)
+    with open(hashes_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(gen.output_hash_changes(), f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(hashes_path + ".tmp", hashes_path)
+
+    print(f"✅ シャード {shard}/{num_shards}: {len(works)}作品")
+    gen.report_output_size()
+    return True
+
+
+def read_fragment(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def merge_fragments(num_shards, fragment_dir=FRAGMENT_DIR):
+    """全シャードのフラグメントから索引ページを組み立てる"""
+    paths = [fragment_path(fragment_dir, i, num_shards) for i in range(num_shards)]
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        print(f"❌ フラグメントが不足しています ({len(missing)}/{num_shards})")
+        for p in missing:
+            print(f"   - {p}")
+        return False
+
+    # 各フラグメントはソート済みなので k-way マージで全体順を復元する
+    works_data = list(heapq.merge(*(read_fragment(p) for p in paths), key=gen.index_order))
+
+    # シャードが記録した出力ハッシュを取り込む（別ノードで render したときはないこともある）
+    hashes_paths = [hashes_fragment_path(fragment_dir, i, num_shards) for i in range(num_shards)]
+    for path in hashes_paths:
+        try:
+            with open(path, encoding="utf-8") as f:
+                gen.apply_output_hash_changes(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    os.makedirs(gen.OUTPUT_DIR, exist_ok=True)
+    # 集計テーブルは数行しか読まないので、DB に届く環境ではそちらを使う
+    facets = None
+    if os.path.exists(gen.DB_PATH):
+        with db.snapshot(gen.DB_PATH) as conn:
+            facets = gen.get_facet_counts(conn)
+    facets = facets or gen.facet_counts_from(works_data)
+    gen.render_index(works_data, facets)
+    print(f"✅ トップページ生成")
+
+    author_counts = gen.count_authors(works_data)
+    gen.render_author_directory(author_counts)
+    print(f"✅ 著者ディレクトリ生成")
+
+    gen.render_facet_pages(facets)
+    print(f"✅ 年代別・ジャンル別ページ生成")
+
+    if gen.EMIT_API:
+        pages = gen.generate_api_lists(works_data, facets)
+        print(f"✅ JSON API 生成 ({gen.API_DIR}/, 一覧 {pages}ページ)")
+
+    count = gen.generate_suggest_index(works_data, author_counts)
+    print(f"✅ サジェスト索引生成 ({count}件)")
+
+    changed = gen.generate_service_worker()
+    print(f"✅ サービスワーカー生成 ({'precache 更新' if changed else 'precache 変更なし'})")
+
+    print(f"\n✨ マージ完了: {len(works_data)}作品 ({num_shards}シャード)")
+    gen.report_output_size()
+    gen.save_output_hashes()
+    # 取り込んだ差分は保存済みなので、次のマージで古い記録を重ねないように消す
+    for path in hashes_paths:
+        if os.path.exists(path):
+            os.remove(path)
+    return True
+
+
+def run_local(num_shards, fragment_dir=FRAGMENT_DIR):
+    """同一マシン上でシャードごとにプロセスを起動し、最後にマージする"""
+    if not os.path.exists(gen.DB_PATH):
+        print(f"❌ {gen.DB_PATH} が見つかりません")
+        return False
+
+    # シャードは読み取り専用で動くので、正規化キーの更新は起動前に1回だけ行う
+    gen.suggest_index.update_keys(gen.DB_PATH)
+
+    # プロセスごとに DB を開くと読む時点がずれるので、1時点のコピーを全シャードとマージに配る
+    os.makedirs(fragment_dir, exist_ok=True)
+    frozen = os.path.join(fragment_dir, "snapshot.db")
+    if os.path.exists(frozen):
+        os.remove(frozen)
+    db.freeze(gen.DB_PATH, frozen)
+
+    try:
+        script = os.path.abspath(__file__)
+        procs = [
+            subprocess.Popen([
+                sys.executable, script, "render",
+                "--shard", str(i), "--shards", str(num_shards),
+                "--fragments", fragment_dir, "--db", frozen
+            ])
+            for i in range(num_shards)
+        ]
+        failed = [i for i, p in enumerate(procs) if p.wait() != 0]
+        if failed:
+            print(f"❌ 失敗したシャード: {failed}")
+            return False
+
+        db_path, gen.DB_PATH = gen.DB_PATH, frozen
+        try:
+            ok = merge_fragments(num_shards, fragment_dir)
+        finally:
+            gen.DB_PATH = db_path
+        if ok:
+            # 全体ビルドなので、固めた時点までの変更履歴を処理済みにする
+            with db.snapshot(frozen) as conn:
+                latest = gen.change_log.latest_change_id(conn)
+            if latest is not None:
+                gen.change_log.set_high_water_mark(gen.DB_PATH, gen.build_target(), latest)
+                gen.change_log.compact(gen.DB_PATH)
+        return ok
+    finally:
+        os.remove(frozen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="シャード分割ビルド")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_render = sub.add_parser("render", help="1シャード分の作品ページとフラグメントを生成")
+    p_render.add_argument("--shard", type=int, required=True)
+    p_render.add_argument("--shards", type=int, required=True)
+
+    p_merge = sub.add_parser("merge", help="フラグメントから索引ページを生成")
+    p_merge.add_argument("--shards", type=int, required=True)
+
+    p_run = sub.add_parser("run", help="ローカルで全シャードを並列実行してマージ")
+    p_run.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+
+    for p in (p_render, p_merge, p_run):
+        p.add_argument("--fragments", default=FRAGMENT_DIR, help="フラグメントの出力先")
+    for p in (p_render, p_merge):
+        p.add_argument("--db", default=gen.DB_PATH, help="読み込む DB（run が配るスナップショットなど）")
+
+    args = parser.parse_args()
+    if args.command != "run":
+        gen.DB_PATH = args.db
+    if args.shards < 1:
+        parser.error("--shards は1以上を指定してください")
+
+    if args.command == "render":
+        if not 0 <= args.shard < args.shards:
+            parser.error("--shard は 0 以上 --shards 未満を指定してください")
+        ok = render_shard(args.shard, args.shards, args.fragments)
+    elif args.command == "merge":
+        ok = merge_fragments(args.shards, args.fragments)
+    else:
+        ok = run_local(args.shards, args.fragments)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+# ============================================================
+# site_pack.py - 生成サイトを1ファイルにまとめるアーカイブ（.pack）
+# ============================================================
+#
+# 使い方:
+#   python generator_v2.py --pack                        # aozora_summaries.pack に直接ビルド
+#   python site_pack.py pack aozora_summaries site.pack  # 既存の出力ディレクトリをまとめる
+#   python site_pack.py info aozora_summaries.pack       # 件数・サイズ・圧縮率
+#   python site_pack.py serve aozora_summaries.pack      # http://127.0.0.1:8000/ で配信
+#   python site_pack.py extract aozora_summaries.pack out_dir [--gzip-sidecars]
+#
+# 作品ごとに1ファイルを書くと、数百万作品では inode・rsync・ディレクトリ走査が重くなる。
+# .pack はページ本体を先頭から順に連結し、最後にパス名と位置の表を置くだけの形式なので、
+# ビルドもデプロイも1ファイルの先頭からの書き込み1回で済む。
+#
+#   [本体 ...][パス名の連結][エントリ表（パス順・固定長）][末尾情報]
+#
+# 読み出し側はファイルを mmap し、エントリ表を二分探索して本体のスライスを返す。
+# 表を辞書に読み込まないので開くのは一瞬で、件数が増えても1回の検索は O(log n)。
+# HTML / JSON / JS は gzip で保存し、配信時は gzip を受け付けるクライアントにそのまま
+# （sendfile でコピーなしに）返す。展開すると同じ内容の .gz を置く静的配信と同じになる。
+# 書き込みは一時ファイルに行い、最後に置き換えるので、配信中のサーバーは古い版を読み続けられる。
+
+import argparse
+import gzip
+import mimetypes
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+PACK_PATH = "aozora_summaries.pack"
+MAGIC = b"LLPACK01"
+# name_offset, name_length, data_offset, data_length, raw_length, crc32, flags
+_ENTRY = struct.Struct("<QIQIIIB3x")
+# table_offset, names_offset, count, magic
+_TRAILER = struct.Struct("<QQI4x8s")
+
+FLAG_GZIP = 0x01
+# 圧縮して保存する拡張子と、圧縮しない小さいファイルの上限
+COMPRESS_EXTENSIONS = (".html", ".json", ".js", ".css", ".txt", ".xml")
+COMPRESS_MIN_SIZE = 256
+GZIP_LEVEL = 6
+
+PackEntry = namedtuple("PackEntry", "path offset length raw_length crc32 flags")
+
+
+def _compressible(relpath, data):
+    return relpath.endswith(COMPRESS_EXTENSIONS) and len(data) >= COMPRESS_MIN_SIZE
+
+
+# ============================================================
+# 書き込み
+# ============================================================
+
+class PackWriter:
+    """ページを順に追記し、close() でエントリ表を書いて path を置き換える
+
+    base に前回のアーカイブを渡すと、中身が同じページは圧縮し直さずに前回の本体を写す。
+    inherit=True なら、今回 add() も remove() もしなかったページも前回から引き継ぐ（差分ビルド用）。
+    """
+
+    def __init__(self, path, base=None, compress=True, inherit=False):
+        self.path = path
+        self.compress = compress
+        self.inherit = inherit
+        self.base = PackReader(base) if base and os.path.exists(base) else None
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "w+b")
+        self._entries = {}
+        self._removed = set()
+        self._offset = 0
+        self.reused = 0
+
+    def _append(self, relpath, stored, raw_length, crc32, flags):
+        self._file.write(stored)
+        self._entries[relpath] = PackEntry(relpath, self._offset, len(stored), raw_length, crc32, flags)
+        self._offset += len(stored)
+
+    def add(self, relpath, data):
+        """ページを追加し、前回のアーカイブと同じ内容だったかを返す（同じパスは後から追加した方が残る）"""
+        crc32 = zlib.crc32(data)
+        self._removed.discard(relpath)
+        if self.base is not None:
+            old = self.base.find(relpath)
+            # 展開は圧縮よりずっと速いので、CRC が合ったものは中身まで比べてから写す
+            if old is not None and old.raw_length == len(data) and old.crc32 == crc32 \
+                    and (self.base.decode(old) if old.flags else self.base.raw(old)) == data:
+                self._append(relpath, self.base.raw(old), old.raw_length, crc32, old.flags)
+                self.reused += 1
+                return True
+        if self.compress and _compressible(relpath, data):
+            # mtime=0 で同じ内容からは同じバイト列になるようにする
+            packed = gzip.compress(data, GZIP_LEVEL, mtime=0)
+            if len(packed) < len(data):
+                self._append(relpath, packed, len(data), crc32, FLAG_GZIP)
+                return False
+        self._append(relpath, data, len(data), crc32, 0)
+        return False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def remove(self, relpath):
+        """引き継ぎ対象からも外す。消えたページがあれば True"""
+        existed = relpath in self._entries or (
+            self.inherit and self.base is not None and self.base.find(relpath) is not None)
+        self._entries.pop(relpath, None)
+        self._removed.add(relpath)
+        return existed
+
+    def read(self, relpath):
+        """このアーカイブに書いた（または引き継ぐ）ページを展開して返す。なければ None"""
+        entry = self._entries.get(relpath)
+        if entry is not None:
+            self._file.flush()
+            stored = os.pread(self._file.fileno(), entry.length, entry.offset)
+            return gzip.decompress(stored) if entry.flags & FLAG_GZIP else stored
+        if self.inherit and self.base is not None and relpath not in self._removed:
+            return self.base.read(relpath)
+        return None
+
+    def close(self):
+        """エントリ表と末尾情報を書き、path を置き換えてエントリ数を返す"""
+        if self.inherit and self.base is not None:
+            for old in self.base:
+                if old.path not in self._entries and old.path not in self._removed:
+                    self._append(old.path, self.base.raw(old), old.raw_length, old.crc32, old.flags)
+                    self.reused += 1
+
+        entries = sorted(self._entries.values(), key=lambda e: e.path.encode("utf-8"))
+        names_offset = self._offset
+        table = bytearray()
+        name_offset = 0
+        for entry in entries:
+            name = entry.path.encode("utf-8")
+            self._file.write(name)
+            table += _ENTRY.pack(name_offset, len(name), entry.offset, entry.length,
+                                 entry.raw_length, entry.crc32, entry.flags)
+            name_offset += len(name)
+        table_offset = names_offset + name_offset
+        self._file.write(table)
+        self._file.write(_TRAILER.pack(table_offset, names_offset, len(entries), MAGIC))
+        self._file.close()
+        if self.base is not None:
+            self.base.close()
+        os.replace(self._tmp_path, self.path)
+        return len(entries)
+
+    def abort(self):
+        self._file.close()
+        if self.base is not None:
+            self.base.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+# ============================================================
+# 読み出し
+# ============================================================
+
+class PackReader:
+    """mmap したアーカイブからページを引く。raw() は mmap のスライス（コピーなし）を返す"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self.stat = os.fstat(self._file.fileno())
+        if self.stat.st_size < _TRAILER.size:
+            self._file.close()
+            raise ValueError(f"{path} は .pack ではありません")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        self.table_offset, self.names_offset, self.count, magic = _TRAILER.unpack_from(
+            self._mm, self.stat.st_size - _TRAILER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} は .pack ではありません")
+        # 配信中のリクエスト数。置き換えられた版は最後のリクエストが終わったときに閉じる
+        self._lock = threading.Lock()
+        self._refs = 0
+        self._retired = False
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def _entry(self, i):
+        name_offset, name_length, *rest = _ENTRY.unpack_from(self._mm, self.table_offset + i * _ENTRY.size)
+        start = self.names_offset + name_offset
+        return self._mm[start:start + name_length], rest
+
+    def entry(self, i):
+        name, rest = self._entry(i)
+        return PackEntry(name.decode("utf-8"), *rest)
+
+    def find(self, relpath):
+        """エントリ表を二分探索する。なければ None"""
+        key = relpath.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name, rest = self._entry(mid)
+            if name < key:
+                lo = mid + 1
+            elif name > key:
+                hi = mid
+            else:
+                return PackEntry(relpath, *rest)
+        return None
+
+    def raw(self, entry):
+        """保存されているバイト列（gzip のこともある）を mmap のスライスで返す"""
+        return self._view[entry.offset:entry.offset + entry.length]
+
+    def read(self, relpath):
+        entry = self.find(relpath)
+        if entry is None:
+            return None
+        return self.decode(entry)
+
+    def decode(self, entry):
+        data = self.raw(entry)
+        return gzip.decompress(data) if entry.flags & FLAG_GZIP else bytes(data)
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.entry(i)
+
+    def __len__(self):
+        return self.count
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            done = self._retired and self._refs == 0
+        if done:
+            self.close()
+
+    def retire(self):
+        """新しい版に置き換えられた。読み中のリクエストがなければすぐ、あれば最後の release() で閉じる"""
+        with self._lock:
+            self._retired = True
+            done = self._refs == 0
+        if done:
+            self.close()
+
+    def close(self):
+        self._view.release()
+        self._mm.close()
+        self._file.close()
+
+
+# ============================================================
+# まとめる・展開する
+# ============================================================
+
+def pack_directory(src_dir, pack_path, compress=True):
+    """出力ディレクトリをそのままアーカイブにまとめ、件数を返す"""
+    with PackWriter(pack_path, compress=compress) as writer:
+        for root, dirs, files in os.walk(src_dir):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                relpath = os.path.relpath(path, src_dir).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    writer.add(relpath, f.read())
+        count = len(writer)
+    return count
+
+
+def extract(pack_path, dest_dir, gzip_sidecars=False):
+    """アーカイブを dest_dir に展開し、件数を返す。gzip_sidecars なら圧縮済みの本体も .gz として置く"""
+    reader = PackReader(pack_path)
+    count = 0
+    try:
+        for entry in reader:
+            path = os.path.join(dest_dir, *entry.path.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 非圧縮のページは mmap のスライスをそのまま書く
+            data = reader.decode(entry) if entry.flags & FLAG_GZIP else reader.raw(entry)
+            if zlib.crc32(data) != entry.crc32:
+                raise ValueError(f"{entry.path} の CRC が一致しません")
+            with open(path, "wb") as f:
+                f.write(data)
+            if gzip_sidecars and entry.flags & FLAG_GZIP:
+                with open(path + ".gz", "wb") as f:
+                    f.write(reader.raw(entry))
+            count += 1
+    finally:
+        reader.close()
+    return count
+
+
+def print_info(pack_path):
+    reader = PackReader(pack_path)
+    stored = raw = compressed = 0
+    by_ext = {}
+    for entry in reader:
+        stored += entry.length
+        raw += entry.raw_length
+        compressed += bool(entry.flags & FLAG_GZIP)
+        ext = os.path.splitext(entry.path)[1] or "(なし)"
+        by_ext[ext] = by_ext.get(ext, 0) + 1
+    reader.close()
+    print(f"📦 {pack_path}: {len(reader):,}件 / {os.path.getsize(pack_path) / 1024:.1f} KB")
+    print(f"   本体 {raw / 1024:.1f} KB → {stored / 1024:.1f} KB (gzip {compressed:,}件)")
+    print("   " + ", ".join(f"{ext} {n:,}" for ext, n in sorted(by_ext.items())))
+
+
+# ============================================================
+# 配信
+# ============================================================
+
+def _accepts_gzip(accept_encoding):
+    """Accept-Encoding を q 値つきで解釈し、gzip のまま返してよいかを返す（gzip;q=0 は拒否）"""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    if "gzip" in qualities:
+        return qualities["gzip"] > 0
+    return qualities.get("*", 0) > 0
+
+
+def _content_type(relpath):
+    content_type = mimetypes.guess_type(relpath)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type in ("application/json", "application/javascript"):
+        content_type += "; charset=utf-8"
+    return content_type
+
+
+class PackRequestHandler(BaseHTTPRequestHandler):
+    server_version = "LitLitePack/1.0"
+    # ヘッダーと本体（sendfile）を別々に送るので、Nagle で本体が待たされないようにする
+    disable_nagle_algorithm = True
+    reader = None
+    _reader_lock = threading.Lock()
+
+    @classmethod
+    def acquire_reader(cls):
+        """配信に使う版を参照カウントつきで返す（使い終わったら release() する）
+
+        アーカイブが置き換えられていたら開き直す。古い版を読み中のリクエストはそのまま終わり、
+        最後のリクエストが release() したときに古い版の mmap とファイルを閉じる。
+        """
+        st = os.stat(cls.reader.path)
+        with cls._reader_lock:
+            reader = cls.reader
+            if (st.st_ino, st.st_mtime_ns) != (reader.stat.st_ino, reader.stat.st_mtime_ns):
+                cls.reader = PackReader(reader.path)
+                reader.retire()
+                reader = cls.reader
+            return reader.acquire()
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        path = unquote(urlsplit(self.path).path).lstrip("/")
+        if path == "" or path.endswith("/"):
+            path += "index.html"
+        reader = self.acquire_reader()
+        try:
+            self._send(reader, path, head)
+        finally:
+            reader.release()
+
+    def _send(self, reader, path, head):
+        entry = reader.find(path)
+        if entry is None:
+            self.send_error(404)
+            return
+
+        etag = f'"{entry.crc32:08x}-{entry.raw_length:x}"'
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        gzipped = bool(entry.flags & FLAG_GZIP)
+        send_raw = not gzipped or _accepts_gzip(self.headers.get("Accept-Encoding", ""))
+        body = None if send_raw else reader.decode(entry)
+        self.send_response(200)
+        self.send_header("Content-Type", _content_type(path))
+        self.send_header("Content-Length", str(entry.length if send_raw else len(body)))
+        self.send_header("ETag", etag)
+        if gzipped:
+            self.send_header("Vary", "Accept-Encoding")
+            if send_raw:
+                self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        if head:
+            return
+        if not send_raw:
+            self.wfile.write(body)
+        elif hasattr(os, "sendfile"):
+            # 本体はユーザー空間にコピーせず、カーネルにファイルから直接送らせる
+            # （位置を明示するのでスレッド間でファイル位置を共有しても問題ない）
+            offset, remaining = entry.offset, entry.length
+            while remaining:
+                sent = os.sendfile(self.connection.fileno(), reader.fileno(), offset, remaining)
+                if not sent:
+                    break
+                offset += sent
+                remaining -= sent
+        else:
+            self.wfile.write(reader.raw(entry))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(pack_path, host="127.0.0.1", port=8000):
+    PackRequestHandler.reader = PackReader(pack_path)
+    server = ThreadingHTTPServer((host, port), PackRequestHandler)
+    print(f"🌐 http://{host}:{port}/ ({pack_path}, {len(PackRequestHandler.reader):,}件)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 停止しました")
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成サイトのアーカイブ（.pack）の作成・確認・配信・展開")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_pack = sub.add_parser("pack", help="出力ディレクトリをアーカイブにまとめる")
+    p_pack.add_argument("src")
+    p_pack.add_argument("pack", nargs="?", default=PACK_PATH)
+    p_pack.add_argument("--no-compress", action="store_true", help="gzip で保存しない")
+    p_info = sub.add_parser("info", help="件数・サイズを表示")
+    p_info.add_argument("pack", nargs="?", default=PACK_PATH)
+    p_serve = sub.add_parser("serve", help="アーカイブから直接配信する")
+    p_serve.add_argument("pack", nargs="?", default=PACK_PATH)
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8000)
+    p_extract = sub.add_parser("extract", help="ディレクトリに展開する")
+    p_extract.add_argument("pack")
+    p_extract.add_argument("dest")
+    p_extract.add_argument("--gzip-sidecars", action="store_true", help="圧縮済みのページを .gz としても置く")
+    args = parser.parse_args()
+
+    if args.command != "pack" and not os.path.exists(args.pack):
+        print(f"❌ {args.pack} が見つかりません")
+        return
+    started = time.perf_counter()
+    if args.command == "pack":
+        count = pack_directory(args.src, args.pack, compress=not args.no_compress)
+        print(f"✅ {count:,}件を {args.pack} にまとめました ({time.perf_counter() - started:.1f}秒)")
+        print_info(args.pack)
+    elif args.command == "info":
+        print_info(args.pack)
+    elif args.command == "serve":
+        serve(args.pack, args.host, args.port)
+    else:
+        count = extract(args.pack, args.dest, args.gzip_sidecars)
+        print(f"✅ {count:,}件を {args.dest} に展開しました ({time.perf_counter() - started:.1f}秒)")
+
+
+if __name__ == "__main__":
+    main()
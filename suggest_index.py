@@ -0,0 +1,173 @@
+# ============================================================
+# suggest_index.py - 作品名・著者名の前方一致サジェスト索引
+# ============================================================
+#
+# 使い方:
+#   python suggest_index.py update-keys     # DB の正規化キー列を更新
+#   python suggest_index.py lookup なつめ    # DB 上で前方一致検索
+#
+# 作品名・著者名を NFKC 正規化 + 小文字化 + カタカナ→ひらがな で畳み込んだキーで
+# ソートし、一定件数ごとのチャンク（suggest/0000.<中身のハッシュ>.json ...）に分けて出力する。
+# ブラウザは先頭キーの一覧（suggest/manifest.json）を二分探索して、入力中の
+# 接頭辞を含むチャンクだけを取得するので、1打鍵あたりの転送量はチャンク1〜2個で頭打ちになる。
+# チャンクの名前は manifest.json の files に載せる。中身が変われば名前も変わるので、
+# サービスワーカーが先読みした古い manifest.json でも、それと同じ版のチャンクを引ける。
+# 同じキーを DB の title_key / author_key 列にも保存し、索引付きの範囲検索に使う。
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import unicodedata
+
+import migrate_database
+
+DB_PATH = "summaries.db"
+SUGGEST_DIR = "suggest"
+MANIFEST_PATH = f"{SUGGEST_DIR}/manifest.json"
+# 1チャンクあたりの最大件数
+CHUNK_SIZE = 200
+# UPDATE をまとめてコミットする件数
+BATCH_SIZE = 1000
+
+_KATAKANA = ''.join(chr(c) for c in range(0x30A1, 0x30F7)) + 'ヽヾ'
+_HIRAGANA = ''.join(chr(c - 0x60) for c in range(0x30A1, 0x30F7)) + 'ゝゞ'
+_KANA_FOLD = str.maketrans(_KATAKANA, _HIRAGANA)
+
+
+def normalize_key(text):
+    """NFKC 正規化・小文字化・カタカナ→ひらがな・空白除去したキーを返す
+
+    ページ内スクリプトの foldKey() と同じ規則にそろえること。
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return ''.join(text.translate(_KANA_FOLD).split())
+
+
+# ============================================================
+# 静的サジェスト索引
+# ============================================================
+
+def build_entries(works_data, author_counts, author_filename):
+    """作品・著者からサジェスト候補 [キー, 表示名, 補足, リンク] を作る"""
+    entries = []
+    for work in works_data:
+        entries.append([normalize_key(work['title']), work['title'], work['author'], work['filename']])
+    for author, count in author_counts:
+        entries.append([normalize_key(author), author, f"{count}作品", author_filename(author)])
+    entries = [e for e in entries if e[0]]
+    entries.sort()
+    return entries
+
+
+def build_chunks(entries, chunk_size=CHUNK_SIZE):
+    """{出力パス: JSON文字列} を返す。manifest.json には各チャンクの先頭キーとファイル名を並べる"""
+    files = {}
+    first_keys = []
+    names = []
+    for i, start in enumerate(range(0, len(entries), chunk_size)):
+        chunk = entries[start:start + chunk_size]
+        text = json.dumps(chunk, ensure_ascii=False, separators=(',', ':'))
+        name = f"{SUGGEST_DIR}/{i:04d}.{hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]}.json"
+        first_keys.append(chunk[0][0])
+        names.append(name)
+        files[name] = text
+    manifest = {'version': 2, 'chunk_size': chunk_size, 'count': len(entries), 'chunks': first_keys,
+                'files': names}
+    # manifest.json はチャンクより後に書く（書き込み途中に読まれても、載っているチャンクはもうある）
+    files[MANIFEST_PATH] = json.dumps(manifest, ensure_ascii=False, separators=(',', ':'))
+    return files
+
+
+def chunk_files(manifest_text):
+    """manifest.json（文字列・バイト列）に載っているチャンクのパスを返す"""
+    try:
+        manifest = json.loads(manifest_text)
+    except (TypeError, ValueError):
+        return set()
+    if 'files' in manifest:
+        return set(manifest['files'])
+    # 名前にハッシュを付ける前の版（suggest/0000.json ...）
+    return {f"{SUGGEST_DIR}/{i:04d}.json" for i in range(len(manifest.get('chunks', [])))}
+
+
+# ============================================================
+# DB の正規化キー
+# ============================================================
+
+def update_keys(db_path=DB_PATH, ids=None):
+    """title_key / author_key が古い行だけをバッチで更新し、更新件数を返す
+
+    ids を渡すとその作品だけを読む（差分ビルドでは change_log に載った作品だけで済む）。
+    """
+    conn = sqlite3.connect(db_path)
+    migrate_database.apply_migrations(conn)
+    if ids is None:
+        rows = conn.execute("SELECT id, title, author, title_key, author_key FROM summaries").fetchall()
+    else:
+        ids = sorted(ids)
+        rows = []
+        # SQLite のパラメータ数の上限（既定 999）を超えないように分けて読む
+        for start in range(0, len(ids), 900):
+            chunk = ids[start:start + 900]
+            rows.extend(conn.execute(
+                f"SELECT id, title, author, title_key, author_key FROM summaries"
+                f" WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+    pending = []
+    updated = 0
+    for summary_id, title, author, title_key, author_key in rows:
+        keys = (normalize_key(title), normalize_key(author))
+        if keys != (title_key, author_key):
+            pending.append(keys + (summary_id,))
+        if len(pending) >= BATCH_SIZE:
+            with conn:
+                conn.executemany("UPDATE summaries SET title_key = ?, author_key = ? WHERE id = ?", pending)
+            updated += len(pending)
+            pending = []
+    if pending:
+        with conn:
+            conn.executemany("UPDATE summaries SET title_key = ?, author_key = ? WHERE id = ?", pending)
+        updated += len(pending)
+    conn.close()
+    return updated
+
+
+def lookup(conn, prefix, limit=10):
+    """正規化キーの範囲検索で前方一致する作品を返す（idx_title_key / idx_author_key を使う）"""
+    key = normalize_key(prefix)
+    if not key:
+        return []
+    upper = key + '\U0010ffff'
+    cur = conn.execute("""
+        SELECT id, title, author FROM summaries WHERE title_key >= ? AND title_key < ?
+        UNION
+        SELECT id, title, author FROM summaries WHERE author_key >= ? AND author_key < ?
+        ORDER BY title
+        LIMIT ?
+    """, (key, upper, key, upper, limit))
+    return cur.fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="サジェスト索引・正規化キーの管理")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("update-keys", help="DB の title_key / author_key を更新")
+    p_lookup = sub.add_parser("lookup", help="正規化キーで前方一致検索")
+    p_lookup.add_argument("prefix")
+    p_lookup.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "update-keys":
+        print(f"✅ 正規化キーを更新: {update_keys()}件")
+    else:
+        conn = sqlite3.connect(DB_PATH)
+        rows = lookup(conn, args.prefix, args.limit)
+        conn.close()
+        if not rows:
+            print("該当なし")
+        for summary_id, title, author in rows:
+            print(f"{summary_id}\t{title}\t{author}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# ============================================================
+# summary_codec.py - summary 列の透過圧縮
+# ============================================================
+#
+# 使い方:
+#   python summary_codec.py compress              # zlib で既存行を圧縮
+#   python summary_codec.py compress --zstd       # zstd + 学習済み辞書で圧縮（zstandard が必要）
+#   python summary_codec.py decompress            # 平文に戻す
+#   python summary_codec.py stats                 # 圧縮状況を表示
+#
+# 圧縮した要約は summary 列に BLOB として保存する（TEXT のままの行は平文）。
+# 先頭1バイトで形式を区別する:
+#   0x01 + zlib ストリーム
+#   0x02 + 辞書ID (4バイト, big-endian) + zstd フレーム
+# 平文と圧縮行は混在できるので、新規行は今まで通り TEXT で INSERT してよい。
+# 圧縮を有効にした DB では、aozora_ingest.py が取り込みのたびに平文の行を同じ形式で圧縮する
+# （compress_new_rows）。圧縮形式だけの書き換えは change_log に記録しないので、差分ビルドは作り直さない。
+# 生成側は decode_summary() / decode_summary_prefix() で読むので、
+# 要約の先頭だけを使う索引ページでは全文を展開しない。
+
+import argparse
+import os
+import sqlite3
+import struct
+import zlib
+
+import migrate_database
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DB_PATH = "summaries.db"
+
+ZLIB = 0x01
+ZSTD = 0x02
+
+BATCH_SIZE = 500
+# 圧縮を有効にした形式（"zlib" / "zstd"）を覚えておく build_state のキー
+CODEC_KEY = "summary_codec"
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 10
+# zstd 辞書の大きさと学習に使う行数
+ZSTD_DICT_SIZE = 64 * 1024
+ZSTD_TRAIN_SAMPLES = 5000
+
+# 辞書ID -> zstandard.ZstdCompressionDict
+_dictionaries = {}
+
+
+def load_dictionaries(conn):
+    """DB の zstd 辞書を読み込む（圧縮行を展開する前に1回呼ぶ）"""
+    if zstandard is None:
+        return
+    try:
+        rows = conn.execute("SELECT id, data FROM compression_dicts WHERE algo = 'zstd'").fetchall()
+    except sqlite3.Error:
+        return
+    for dict_id, data in rows:
+        if dict_id not in _dictionaries:
+            _dictionaries[dict_id] = zstandard.ZstdCompressionDict(data)
+
+
+def _zstd_dictionary(dict_id):
+    if zstandard is None:
+        raise RuntimeError("zstd で圧縮された要約を読むには zstandard が必要です")
+    try:
+        return _dictionaries[dict_id]
+    except KeyError:
+        raise RuntimeError(f"zstd 辞書 {dict_id} が読み込まれていません") from None
+
+
+# ============================================================
+# エンコード・デコード
+# ============================================================
+
+def encode_summary(text, algo="zlib", dict_id=None):
+    """要約を圧縮した BLOB を返す。縮まない場合は平文のまま返す"""
+    raw = text.encode("utf-8")
+    if algo == "zstd":
+        dictionary = _zstd_dictionary(dict_id)
+        body = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary).compress(raw)
+        blob = bytes([ZSTD]) + struct.pack(">I", dict_id) + body
+    else:
+        blob = bytes([ZLIB]) + zlib.compress(raw, ZLIB_LEVEL)
+    return blob if len(blob) < len(raw) else text
+
+
+def decode_summary(value):
+    """summary 列の値（平文 or 圧縮 BLOB）を文字列に戻す"""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if not value:
+        return ''
+    if value[0] == ZLIB:
+        return zlib.decompress(value[1:]).decode("utf-8")
+    if value[0] == ZSTD:
+        dict_id, = struct.unpack(">I", value[1:5])
+        decompressor = zstandard.ZstdDecompressor(dict_data=_zstd_dictionary(dict_id))
+        return decompressor.decompress(value[5:]).decode("utf-8")
+    raise ValueError(f"不明な圧縮形式: {value[0]:#x}")
+
+
+def decode_summary_prefix(value, n_chars):
+    """先頭 n_chars 文字だけを展開して返す（抜粋用）"""
+    if value is None or isinstance(value, str):
+        return value[:n_chars] if value else value
+    value = bytes(value)
+    if not value:
+        return ''
+    # UTF-8 は1文字最大4バイトなので、それだけ展開すれば足りる
+    max_bytes = n_chars * 4
+    if value[0] == ZLIB:
+        raw = zlib.decompressobj().decompress(value[1:], max_bytes)
+    elif value[0] == ZSTD:
+        dict_id, = struct.unpack(">I", value[1:5])
+        decompressor = zstandard.ZstdDecompressor(dict_data=_zstd_dictionary(dict_id))
+        with decompressor.stream_reader(value[5:]) as reader:
+            raw = reader.read(max_bytes)
+    else:
+        raise ValueError(f"不明な圧縮形式: {value[0]:#x}")
+    return raw.decode("utf-8", "ignore")[:n_chars]
+
+
+def register_functions(conn):
+    """SQL から summary_text(summary) で平文を取り出せるようにする"""
+    load_dictionaries(conn)
+    conn.create_function("summary_text", 1, decode_summary, deterministic=True)
+
+
+# ============================================================
+# 既存行の移行
+# ============================================================
+
+def train_dictionary(conn):
+    """既存の要約から zstd 辞書を学習して保存し、辞書IDを返す"""
+    samples = [
+        decode_summary(row[0]).encode("utf-8")
+        for row in conn.execute("SELECT summary FROM summaries ORDER BY random() LIMIT ?", (ZSTD_TRAIN_SAMPLES,))
+    ]
+    if len(samples) < 10:
+        raise RuntimeError("辞書の学習には10件以上の要約が必要です")
+    dictionary = zstandard.train_dictionary(ZSTD_DICT_SIZE, samples)
+    with conn:
+        cur = conn.execute("INSERT INTO compression_dicts (algo, data) VALUES ('zstd', ?)",
+                           (dictionary.as_bytes(),))
+    dict_id = cur.lastrowid
+    _dictionaries[dict_id] = dictionary
+    return dict_id
+
+
+def _rewrite_rows(conn, transform, where):
+    """id 順にバッチで読み、transform の結果で summary を更新する。更新件数を返す"""
+    last_id = 0
+    updated = 0
+    while True:
+        rows = conn.execute(
+            f"SELECT id, summary FROM summaries WHERE id > ? AND {where} ORDER BY id LIMIT ?",
+            (last_id, BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        changes = []
+        for summary_id, summary in rows:
+            new_value = transform(summary)
+            if new_value != summary:
+                changes.append((new_value, summary_id))
+        # バッチごとにコミットするので、途中で止めても続きから再実行できる。
+        # 中身は変わらないので、同じトランザクションの間だけ change_log への記録を止める
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO build_state (key) VALUES (?)",
+                         (migrate_database.SUMMARY_REWRITE_KEY,))
+            conn.executemany("UPDATE summaries SET summary = ? WHERE id = ?", changes)
+            conn.execute("DELETE FROM build_state WHERE key = ?", (migrate_database.SUMMARY_REWRITE_KEY,))
+        updated += len(changes)
+        last_id = rows[-1][0]
+    return updated
+
+
+def compress_existing(db_path=DB_PATH, algo="zlib"):
+    conn = sqlite3.connect(db_path)
+    migrate_database.apply_migrations(conn)
+    load_dictionaries(conn)
+    dict_id = None
+    if algo == "zstd":
+        if zstandard is None:
+            conn.close()
+            raise RuntimeError("zstandard がインストールされていません (pip install zstandard)")
+        dict_id = train_dictionary(conn)
+        print(f"📖 zstd 辞書を学習しました (ID {dict_id})")
+        # 辞書を変えた場合に備え、zlib や旧辞書の行も再圧縮する
+        where = "1"
+        transform = lambda s: encode_summary(decode_summary(s), "zstd", dict_id)
+    else:
+        where = "typeof(summary) = 'text'"
+        transform = lambda s: encode_summary(s, "zlib")
+    updated = _rewrite_rows(conn, transform, where)
+    _set_codec(conn, algo)
+    conn.close()
+    return updated
+
+
+def _set_codec(conn, algo):
+    with conn:
+        if algo is None:
+            conn.execute("DELETE FROM build_state WHERE key = ?", (CODEC_KEY,))
+        else:
+            conn.execute("""
+                INSERT INTO build_state (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            """, (CODEC_KEY, algo))
+
+
+def compress_new_rows(conn):
+    """圧縮を有効にした DB なら、平文のまま入った行（新しく取り込んだ要約など）を同じ形式で圧縮し、件数を返す"""
+    try:
+        row = conn.execute("SELECT value FROM build_state WHERE key = ?", (CODEC_KEY,)).fetchone()
+    except sqlite3.Error:
+        return 0
+    if row is None:
+        return 0
+    algo = row[0]
+    dict_id = None
+    if algo == "zstd":
+        load_dictionaries(conn)
+        dict_id = conn.execute("SELECT MAX(id) FROM compression_dicts WHERE algo = 'zstd'").fetchone()[0]
+        if zstandard is None or dict_id is None:
+            # 辞書を使えない環境では zlib で圧縮する（読み出しはどちらの形式でもできる）
+            algo = "zlib"
+    return _rewrite_rows(conn, lambda s: encode_summary(s, algo, dict_id), "typeof(summary) = 'text'")
+
+
+def decompress_existing(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    migrate_database.apply_migrations(conn)
+    load_dictionaries(conn)
+    updated = _rewrite_rows(conn, decode_summary, "typeof(summary) = 'blob'")
+    _set_codec(conn, None)
+    conn.close()
+    return updated
+
+
+def print_stats(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    for kind, count, size in conn.execute(
+            "SELECT typeof(summary), COUNT(*), SUM(length(CAST(summary AS BLOB))) FROM summaries GROUP BY 1"):
+        label = "圧縮" if kind == "blob" else "平文"
+        print(f"   {label}: {count}件 / {size / 1024:.1f} KB")
+    conn.close()
+    print(f"   DBファイル: {os.path.getsize(db_path) / 1024:.1f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="summary 列の圧縮・展開")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_compress = sub.add_parser("compress", help="既存の要約を圧縮")
+    p_compress.add_argument("--zstd", action="store_true", help="zstd + 学習済み辞書を使う")
+    p_compress.add_argument("--vacuum", action="store_true", help="完了後に VACUUM してファイルを縮める")
+    p_decompress = sub.add_parser("decompress", help="圧縮された要約を平文に戻す")
+    p_decompress.add_argument("--vacuum", action="store_true")
+    sub.add_parser("stats", help="圧縮状況を表示")
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_PATH):
+        print(f"❌ {DB_PATH} が見つかりません")
+        return
+
+    if args.command == "stats":
+        print_stats()
+        return
+
+    print("📊 変更前")
+    print_stats()
+    if args.command == "compress":
+        updated = compress_existing(algo="zstd" if args.zstd else "zlib")
+    else:
+        updated = decompress_existing()
+    print(f"✅ {updated}件を更新しました")
+
+    if args.vacuum:
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("VACUUM")
+        conn.close()
+    print("📊 変更後")
+    print_stats()
+
+
+if __name__ == "__main__":
+    main()